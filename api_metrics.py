@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# ==========================================
+# API 監控指標 (Prometheus 文字格式，不需要額外套件)
+# - 計數 / 直方圖都只是記憶體內的加法，一次記錄約 1 µs，全速收料時也能常開
+# - 量測值 (佇列長度、最後上傳時間…) 在 /metrics 被抓取時才計算
+# - 多 worker 共用同一個埠，抓到哪個 worker 是隨機的：呼叫 share(目錄) 後每個 worker 定期把
+#   計數 / 直方圖 / 時間戳寫成 {pid}.json，/metrics 回傳所有 worker 的加總 (其他 worker 最多落後 METRICS_DUMP_S)
+# - 已結束 worker 的檔案保留 (計數不能倒退)；整個服務重新啟動時由 clear_shared() 清掉
+# ==========================================
+METRICS_DIR = "metrics_shared"
+METRICS_DUMP_S = 5.0
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(val):
+    return str(val).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def _num(val):
+    return repr(float(val)) if val == val else "NaN"
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def clear_shared(directory=METRICS_DIR):
+    """服務啟動前 (還沒有 worker 時) 清掉上一次執行留下的各 worker 檔案"""
+    if not os.path.isdir(directory): return
+    for name in os.listdir(directory):
+        if name.endswith(".json"): os.remove(os.path.join(directory, name))
+
+def _key(name, labels):
+    return (name, tuple(tuple(pair) for pair in labels))
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}          # 名稱 -> (種類, 說明)
+        self._counters = {}      # (名稱, 標籤) -> 數值
+        self._hists = {}         # (名稱, 標籤) -> Histogram
+        self._stamps = {}        # (名稱, 標籤) -> 最後發生時間 (time.time())，跨 worker 取最大
+        self._gauges = {}        # 名稱 -> 函式，回傳 [(標籤, 數值)]
+        self._shared = None      # 多 worker 共用的目錄
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, buckets)
+
+    def gauge(self, name, help_text, fn, kind="gauge"):
+        """fn() 回傳 [(標籤 tuple, 數值)]，抓取時才呼叫 (別處自己累計的數字用 kind="counter")"""
+        self._meta[name] = (kind, help_text)
+        self._gauges[name] = fn
+
+    # ------------------------------------------
+    # 記錄 (標籤用 (("line", "Line 1"), ...) 這種 tuple，順序固定)
+    # ------------------------------------------
+    def inc(self, name, labels=(), n=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = Histogram(self._meta[name][2])
+            hist.observe(value)
+
+    def stamp(self, name, labels=(), ts=None):
+        """記下事件最後發生的時間 (例如各產線最後一次上傳)，用 stamps() 讀回"""
+        with self._lock:
+            self._stamps[(name, labels)] = time.time() if ts is None else ts
+
+    def stamps(self, name):
+        """[(標籤, 時間)]，多 worker 時取各 worker 中最新的一次"""
+        latest = {}
+        for (key, labels), ts in self._collect()[2].items():
+            if key == name: latest[labels] = ts
+        return sorted(latest.items())
+
+    # ------------------------------------------
+    # 多 worker 共用
+    # ------------------------------------------
+    def share(self, directory=METRICS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self._shared = directory
+        self.dump()
+
+    def _snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {key: (list(h.counts), h.sum, h.count) for key, h in self._hists.items()}
+            stamps = dict(self._stamps)
+        return counters, hists, stamps
+
+    def dump(self):
+        """把本 worker 目前的數字寫到 {pid}.json (先寫暫存檔再換名，讀取端不會讀到一半)"""
+        if self._shared is None: return
+        counters, hists, stamps = self._snapshot()
+        data = {
+            "counters": [[name, labels, val] for (name, labels), val in counters.items()],
+            "hists": [[name, labels, *h] for (name, labels), h in hists.items()],
+            "stamps": [[name, labels, ts] for (name, labels), ts in stamps.items()],
+        }
+        path = os.path.join(self._shared, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _collect(self):
+        """本 worker 的即時數字 + 其他 worker 最近一次寫出的檔案"""
+        counters, hists, stamps = self._snapshot()
+        if self._shared is None: return counters, hists, stamps
+        mine = f"{os.getpid()}.json"
+        for fname in os.listdir(self._shared):
+            if not fname.endswith(".json") or fname == mine: continue
+            try:
+                with open(os.path.join(self._shared, fname), encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, val in data["counters"]:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + val
+            for name, labels, counts, total, count in data["hists"]:
+                key = _key(name, labels)
+                if key in hists:
+                    old = hists[key]
+                    hists[key] = ([a + b for a, b in zip(old[0], counts)], old[1] + total, old[2] + count)
+                else:
+                    hists[key] = (counts, total, count)
+            for name, labels, ts in data["stamps"]:
+                key = _key(name, labels)
+                stamps[key] = max(stamps.get(key, 0), ts)
+        return counters, hists, stamps
+
+    # ------------------------------------------
+    # 輸出
+    # ------------------------------------------
+    def render(self):
+        counters, hists, _ = self._collect()
+        by_name = {}
+        for (name, labels), val in counters.items():
+            by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_num(val)}")
+        for (name, labels), (counts, total, count) in hists.items():
+            lines = by_name.setdefault(name, [])
+            cum = 0
+            for bound, n in zip(self._meta[name][2], counts):
+                cum += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cum}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, fn in self._gauges.items():
+            try:
+                by_name[name] = [f"{name}{_labels(labels)} {_num(val)}" for labels, val in fn()]
+            except Exception as e:
+                print(f"⚠️ 指標 {name} 計算失敗: {e}")
+
+        out = []
+        for name, meta in self._meta.items():
+            out.append(f"# HELP {name} {meta[1]}")
+            out.append(f"# TYPE {name} {meta[0]}")
+            out.extend(by_name.get(name, ()))
+        return "\n".join(out) + "\n"
+
+class MetricsMiddleware:
+    """記錄每個路由的回應時間 (到送出回應標頭為止；SSE / 長輪詢即為等待到開始回應的時間)
+    路由用 FastAPI 的路徑樣板 (例如 /current_order/{line_name})，不會因產線名稱而產生大量序列"""
+
+    def __init__(self, app, metrics, name="factory_http_request_duration_seconds"):
+        self.app = app
+        self.metrics = metrics
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        state = {"status": 500, "elapsed": None}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["elapsed"] = time.perf_counter() - t0
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "<unmatched>")
+            elapsed = state["elapsed"] if state["elapsed"] is not None else time.perf_counter() - t0
+            self.metrics.observe(self.name, elapsed, (("route", path), ("method", scope["method"]), ("code", str(state["status"]))))
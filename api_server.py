@@ -0,0 +1,583 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import quote
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from api_metrics import Metrics, MetricsMiddleware, CONTENT_TYPE, METRICS_DIR, METRICS_DUMP_S, clear_shared
+from db_pool import get_pool
+from db_schema import init_db, trim_order_changes, SYNC_JOURNAL_TRIM_S
+from dispatch import DispatchCache, ORDER_DETAIL_SQL
+from kiosk_page import kiosk_html, kiosk_state_payload
+from log_rollup import ROLLUP_BATCH, ROLLUP_FLUSH_S, rollup_logs, rollup_backlog, rollup_watermark, query_rollups
+from log_journal import LogJournal, JOURNAL_DIR, JOURNAL_BATCH, JOURNAL_FLUSH_S
+from order_batch import OrderBatchError, add_orders, reorder_orders, cancel_orders
+from production_stats import line_summary
+from log_archive import ARCHIVE_CHECK_S, ARCHIVE_BATCH, archive_logs, iter_log_chunks
+from report_export import iter_logs_csv, iter_logs_parquet, parquet_available
+from leader_lock import LeaderLock, LEADER_RETRY_S
+from spc import SpcEngine, SPC_POLL_S, SPC_BATCH, SPC_WINDOW, read_spc_summary, read_spc_chart, read_rule_hits
+from scale_reader import ScaleRegistry, parse_scale_config, DEFAULT_BAUD
+from weight_stream import WeightBroadcaster, scale_payload
+from factory_core import SQL_DB_NAME, FILE_LOGS_PREFIX, PRODUCTION_LINES, API_PORT, count_passes
+
+# ==========================================
+# 產線收料 API (獨立服務)
+# 正式環境：python api_server.py --host 0.0.0.0 --port 8000 --workers 2
+# - 與 Streamlit 網頁分開執行，網頁重繪大表格時不會拖慢秤重上傳
+# - 多個 worker 共用同一個 SQLite (WAL)，寫入靠 BEGIN IMMEDIATE 排隊
+# - 背景維護 (CSV 流水帳、SPC、時段彙總、封存、修剪工單異動日誌) 只由拿到 leader 檔案鎖的那個 worker 執行
+# - /metrics 的計數在多 worker 時經由 metrics_shared/ 合併，抓到任何一個 worker 都是全體總數
+# - 收到 SIGINT / SIGTERM 時先停止收新連線，佇列內的讀數寫完、流水帳補齊才結束
+# ==========================================
+API_HOST = os.environ.get("FACTORY_API_HOST", "0.0.0.0")
+API_WORKERS = int(os.environ.get("FACTORY_API_WORKERS", "1"))
+GRACEFUL_SHUTDOWN_S = 10
+# 操作畫面 (/kiosk) 用的主機直連磅秤，格式同網頁端的 FACTORY_SCALES ("Line 1=COM3, Line 2=COM4@19200:sics")
+# 同一個序列埠只能由一個程序開啟：磅秤接在 API 主機就設這個，網頁端的 FACTORY_SCALES 留空
+# 讀數與 /ws/weight 推播都在開序列埠的那個程序內，所以設了這個就只能單一 worker (serve 會拒絕啟動)
+API_SCALES_CONFIG = os.environ.get("FACTORY_API_SCALES", "")
+SCALES_WORKERS_ERROR = "FACTORY_API_SCALES 只支援單一 worker (其他 worker 收不到讀數，/ws/weight 會時有時無)，請改用 --workers 1 或清空 FACTORY_API_SCALES"
+
+db = get_pool(SQL_DB_NAME)
+
+# ------------------------------------------------
+# 監控指標 (GET /metrics，Prometheus 格式)
+# ------------------------------------------------
+metrics = Metrics()
+metrics.histogram("factory_http_request_duration_seconds", "API 回應時間 (秒)，依路由 / 方法 / 狀態碼")
+metrics.counter("factory_uploads_total", "秤重上傳筆數，依產線與判定結果 (PASS / NG / other)")
+metrics.counter("factory_api_errors_total", "API 內部錯誤次數，依路由")
+metrics.histogram("factory_sqlite_write_wait_seconds", "等待 SQLite 寫入鎖 (含 BEGIN IMMEDIATE) 的秒數")
+metrics.histogram("factory_sqlite_commit_seconds", "SQLite commit 秒數")
+metrics.counter("factory_sqlite_busy_total", "SQLite 被其他程序鎖住、寫入失敗的次數")
+metrics.counter("factory_logs_archived_total", "從熱資料庫搬到月份封存檔的日誌筆數")
+metrics.counter("factory_order_changes_total", "批次工單 API 寫入的工單筆數，依動作 (add / reorder / cancel)")
+metrics.histogram("factory_ingest_batch_rows", "收料佇列每批合併寫入的筆數", buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+UPLOAD_STATUS_LABELS = ("PASS", "NG")     # 其他判定結果一律記成 other，用戶端亂送也不會產生新序列
+
+def observe_sqlite(event, seconds):
+    if event == "busy": metrics.inc("factory_sqlite_busy_total")
+    elif event == "wait": metrics.observe("factory_sqlite_write_wait_seconds", seconds)
+    else: metrics.observe("factory_sqlite_commit_seconds", seconds)
+
+db.observer = observe_sqlite
+
+# ------------------------------------------------
+# 收料佇列：/upload 只負責排隊，由單一寫入者合併成一批寫入
+# 4 條產線同時秤重時，不再每筆各自開連線、各自 commit 搶 SQLite 寫入鎖
+# ------------------------------------------------
+INGEST_BATCH_MAX = 200   # 一批最多合併幾筆讀數
+INGEST_FLUSH_MS = 5      # 收到第一筆後最多再等幾毫秒湊批
+
+class IngestQueue:
+    def __init__(self, db):
+        self.db = db
+        self.queue = None
+        self.task = None
+        # 寫入都在這條背景執行緒上做，事件迴圈本身不會被 I/O 卡住
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        """關機前把佇列內剩下的讀數寫完"""
+        if self.task is None: return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def submit(self, row):
+        """排入一筆讀數，等到所在批次 commit 後回傳序號 (production_logs 的 rowid)"""
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, fut))
+        return await fut
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None: break
+            batch = [item]
+            deadline = loop.time() + INGEST_FLUSH_MS / 1000
+            while len(batch) < INGEST_BATCH_MAX:
+                timeout = deadline - loop.time()
+                try:
+                    nxt = self.queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self.queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if nxt is None:
+                    stopping = True
+                    break
+                batch.append(nxt)
+
+            rows = [row for row, _ in batch]
+            metrics.observe("factory_ingest_batch_rows", len(rows))
+            try:
+                seqs = await loop.run_in_executor(self.executor, self._write_batch, rows)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done(): fut.set_exception(e)
+            else:
+                for (_, fut), seq in zip(batch, seqs):
+                    if not fut.done(): fut.set_result(seq)
+
+    def _write_batch(self, rows):
+        # CSV 備份改由 log_journal 從 production_logs 追加 (見 journal_loop)，這裡只寫 SQL
+        # --- SQL 寫入 (整批一個交易、一次 commit) ---
+        with self.db.write() as conn:
+            cursor = conn.cursor()
+            seqs = []
+            pass_counts = {}
+            for row in rows:
+                # 1. 寫入日誌
+                cursor.execute("""
+                    INSERT INTO production_logs (時間, 產線, 工單號碼, 產品ID, 實測重, 判定結果, NG原因)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, row)
+                seqs.append(cursor.lastrowid)
+                if row[5] == "PASS":
+                    pass_counts[row[2]] = pass_counts.get(row[2], 0) + 1
+
+            # 2. 更新工單計數 (僅 PASS，同一張工單在一批內合併成一次 UPDATE)
+            count_passes(cursor, pass_counts)
+        return seqs
+
+ingest_queue = IngestQueue(db)
+api_scales = None
+weight_stream = None
+
+dispatch_cache = DispatchCache(db)
+log_journal = LogJournal(db, JOURNAL_DIR, FILE_LOGS_PREFIX)
+SSE_KEEPALIVE_S = 15.0
+spc_engine = SpcEngine(PRODUCTION_LINES)
+spc_wake = asyncio.Event()
+leader = LeaderLock()
+
+def journal_backlog():
+    """production_logs 中還沒寫進 CSV 流水帳的筆數"""
+    with db.read() as conn:
+        top = conn.execute("SELECT MAX(序號) FROM production_logs").fetchone()[0] or 0
+    return [((), max(0, top - log_journal.load_manifest()["last_seq"]))]
+
+def rollup_pending():
+    with db.read() as conn:
+        return [((), rollup_backlog(conn))]
+
+def upload_ages():
+    now = time.time()
+    return [(labels, now - ts) for labels, ts in metrics.stamps("factory_line_last_upload")]
+
+def scale_ages():
+    if api_scales is None: return []
+    now = time.time()
+    return [((("scale", port),), now - ts) for port, ts in sorted(api_scales.last_readings().items())]
+
+metrics.gauge("factory_ingest_queue_depth", "收料佇列中等待寫入的讀數 (回應這次抓取的 worker)", lambda: [((), ingest_queue.depth())])
+metrics.gauge("factory_journal_backlog_rows", "還沒寫進 CSV 流水帳的日誌筆數", journal_backlog)
+metrics.gauge("factory_rollup_backlog_rows", "還沒彙總進時段彙總表的日誌筆數", rollup_pending)
+metrics.gauge("factory_weight_stream_clients", "即時重量 WebSocket 連線數，依產線",
+              lambda: [((("line", line),), n) for line, n in weight_stream.clients().items()] if weight_stream else [])
+metrics.gauge("factory_weight_stream_coalesced_total", "因用戶端太慢被新讀數蓋掉、沒送出的重量筆數",
+              lambda: [((), weight_stream.coalesced)] if weight_stream else [], kind="counter")
+def spc_rule_hits():
+    with db.read() as conn:
+        return [((("line", line), ("rule", rule)), n) for line, rule, n in read_rule_hits(conn)]
+
+metrics.gauge("factory_spc_rule_violations_total", "Western Electric 規則違反次數，依產線 (偏差) 與規則", spc_rule_hits, kind="counter")
+metrics.gauge("factory_line_last_upload_age_seconds", "各產線距離上一次秤重上傳的秒數", upload_ages)
+metrics.gauge("factory_scale_last_reading_age_seconds", "API 主機直連磅秤距離上一次讀數的秒數 (還沒讀到過則從開始讀取算起)", scale_ages)
+
+async def journal_loop():
+    """背景把新寫入的日誌追加到 CSV 流水帳"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            moved = await loop.run_in_executor(None, log_journal.flush)
+        except Exception as e:
+            print(f"⚠️ CSV 流水帳寫入警告: {e}")
+            moved = 0
+        if moved < JOURNAL_BATCH:
+            await asyncio.sleep(JOURNAL_FLUSH_S)
+
+async def rollup_loop():
+    """背景把新日誌累加進 分 / 時 / 日 彙總表 (落後很多時連續追，追上後每 ROLLUP_FLUSH_S 秒一次)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            moved = await loop.run_in_executor(None, rollup_logs, db)
+        except Exception as e:
+            print(f"⚠️ 時段彙總警告: {e}")
+            moved = 0
+        if moved < ROLLUP_BATCH:
+            await asyncio.sleep(ROLLUP_FLUSH_S)
+
+async def archive_loop():
+    """背景把上個月以前的日誌搬到月份封存檔 (只搬已寫進 CSV 流水帳與時段彙總的部分)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            journal_seq = log_journal.load_manifest()["last_seq"]
+            moved = await loop.run_in_executor(None, archive_logs, db, journal_seq)
+            metrics.inc("factory_logs_archived_total", (), moved)
+        except Exception as e:
+            print(f"⚠️ 日誌封存警告: {e}")
+            moved = 0
+        if moved < ARCHIVE_BATCH:
+            await asyncio.sleep(ARCHIVE_CHECK_S)
+
+async def order_changes_loop():
+    """長時間執行時定期修剪工單異動日誌 (原本只在啟動時修剪，網頁端增量同步的掃描範圍會一直變大)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SYNC_JOURNAL_TRIM_S)
+        try: await loop.run_in_executor(None, trim_order_changes, db)
+        except Exception as e: print(f"⚠️ 工單異動日誌修剪警告: {e}")
+
+async def spc_loop():
+    """背景追 production_logs 的新紀錄餵給 SPC；/upload 寫入後會立即喚醒，網頁秤重等其他來源靠定時輪詢"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            moved = await loop.run_in_executor(None, spc_engine.poll, db)
+        except Exception as e:
+            print(f"⚠️ SPC 更新警告: {e}")
+            moved = 0
+        if moved < SPC_BATCH:
+            try: await asyncio.wait_for(spc_wake.wait(), SPC_POLL_S)
+            except asyncio.TimeoutError: pass
+            spc_wake.clear()
+
+async def metrics_loop():
+    """多 worker 時定期把本 worker 的指標寫到共用目錄，讓抓到任何一個 worker 都拿得到總數"""
+    while True:
+        await asyncio.sleep(METRICS_DUMP_S)
+        try: metrics.dump()
+        except Exception as e: print(f"⚠️ 指標寫出失敗: {e}")
+
+async def maintenance_loop():
+    """拿到 leader 鎖之後才啟動背景維護；沒拿到就每 LEADER_RETRY_S 秒再試 (leader 結束後接手)"""
+    while not leader.try_acquire():
+        await asyncio.sleep(LEADER_RETRY_S)
+    print(f"✅ worker {os.getpid()} 負責背景維護 (流水帳 / SPC / 時段彙總 / 封存 / 異動日誌)")
+    log_journal.compress_closed()
+    tasks = [asyncio.create_task(loop()) for loop in (journal_loop, spc_loop, rollup_loop, archive_loop, order_changes_loop)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks: task.cancel()
+
+@asynccontextmanager
+async def api_lifespan(app):
+    # 每個 worker 啟動都會跑；遷移在 BEGIN IMMEDIATE 內重新確認版本，多程序同時啟動也只會做一次
+    global api_scales, weight_stream
+    init_db(db)
+    if API_SCALES_CONFIG:
+        # 不經過 serve (例如直接用 uvicorn --workers N 啟動) 時的最後防線
+        if API_WORKERS > 1: raise ValueError(SCALES_WORKERS_ERROR)
+        api_scales = ScaleRegistry(PRODUCTION_LINES, parse_scale_config(API_SCALES_CONFIG, DEFAULT_BAUD))
+        weight_stream = WeightBroadcaster(api_scales, PRODUCTION_LINES)
+        weight_stream.start()
+        api_scales.start()
+    await ingest_queue.start()
+    await dispatch_cache.start()
+    maintenance_task = asyncio.create_task(maintenance_loop())
+    metrics_task = None
+    if API_WORKERS > 1:
+        metrics.share(METRICS_DIR)
+        metrics_task = asyncio.create_task(metrics_loop())
+    try:
+        yield
+    finally:
+        maintenance_task.cancel()
+        if metrics_task is not None:
+            metrics_task.cancel()
+            metrics.dump()
+        await dispatch_cache.stop()
+        await ingest_queue.stop()
+        if leader.held:
+            log_journal.flush()
+            log_journal.close()
+            leader.release()
+        if api_scales is not None: api_scales.stop()
+
+api_app = FastAPI(lifespan=api_lifespan)
+api_app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+class ScaleUpload(BaseModel):
+    line_name: str
+    order_id: str
+    product_id: str
+    weight: str
+    status: str
+    reason: str = ""  # 📌 確保這裡有預設值，避免 Client 沒傳時報錯
+
+_WEIGHT_RE = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+def extract_weight(raw_val):
+    try:
+        if isinstance(raw_val, (int, float)): return float(raw_val)
+        match = _WEIGHT_RE.search(str(raw_val))
+        return float(match.group()) if match else 0.0
+    except: return 0.0
+
+@api_app.post("/upload")
+async def receive_weight(data: ScaleUpload):
+    try:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        clean_weight = extract_weight(data.weight)
+        # 產線名稱驗證 (防止傳送 Unknown 進來)
+        line = data.line_name if data.line_name in PRODUCTION_LINES else "Unknown"
+
+        # 交給收料佇列，回傳時這筆已經和同批讀數一起 commit
+        row_to_write = (now, line, data.order_id, data.product_id, clean_weight, data.status, data.reason)
+        seq = await ingest_queue.submit(row_to_write)
+        status = data.status if data.status in UPLOAD_STATUS_LABELS else "other"
+        metrics.inc("factory_uploads_total", (("line", line), ("status", status)))
+        metrics.stamp("factory_line_last_upload", (("line", line),))
+        spc_wake.set()
+        if data.status == "PASS":
+            dispatch_cache.notify()   # 完成數量變了，隊首工單可能換人
+
+        return {"status": "success", "line": line, "weight": clean_weight, "seq": seq}
+
+    except Exception as e:
+        metrics.inc("factory_api_errors_total", (("route", "/upload"),))
+        print(f"API Error (/upload): {e}")
+        return {"status": "error", "message": str(e)}
+# ------------------------------------------------
+# 📌 修正點 3: 派單接口 (GET) 
+# 注意：這個函式必須對齊最左邊，不能縮排在上面的函式裡！
+# ------------------------------------------------
+@api_app.get("/current_order/{line_name}")
+def get_current_order(line_name: str):
+    # 🔴 派單快取：工單沒有異動時直接回傳記憶體內的結果，不再每次 JOIN + 建 DataFrame
+    try:
+        return dispatch_cache.get(line_name)
+    except Exception as e:
+        metrics.inc("factory_api_errors_total", (("route", "/current_order/{line_name}"),))
+        print(f"API Error: {e}")
+    
+    return {"order_id": None, "product_id": None}
+
+# 長輪詢版：產線電腦帶上手上的工單號碼，換單時 (或逾時) 才回應
+@api_app.get("/current_order/{line_name}/wait")
+async def wait_current_order(line_name: str, order_id: str | None = None, timeout: float = 25.0):
+    timeout = min(max(timeout, 0.0), 60.0)
+    try:
+        return await dispatch_cache.wait_for_change(line_name, lambda p: p["order_id"] != order_id, timeout)
+    except Exception as e:
+        metrics.inc("factory_api_errors_total", (("route", "/current_order/{line_name}/wait"),))
+        print(f"API Error: {e}")
+    return {"order_id": None, "product_id": None}
+
+# SSE 版：連線後先送一次目前工單，之後每次派單內容改變就推送一筆
+@api_app.get("/current_order/{line_name}/events")
+async def stream_current_order(line_name: str, request: Request):
+    async def event_stream():
+        last = None
+        while not await request.is_disconnected():
+            payload = await dispatch_cache.wait_for_change(line_name, lambda p: p != last, SSE_KEEPALIVE_S)
+            if payload != last:
+                last = payload
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# 生產統計 (觸發器維護的彙總表，主鍵查詢)：產線累計、本班，帶 order_id 時另加該工單
+@api_app.get("/stats/{line_name}")
+def get_line_stats(line_name: str, order_id: str | None = None):
+    if line_name not in PRODUCTION_LINES:
+        raise HTTPException(status_code=404, detail=f"未知的產線: {line_name}")
+    with db.read() as conn:
+        return line_summary(conn, line_name, order_id)
+
+# 時段彙總 (趨勢圖 / 報表)：grain=minute|hour|day，by=line,order,product 決定除了時段之外還分哪些欄
+# rolled_up_to 之後的紀錄還沒彙總，不在結果內
+@api_app.get("/rollups")
+def get_rollups(grain: str = "day", start: str | None = None, end: str | None = None, line: str | None = None,
+                order_id: str | None = None, product_id: str | None = None, by: str = ""):
+    try:
+        with db.read() as conn:
+            rows = query_rollups(conn, grain, start, end, line, order_id, product_id,
+                                 [d.strip() for d in by.split(",") if d.strip()])
+            return {"grain": grain, "rolled_up_to": rollup_watermark(conn), "rows": rows}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 即時 SPC：產線偏差 (實測重 - 準重) + 工單 (預設為該產線最近有資料的工單) 的 Cp/Cpk 與規則違反
+@api_app.get("/spc/{line_name}")
+def get_line_spc(line_name: str, order_id: str | None = None):
+    if line_name not in PRODUCTION_LINES:
+        raise HTTPException(status_code=404, detail=f"未知的產線: {line_name}")
+    with db.read() as conn:
+        return read_spc_summary(conn, line_name, order_id)
+
+# 管制圖資料：最近 points 點 + 中心線 / 管制界限 / 規格界限；scope=line 看產線偏差
+@api_app.get("/spc/{line_name}/chart")
+def get_line_spc_chart(line_name: str, order_id: str | None = None, scope: str = Query("order", pattern="^(order|line)$"),
+                       points: int = Query(100, ge=1, le=SPC_WINDOW)):
+    if line_name not in PRODUCTION_LINES:
+        raise HTTPException(status_code=404, detail=f"未知的產線: {line_name}")
+    with db.read() as conn:
+        return read_spc_chart(conn, line_name, order_id, scope, points)
+
+@api_app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+# ------------------------------------------------
+# 產線操作畫面：單頁 HTML + 小型 JSON 端點 (見 kiosk_page.py)
+# ------------------------------------------------
+@api_app.get("/kiosk/{line_name}", response_class=HTMLResponse)
+def kiosk(line_name: str):
+    if line_name not in PRODUCTION_LINES:
+        raise HTTPException(status_code=404, detail=f"沒有這條產線: {line_name}")
+    return HTMLResponse(kiosk_html(line_name), headers={"Cache-Control": "no-cache"})
+
+@api_app.get("/kiosk/{line_name}/state")
+def kiosk_state(line_name: str):
+    # 與 /current_order 同一張隊首工單、同一套快取失效規則，只是多帶規格卡欄位
+    try:
+        return dispatch_cache.query("detail", line_name, ORDER_DETAIL_SQL, kiosk_state_payload)
+    except Exception as e:
+        metrics.inc("factory_api_errors_total", (("route", "/kiosk/{line_name}/state"),))
+        print(f"API Error: {e}")
+    return {"order_id": None}
+
+@api_app.get("/scale/{line_name}")
+def scale_reading(line_name: str):
+    """API 主機直連磅秤的目前讀數；沒有設定 FACTORY_API_SCALES 時 status 為 offline"""
+    if api_scales is None or line_name not in PRODUCTION_LINES:
+        return {"status": "offline"}
+    return scale_payload(api_scales.snapshot(line_name))
+
+@api_app.websocket("/ws/weight/{line_name}")
+async def weight_socket(ws: WebSocket, line_name: str):
+    """以磅秤本身的速率推送 /scale 同格式的讀數 (慢的用戶端只收最新一筆)"""
+    await ws.accept()
+    if weight_stream is None or line_name not in PRODUCTION_LINES or not api_scales.reader(line_name).port:
+        # 這台 API 沒接該產線的磅秤：送一次 offline 讓畫面切到手動輸入，不佔著連線
+        await ws.send_json({"status": "offline"})
+        await ws.close()
+        return
+    try:
+        await weight_stream.stream(ws.send_json, line_name)
+    except (WebSocketDisconnect, OSError, RuntimeError):
+        pass   # 用戶端離線 (關分頁、斷網)
+
+# ------------------------------------------------
+# 批次工單 (ERP 排程)：每個請求整批一個交易，任何一筆有問題回 422 且整批不寫
+# ------------------------------------------------
+class OrderItem(BaseModel):
+    line_name: str
+    product_id: str
+    quantity: int
+
+class OrderBatch(BaseModel):
+    orders: list[OrderItem]
+
+class OrderReorder(BaseModel):
+    line_name: str
+    order_ids: list[str]
+
+class OrderCancel(BaseModel):
+    order_ids: list[str]
+
+def run_order_change(action, fn, *args):
+    try:
+        result = fn(*args)
+    except OrderBatchError as e:
+        raise HTTPException(status_code=422, detail=[{"index": i, "error": msg} for i, msg in e.problems])
+    except Exception as e:
+        metrics.inc("factory_api_errors_total", (("route", f"/orders/{action}"),))
+        print(f"API Error (/orders/{action}): {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    dispatch_cache.notify()   # 隊首工單可能換了，不等背景檢查就喚醒長輪詢 / SSE
+    metrics.inc("factory_order_changes_total", (("action", action),), len(result) if isinstance(result, list) else result)
+    return result
+
+@api_app.post("/orders/batch")
+def post_order_batch(data: OrderBatch):
+    ids = run_order_change("add", add_orders, db, [(o.line_name, o.product_id, o.quantity) for o in data.orders])
+    return {"status": "success", "order_ids": ids}
+
+@api_app.post("/orders/reorder")
+def post_order_reorder(data: OrderReorder):
+    changed = run_order_change("reorder", reorder_orders, db, data.line_name, data.order_ids)
+    return {"status": "success", "changed": changed}
+
+@api_app.post("/orders/cancel")
+def post_order_cancel(data: OrderCancel):
+    changed = run_order_change("cancel", cancel_orders, db, data.order_ids)
+    return {"status": "success", "changed": changed}
+
+# ------------------------------------------------
+# 報表匯出 (串流)：日期區間 / 產線 / 工單 篩選，CSV 或 Parquet
+# ------------------------------------------------
+def download_headers(file_name, fallback):
+    return {"Content-Disposition": f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"}
+
+@api_app.get("/export/production_logs")
+def export_production_logs(start: str | None = None, end: str | None = None, line: str | None = None,
+                           order_id: str | None = None, fmt: str = Query("csv", alias="format")):
+    try:
+        chunks = iter_log_chunks(db, start, end, line, order_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式錯誤，請用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS")
+    stamp = datetime.now().strftime('%Y%m%d')
+
+    if fmt == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="伺服器未安裝 pyarrow，無法輸出 Parquet")
+        return StreamingResponse(iter_logs_parquet(chunks), media_type="application/vnd.apache.parquet",
+                                 headers=download_headers(f"生產日報表_{stamp}.parquet", f"production_logs_{stamp}.parquet"))
+    if fmt != "csv":
+        raise HTTPException(status_code=400, detail="format 只支援 csv 或 parquet")
+
+    # 有沒有篩選都走同一條唯讀路徑 (熱資料庫 + 封存月份檔)，排序一致，也不會寫入流水帳
+    return StreamingResponse(iter_logs_csv(chunks), media_type="text/csv; charset=utf-8",
+                             headers=download_headers(f"生產日報表_{stamp}.csv", f"production_logs_{stamp}.csv"))
+
+# ------------------------------------------------
+# 啟動
+# ------------------------------------------------
+def serve(host=API_HOST, port=API_PORT, workers=API_WORKERS, log_level="error"):
+    # 多 worker 時 uvicorn 需要用匯入字串，讓每個子程序自己建立 api_app
+    app = "api_server:api_app" if workers > 1 else api_app
+    if API_SCALES_CONFIG and workers > 1: raise ValueError(SCALES_WORKERS_ERROR)
+    # 子程序重新匯入本模組時讀得到實際的 worker 數 (FACTORY_API_SCALES 需要判斷)
+    os.environ["FACTORY_API_WORKERS"] = str(workers)
+    if workers > 1: clear_shared(METRICS_DIR)
+    uvicorn.run(app, host=host, port=port, workers=workers, log_level=log_level,
+                timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_S)
+
+def main():
+    parser = argparse.ArgumentParser(description="產線收料 API 服務")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FACTORY_API_PORT", API_PORT)))
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if API_SCALES_CONFIG and args.workers > 1:
+        parser.error(SCALES_WORKERS_ERROR)
+    print(f"✅ API 服務啟動於 {args.host}:{args.port} (workers={args.workers})")
+    serve(args.host, args.port, args.workers, args.log_level)
+
+if __name__ == "__main__":
+    main()
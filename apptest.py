@@ -1,498 +1,158 @@
 import os
 import time
-import random
 import threading
 import warnings
 import sqlite3
-import csv  # <<< 必須補上這一行
-import serial
-import re
 from datetime import datetime
+from urllib.parse import urlencode
 import pandas as pd
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh
-import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from db_pool import get_pool
+from log_buffer import LogBuffer
+from log_journal import LogJournal, JOURNAL_DIR
+from leader_lock import LeaderLock
+from scale_reader import ScaleRegistry, parse_scale_config
+from factory_core import (
+    normalize_sequences, CatalogIndex, SQL_DB_NAME, FILE_PRODUCTS, FILE_ORDERS, FILE_LOGS, FILE_LOGS_PREFIX, PRODUCTION_LINES, API_PORT,
+    ORDER_COLUMNS, PRODUCT_COLUMNS, LOG_COLUMNS, DENSITY_OPTIONS, SPECIAL_VARIETIES, ALL_VARIETIES, TEMP_OPTIONS,
+    get_p_label, get_temp_color, format_size,
+    prepare_products, prepare_work_orders, update_order, merge_work_orders, sql_rows, pending_orders, queue_table, queue_signature,
+)
+from factory_core import record_weigh_result as _record_weigh_result
+from page_style import PAGE_STYLE
+from rerun_profiler import RerunProfiler
+from order_batch import OrderBatchError, add_orders, reorder_orders, delete_orders
+from production_stats import StatsCache, shift_key, stats_payload
+from product_import import calc_weights, new_product_ids, read_product_file, prepare_import, insert_products, excel_available
+from db_schema import init_db, upsert_rows, delete_missing
 
 # 忽略警告
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
-# 1. 系統設定
+# 1. 系統設定 (檔名、欄位、建檔選項等共用常數在 factory_core.py)
 # ==========================================
-FILE_PRODUCTS = "db_products.csv"
-FILE_ORDERS = "db_orders.csv"
-FILE_LOGS_PREFIX = "db_logs"      # API 用來產生 db_logs_Line 1.csv
-FILE_LOGS = "db_logs_All.csv"     # 補上這個變數，防止 NameError
-SQL_DB_NAME = "factory_data.db"
-
-# 欄位定義
-# 欄位定義
-# 工單表：與您預期的 factory_data.db 格式完全對齊
-ORDER_COLUMNS = ["產線", "排程順序", "工單號碼", "產品ID", "顯示內容", "品種", "密度", "準重", "預計數量", "已完成數量", "狀態", "建立時間"]
-
-# 產品表：對應預期格式中的 products 表
-PRODUCT_COLUMNS = ["產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", "下限", "準重", "上限", "備註1", "備註2", "備註3"]
-
-# 日誌表：用於分類歸納 4 台電腦傳來的數據
-LOG_COLUMNS = ["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"]
-PRODUCTION_LINES = ["Line 1", "Line 2", "Line 3", "Line 4"]
+API_PUBLIC_URL = os.environ.get("FACTORY_API_URL", "")   # 瀏覽器連 API 的網址；留空則用目前網頁的主機名稱 + API_PORT
+# 主機直連的磅秤，例如 "Line 1=COM3, Line 2=COM4@19200:sics"；沒列到的產線不讀 (由產線電腦上傳)
+SCALES_CONFIG = os.environ.get("FACTORY_SCALES", "")
+SCALE_BAUD = int(os.environ.get("FACTORY_SCALE_BAUD", "9600"))
+SCALE_PARSER = os.environ.get("FACTORY_SCALE_PARSER", "auto")   # st_gs / sics / number / auto
+# 秤重頁只有下列片段會自己定時重跑，整頁只在操作 (按鈕、切換) 或工單異動時重繪
+LIVE_REFRESH_S = 1.0        # 磅秤讀數 + 剩餘數量
+HISTORY_REFRESH_S = 3.0     # 最近 5 筆良品 / NG
+SYNC_REFRESH_S = 1.0        # 檢查資料庫異動 (工單有變就整頁重繪)
+
+# 全程序共用的 SQLite 連線池 (WAL)，API 執行緒與每個網頁 Session 都從這裡拿連線
+db = get_pool(SQL_DB_NAME)
 st.set_page_config(page_title="產線管理主機 v13.30", layout="wide")
+
+@st.cache_resource
+def get_profiler():
+    # FACTORY_PROFILE=1 開啟重繪計時 (管理中心多一個分頁)；=檔名.jsonl 另外逐次寫檔
+    return RerunProfiler.from_env()
+
+profiler = get_profiler()
+# 上一次重繪被 st.rerun()/st.stop() 中斷時跑不到最後的 finish()，這裡補記
+_prev_run = st.session_state.get("profile_run")
+if _prev_run is not None: _prev_run.finish(complete=False)
+prof = st.session_state.profile_run = profiler.begin()
 def force_sync_everything():
-    try:
-        with sqlite3.connect(SQL_DB_NAME, timeout=10) as conn:
-            # 1. 強制從資料庫更新「工單進度」
-            df_wo = pd.read_sql("SELECT * FROM work_orders", conn)
-            if not df_wo.empty:
-                st.session_state.work_orders_db = df_wo
-            
-            # 2. 強制從資料庫更新「生產紀錄」
-            df_logs = pd.read_sql("SELECT * FROM production_logs ORDER BY 時間 DESC", conn)
-            if not df_logs.empty:
-                st.session_state.production_logs = df_logs
-    except Exception as e:
-        print(f"同步失敗: {e}")
+    """強制完整同步：清除增量同步的水位線，下一次同步會重新讀取整張表"""
+    for key in ("sync_log_rowid", "sync_wo_seq"):
+        st.session_state.pop(key, None)
+    perform_global_sync()
 # ==========================================
-# 1. FastAPI 接收端設定 (主機背景收料口)
+# 1. 收料 API (已獨立成 api_server.py)
 # ==========================================
-api_app = FastAPI()
-
-class ScaleUpload(BaseModel):
-    line_name: str
-    order_id: str
-    product_id: str
-    weight: str
-    status: str
-    reason: str = ""  # 📌 確保這裡有預設值，避免 Client 沒傳時報錯
-
-def extract_weight(raw_val):
-    try:
-        if isinstance(raw_val, (int, float)): return float(raw_val)
-        match = re.search(r"[-+]?\d*\.\d+|\d+", str(raw_val))
-        return float(match.group()) if match else 0.0
-    except: return 0.0
-
-@api_app.post("/upload")
-async def receive_weight(data: ScaleUpload):
-    try:
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        clean_weight = extract_weight(data.weight)
-        # 產線名稱驗證 (防止傳送 Unknown 進來)
-        line = data.line_name if data.line_name in ["Line 1", "Line 2", "Line 3", "Line 4"] else "Unknown"
-        
-        # --- Part A: CSV 寫入 (保留您原本邏輯，完全不動) ---
-        target_csv = f"db_logs_{line}.csv"
-        row_to_write = [now, line, data.order_id, data.product_id, clean_weight, data.status, data.reason]
-        
-        try:
-            file_exists = os.path.isfile(target_csv)
-            with open(target_csv, mode='a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                if not file_exists: 
-                    writer.writerow(["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"])
-                writer.writerow(row_to_write)
-        except Exception as csv_err:
-            print(f"⚠️ CSV 寫入警告 ({line}): {csv_err}")
-
-        # --- Part B: SQL 資料庫寫入 (修改處在下面) ---
-        conn = sqlite3.connect(SQL_DB_NAME, timeout=30) 
-        try:
-            cursor = conn.cursor()
-            # 1. 寫入日誌
-            cursor.execute("""
-                INSERT INTO production_logs (時間, 產線, 工單號碼, 產品ID, 實測重, 判定結果, NG原因)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (now, line, data.order_id, data.product_id, clean_weight, data.status, data.reason))
-            
-            # 2. 更新工單計數 (僅當 PASS 時)
-            if data.status == "PASS":
-                 cursor.execute("""
-                UPDATE work_orders 
-                SET 已完成數量 = 已完成數量 + 1, 
-                    狀態 = CASE WHEN 狀態 = '待生產' THEN '生產中' ELSE 狀態 END
-                WHERE 工單號碼 = ? AND 狀態 != '已完成'
-            """, (data.order_id,))
-            
-            conn.commit()  # 記得 commit
-        except Exception as sql_err:
-            print(f"⚠️ SQL 寫入警告: {sql_err}")
-        finally:
-            conn.close()
-
-        return {"status": "success", "line": line, "weight": clean_weight}
+# 正式環境請另外執行 `python api_server.py`，網頁端只是共用同一個資料庫的用戶端
+# 開發時設定 FACTORY_EMBED_API=1，網頁會像舊版一樣在背景執行緒順便啟動 API (會與網頁重繪搶 GIL)
+EMBED_API = os.environ.get("FACTORY_EMBED_API", "") == "1"
 
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
-# ------------------------------------------------
-# 📌 修正點 3: 派單接口 (GET) 
-# 注意：這個函式必須對齊最左邊，不能縮排在上面的函式裡！
-# ------------------------------------------------
-@api_app.get("/current_order/{line_name}")
-def get_current_order(line_name: str):
-    try:
-        with sqlite3.connect(SQL_DB_NAME) as conn:
-            # 🔴 改良版查詢：使用 JOIN 同時抓取 工單資訊 與 產品規格(上下限)
-            query = """
-                SELECT 
-                    w.工單號碼, w.產品ID, 
-                    p.下限, p.準重, p.上限
-                FROM work_orders w
-                LEFT JOIN products p ON w.產品ID = p.產品ID
-                WHERE w.產線 = ? 
-                  AND w.狀態 IN ('待生產', '生產中')
-                  AND w.已完成數量 < w.預計數量
-                ORDER BY w.排程順序 ASC LIMIT 1
-            """
-            df = pd.read_sql(query, conn, params=(line_name,))
-            
-            if not df.empty:
-                row = df.iloc[0]
-                return {
-                    "order_id": row['工單號碼'],
-                    "product_id": row['產品ID'],
-                    # ✅ 將後台設定好的精準規格，全部傳給產線電腦
-                    "target_weight": float(row['準重']) if pd.notna(row['準重']) else 25.0,
-                    "min_weight": float(row['下限']) if pd.notna(row['下限']) else 0.0,
-                    "max_weight": float(row['上限']) if pd.notna(row['上限']) else 999.0
-                }
-    except Exception as e:
-        print(f"API Error: {e}")
-    
-    return {"order_id": None, "product_id": None}
-def init_db():
-    conn = sqlite3.connect(SQL_DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS production_logs (
-            "時間" TEXT, "產線" TEXT, "工單號碼" TEXT, "產品ID" TEXT, 
-            "實測重" REAL, "判定結果" TEXT, "NG原因" TEXT
-        )""")
-    
-    # 建立完整工單表 (解決您提到的 factory_data2.db 只有兩欄的問題)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS work_orders (
-            "產線" TEXT, "排程順序" INTEGER, "工單號碼" TEXT PRIMARY KEY, "產品ID" TEXT, 
-            "顯示內容" TEXT, "品種" TEXT, "密度" REAL, "準重" REAL, 
-            "預計數量" INTEGER, "已完成數量" INTEGER, "狀態" TEXT, "建立時間" TEXT
-        )""")
-    
-    # 建立產品規格表 (確保 products 表也存在)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            "產品ID" TEXT PRIMARY KEY, "客戶名" TEXT, "溫度等級" TEXT, "品種" TEXT, 
-            "密度" REAL, "長" REAL, "寬" REAL, "高" REAL, "下限" REAL, 
-            "準重" REAL, "上限" REAL, "備註1" TEXT, "備註2" TEXT, "備註3" TEXT
-        )""")
-    
-    conn.commit()
-    conn.close()
-
-# 修改 run_api_server 函式，加入 try-except 避免崩潰
-def run_api_server():
-    try:
-        init_db()
-        # 加入 log_level="error" 減少干擾
-        uvicorn.run(api_app, host="0.0.0.0", port=8000, log_level="error")
-    except Exception as e:
-        print(f"API 伺服器啟動失敗 (可能 Port 8000 已被佔用): {e}")
-
-# 在 Streamlit 啟動處加入更嚴謹的判斷
-if "api_thread_started" not in st.session_state:
-    import socket
-    # 檢查 8000 Port 是否已被佔用
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        is_port_open = s.connect_ex(('127.0.0.1', 8000)) != 0
-    
-    if is_port_open:
-        thread = threading.Thread(target=run_api_server, daemon=True)
-        thread.start()
-        st.session_state.api_thread_started = True
-        print("✅ API 服務啟動成功於 Port 8000")
-    else:
-        st.session_state.api_thread_started = True # 標記為已啟動，避免重複報錯
-        print("💡 API 服務已在背景執行，直接使用現有連線")
+@st.cache_resource
+def prepare_database():
+    # 每個程序只做一次；API 服務啟動時也會做，誰先誰後都沒關係
+    init_db(db)
+    return True
 
-# ==========================================
-# 2. Streamlit 系統核心啟動
-# ==========================================
+@st.cache_resource
+def start_embedded_api():
+    import api_server
+    thread = threading.Thread(target=api_server.serve, kwargs={"port": API_PORT, "workers": 1}, daemon=True, name="embedded-api")
+    thread.start()
+    print(f"✅ API 服務 (內嵌) 啟動於 Port {API_PORT}")
+    return thread
 
+@st.cache_resource
+def get_log_journal():
+    return LogJournal(db, JOURNAL_DIR, FILE_LOGS_PREFIX)
 
-# 啟動背景 API (只啟動一次)
-if "api_thread_started" not in st.session_state:
-    threading.Thread(target=run_api_server, daemon=True).start()
-    st.session_state.api_thread_started = True
-def sync_data_from_sql():
-    """強制同步：直接用 SQL 內容覆蓋網頁狀態，確保 100% 同步"""
-    try:
-        with sqlite3.connect(SQL_DB_NAME, timeout=10) as conn:
-            # 1. 讀取最新工單
-            df_orders = pd.read_sql("SELECT * FROM work_orders", conn)
-            if not df_orders.empty:
-                # 直接更新整個 dataframe，確保「已完成數量」與「狀態」同步
-                st.session_state.work_orders_db = df_orders
-            
-            # 2. 讀取最新日誌 (這會讓下方的良品紀錄表格更新)
-            df_logs = pd.read_sql("SELECT * FROM production_logs ORDER BY 時間 DESC", conn)
-            if not df_logs.empty:
-                st.session_state.production_logs = df_logs
-    except Exception as e:
-        pass
+prepare_database()
+if EMBED_API: start_embedded_api()
+log_journal = get_log_journal()
 
-# [修正3] 將自動刷新頻率設為 2秒，並在刷新時觸發同步
-#count = st_autorefresh(interval=2000, key="global_sync_refresh")
-#if count > 0:
-#   sync_data_from_sql()
 # ------------------------------------------
 # 3. 共享資料與資料庫邏輯 (保持您原有的功能)
 # ------------------------------------------
 @st.cache_resource
-def get_shared_data():
-    class ScaleData:
-        def __init__(self):
-            self.weight = 0.0
-            self.offset = 0.0
-            self.last_update = 0
-            self.error = None
-    return ScaleData()
-
-shared_data = get_shared_data()
-try:
-    from streamlit.runtime.scriptrunner import add_script_run_context
-except ImportError:
-    try:
-        from streamlit.runtime.scriptrunner.script_run_context import add_script_run_context
-    except ImportError:
-        # 如果都找不到，定義一個空的 dummy 函式避免 NameError
-        def add_script_run_context(thread):
-            pass
+def get_scales():
+    # 每條產線各自一台磅秤 (各自去皮)；有設定序列埠的才會啟動讀取執行緒
+    registry = ScaleRegistry(PRODUCTION_LINES, parse_scale_config(SCALES_CONFIG, SCALE_BAUD, SCALE_PARSER))
+    registry.start()
+    return registry
 
-from streamlit.runtime.scriptrunner import get_script_run_ctx
+scales = get_scales()
+prof.lap("setup")
 
 # ==========================================
-# 模擬磅秤執行緒 (測試與開發用)
-# ==========================================
-
-
-def scale_reader_thread():
-    # 正式部署時，請根據現場磅秤調整 COM Port (例如 'COM3' 或 '/dev/ttyUSB0')
-    COM_PORT = 'COM3' 
-    BAUD_RATE = 9600
-    
-    while True:
-        try:
-            with serial.Serial(COM_PORT, BAUD_RATE, timeout=1) as ser:
-                while True:
-                    line = ser.readline().decode('ascii').strip()
-                    if line:
-                        # 這裡需要根據你磅秤輸出的格式解析字串
-                        # 例如磅秤輸出 "ST,GS,+  12.5kg"，你需要抓取 12.5
-                        import re
-                        match = re.search(r"[-+]?\d*\.\d+|\d+", line)
-                        if match:
-                            shared_data.weight = float(match.group())
-                            shared_data.last_update = time.time()
-                    time.sleep(0.1) # 增加反應速度
-        except Exception as e:
-            shared_data.error = f"磅秤連線中斷: {str(e)}"
-            time.sleep(5) # 斷線後隔5秒重試
-# ==========================================
 
 # ==========================================
 # 新增：SQL 資料庫轉換邏輯
 # ==========================================
+
 def export_to_sql():
-    """將目前的 Session 資料轉換為 SQLite 資料庫檔案 (修正版：防止覆蓋日誌)"""
-    # 嘗試 3 次即可，不需要太久
-    for i in range(3):
-        try:
-            conn = sqlite3.connect(SQL_DB_NAME, timeout=10)
+    """將目前的 Session 資料寫回 SQLite (只 UPSERT 有變動的列、刪除已移除的列，不再整張表覆蓋)"""
+    # WAL + 單一寫入連線排隊，不需要再 sleep 重試
+    try:
+        with db.write() as conn:
+            cursor = conn.cursor()
             
-            # 1. 轉換產品資料表 (主機端完全控制，可用 replace)
+            # 1. 產品資料表 (主機端完全控制：Session 裡沒有的產品就刪除)
             if not st.session_state.products_db.empty:
-                st.session_state.products_db.to_sql("products", conn, if_exists='replace', index=False)
+                p_db = st.session_state.products_db
+                upsert_rows(cursor, "products", "產品ID", PRODUCT_COLUMNS, sql_rows(p_db, PRODUCT_COLUMNS))
+                delete_missing(cursor, "products", "產品ID", p_db["產品ID"])
                 
-            # 2. 轉換工單資料表
+            # 2. 工單資料表
             if not st.session_state.work_orders_db.empty:
                 wo_to_save = st.session_state.work_orders_db.copy()
                 if "建立時間" in wo_to_save.columns:
                     wo_to_save["建立時間"] = pd.to_datetime(wo_to_save["建立時間"]).dt.strftime('%Y-%m-%d %H:%M:%S')
-                wo_to_save.to_sql("work_orders", conn, if_exists='replace', index=False)
+                upsert_rows(cursor, "work_orders", "工單號碼", ORDER_COLUMNS, sql_rows(wo_to_save, ORDER_COLUMNS))
+                delete_missing(cursor, "work_orders", "工單號碼", wo_to_save["工單號碼"])
             
             # 【重要修改】這裡刪除了 production_logs 的寫入
             # 因為日誌現在改用 "逐筆插入 (INSERT)" 的方式，避免整張表覆蓋
-                
-            conn.commit()
-            conn.close()
-            return True 
-            
-        except sqlite3.OperationalError:
-            time.sleep(0.5)
-            continue
-        except Exception as e:
-            st.error(f"SQL 轉換錯誤: {e}")
-            return False
-    return False
+        return True 
+    except Exception as e:
+        st.error(f"SQL 轉換錯誤: {e}")
+        return False
 # ==========================================
 # 2. CSS 與 JS (視覺核心 - 雙重鎖定版)
 # ==========================================
-st.markdown("""
-<style>
-    .main .block-container { padding-top: 0.5rem; padding-bottom: 1rem; }
-    .digital-font { font-family: 'Roboto Mono', 'Consolas', monospace; font-weight: 700; }
-    h1, h2, h3 { margin-top: 0.5rem !important; margin-bottom: 0.5rem !important; }
-
-    /* ============================================================ */
-    /* 按鈕樣式核心邏輯                                             */
-    /* ============================================================ */
-    
-    /* 1. 全域設定：任何 Disabled 的按鈕，優先權最高，強制變灰 */
-    div.stButton > button:disabled {
-        background-color: #bdc3c7 !important;
-        border: 2px solid #95a5a6 !important;
-        color: #7f8c8d !important;
-        opacity: 1 !important;
-        cursor: not-allowed !important;
-        box-shadow: none !important;
-    }
-
-    /* 2. 一般 Primary 按鈕 (例如存檔、確認)，預設紅色 */
-    div.stButton > button[kind="primary"] {
-        background-color: #e74c3c;
-        border: 2px solid #c0392b;
-        color: white;
-        box-shadow: 0 3px 6px rgba(0,0,0,0.2);
-    }
-    /* 3. 只有在沒被 Disabled 時，才有 Hover 效果 */
-    div.stButton > button[kind="primary"]:hover:not(:disabled) {
-        background-color: #ec7063;
-        transform: translateY(-2px);
-    }
-    div.stButton > button[kind="primary"]:active:not(:disabled) {
-        background-color: #c0392b;
-        transform: translateY(1px);
-    }
-
-    /* 資訊卡 */
-    .unified-spec-card {
-        background-color: #2c3e50; border-radius: 12px; border-left: 8px solid #95a5a6;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2); color: white; overflow: hidden;
-        margin-bottom: 10px; border: 1px solid #455a64; height: 460px !important; 
-        display: flex; flex-direction: column; justify-content: space-between;
-    }
-    .usc-header { background: rgba(0,0,0,0.3); padding: 8px 10px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
-    .usc-header .u-label { color: #cfd8dc; font-size: 0.8rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; }
-    .usc-header .u-value { font-size: 2.4rem; font-weight: 900; color: #ffffff; margin-top: 0px; line-height: 1.1; text-shadow: 0 2px 4px rgba(0,0,0,0.5); }
-
-    .usc-grid { display: flex; border-bottom: 1px solid #455a64; background-color: #34495e; flex: 0 0 auto; }
-    .usc-item { flex: 1; text-align: center; padding: 5px; border-right: 1px solid #455a64; min-width: 0; display: flex; flex-direction: column; justify-content: center; }
-    .usc-item:last-child { border-right: none; }
-    .usc-item .u-label { color: #b0bec5; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; margin-bottom: 2px; display: block; }
-    .usc-item .u-value { font-size: 1.6rem; font-weight: bold; line-height: 1; white-space: nowrap; color: white; }
-
-    .usc-size-row { background: #233140; padding: 8px 10px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
-    .usc-size-row .u-label { color: #b0bec5; font-size: 0.8rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 2px; }
-    .usc-size-row .u-value { font-size: 1.8rem; font-weight: 900; color: #ffffff !important; font-family: 'Roboto Mono', monospace; letter-spacing: 0.5px; white-space: nowrap; }
-
-    .usc-range-row { background-color: #2c3e50; padding: 6px 15px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
-    .usc-range-row .u-label { color: #95a5a6; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; }
-    .usc-range-row .u-value { font-size: 1.3rem; font-weight: bold; color: #f1c40f; font-family: 'Roboto Mono', monospace; letter-spacing: 1px; }
-
-    .usc-notes { background: rgba(255, 255, 255, 0.05); padding: 8px 15px; flex-grow: 1; display: flex; flex-direction: column; justify-content: flex-start; text-align: left; overflow-y: auto; }
-    .usc-notes .u-label { color: #e74c3c; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 3px; border-bottom: 1px solid #e74c3c; display: inline-block; }
-    .usc-notes .u-content { color: #ecf0f1; font-size: 1.0rem; line-height: 1.3; font-weight: bold; }
-
-    .status-container { padding: 5px; border-radius: 12px; text-align: center; display: flex; flex-direction: column; justify-content: center; align-items: center; transition: background-color 0.2s; height: 250px !important; }
-    .status-pass { background-color: #2980b9; color: white; border: 4px solid #3498db; box-shadow: 0 0 10px rgba(41, 128, 185, 0.3); }
-    .status-fail { background-color: #c0392b; color: white; border: 4px solid #e74c3c; box-shadow: 0 0 10px rgba(192, 57, 43, 0.3); }
-    .status-ng-ready { background-color: #d35400; color: white; border: 4px solid #e67e22; } 
-    
-    .weight-display { font-size: 7rem; font-weight: 900; line-height: 1; text-shadow: 2px 2px 5px rgba(0,0,0,0.3); margin-top: 0px; margin-bottom: 0px; }
-    .queue-header { font-size: 1.0rem; font-weight: bold; margin-bottom: 5px; color: #2c3e50; padding-bottom: 5px; }
-    .history-header { font-size: 0.9rem; font-weight: bold; color: #7f8c8d; margin-bottom: 5px; border-bottom: 2px solid #ddd; }
-    .countdown-box { background: rgba(0,0,0,0.2); padding: 2px 15px; border-radius: 8px; margin-bottom: 5px; backdrop-filter: blur(5px); }
-    .countdown-label { font-size: 0.8rem; color: #ecf0f1; text-transform: uppercase; letter-spacing: 1px; opacity: 0.9; }
-    .countdown-val { font-size: 1.8rem; font-weight: 900; color: #f1c40f; text-shadow: 1px 1px 2px rgba(0,0,0,0.5); line-height: 1; }
-    .over-prod { color: #ff6b6b !important; }
-
-    button[data-baseweb="tab"] { font-size: 1.2rem !important; font-weight: bold !important; padding: 10px 20px !important; }
-</style>
-
-<script>
-const observer = new MutationObserver((mutations) => {
-    const buttons = window.parent.document.querySelectorAll('button');
-    buttons.forEach(btn => {
-        const text = btn.innerText;
-        // 現場作業按鈕 - 巨大化與強制變色邏輯
-        if (text.includes("紀錄良品") || text.includes("紀錄 NG")) {
-            btn.style.height = "130px"; btn.style.fontSize = "32px"; btn.style.fontWeight = "900"; btn.style.marginTop = "15px"; btn.style.borderRadius = "15px"; 
-            
-            // 使用 setProperty(..., 'important') 確保 JS 權重最高，壓過所有 CSS
-            if (btn.disabled) {
-                // 強制灰色 (雙重保險)
-                btn.style.setProperty('background-color', '#bdc3c7', 'important');
-                btn.style.setProperty('border-color', '#95a5a6', 'important');
-                btn.style.setProperty('color', '#7f8c8d', 'important');
-                btn.style.setProperty('cursor', 'not-allowed', 'important');
-                btn.style.boxShadow = "none";
-            } else {
-                // 啟用狀態 - 強制上色
-                if (text.includes("紀錄良品")) {
-                    btn.style.setProperty('background-color', '#27ae60', 'important'); // 綠色
-                    btn.style.setProperty('border-color', '#145a32', 'important');
-                    btn.style.setProperty('color', 'white', 'important');
-                    btn.style.boxShadow = "0 6px 12px rgba(0,0,0,0.2)";
-                } else if (text.includes("紀錄 NG")) {
-                    btn.style.setProperty('background-color', '#c0392b', 'important'); // 紅色
-                    btn.style.setProperty('border-color', '#641e16', 'important');
-                    btn.style.setProperty('color', 'white', 'important');
-                    btn.style.boxShadow = "0 6px 12px rgba(0,0,0,0.2)";
-                }
-            }
-        }
-        // 後台儀表板按鈕 - 加大
-        if ((text.includes("Line") && text.includes("待生產")) || text.includes("返回列表")) {
-            btn.style.minHeight = "80px"; btn.style.fontSize = "20px"; btn.style.fontWeight = "bold"; btn.style.boxShadow = "0 4px 6px rgba(0,0,0,0.2)"; 
-        }
-    });
-});
-observer.observe(window.parent.document.body, { childList: true, subtree: true });
-document.addEventListener('keydown', function(e) {
-    if (e.code === 'Space') {
-        var buttons = window.parent.document.querySelectorAll('button');
-        for (var i = 0; i < buttons.length; i++) {
-            if (buttons[i].innerText.includes("紀錄良品") && !buttons[i].disabled) { buttons[i].click(); break; }
-        }
-    }
-});
-</script>
-""", unsafe_allow_html=True)
+# 字串在 page_style.py 匯入時組好一次；每次重繪仍要送出 (沒重新送出的元素會被 Streamlit 移除)
+st.markdown(PAGE_STYLE, unsafe_allow_html=True)
 
 # ==========================================
 # 3. 核心邏輯 (含自動正規化)
 # ==========================================
-def normalize_sequences(df):
-    if df.empty: return df
-    df = df.reset_index(drop=True)
-    new_df = pd.DataFrame()
-    for line in df['產線'].unique():
-        line_df = df[df['產線'] == line].sort_values(by='排程順序')
-        line_df['排程順序'] = range(1, len(line_df) + 1)
-        new_df = pd.concat([new_df, line_df])
-    return new_df
-
 def load_data():
+    # 只在 Session 第一次執行時讀檔；之後每次重繪不再重做欄位整理 (交給 prepare_session_frames)
     if 'products_db' not in st.session_state:
         st.session_state.products_db = pd.DataFrame()
         if os.path.exists(FILE_PRODUCTS):
             try: st.session_state.products_db = pd.read_csv(FILE_PRODUCTS)
             except: pass
         if st.session_state.products_db.empty:
-            st.session_state.products_db = pd.DataFrame(columns=["產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", "下限", "準重", "上限", "備註1", "備註2", "備註3"])
-    
-    if not st.session_state.products_db.empty:
-        st.session_state.products_db["溫度等級"] = st.session_state.products_db["溫度等級"].astype(str)
-        cols = ["備註1", "備註2", "備註3"]
-        st.session_state.products_db[cols] = st.session_state.products_db[cols].fillna("NULL").replace(['', 'nan', 'None'], 'NULL')
+            st.session_state.products_db = pd.DataFrame(columns=PRODUCT_COLUMNS)
 
     if 'work_orders_db' not in st.session_state:
         st.session_state.work_orders_db = pd.DataFrame()
@@ -501,111 +161,224 @@ def load_data():
             except: pass
         if st.session_state.work_orders_db.empty:
             st.session_state.work_orders_db = pd.DataFrame(columns=ORDER_COLUMNS)
-    
-    if "產線" not in st.session_state.work_orders_db.columns: st.session_state.work_orders_db["產線"] = "Line 1"
-    for col in ORDER_COLUMNS:
-        if col not in st.session_state.work_orders_db.columns: st.session_state.work_orders_db[col] = ""
-    st.session_state.work_orders_db = st.session_state.work_orders_db[ORDER_COLUMNS] 
-    
-    for col in ["排程順序", "預計數量", "已完成數量"]:
-        st.session_state.work_orders_db[col] = pd.to_numeric(st.session_state.work_orders_db[col], errors='coerce').fillna(0).astype(int)
-    
-    st.session_state.work_orders_db = normalize_sequences(st.session_state.work_orders_db)
+    prepare_session_frames()
 
+    # 生產日誌改放在只追加的 LogBuffer (log_buffer.py)，只在顯示/匯出時才轉成 DataFrame
     if 'production_logs' not in st.session_state:
-        st.session_state.production_logs = pd.DataFrame()
+        st.session_state.production_logs = LogBuffer(LOG_COLUMNS)
         try:
-            conn = sqlite3.connect(SQL_DB_NAME)
-            # 讀取所有產線的紀錄，並按時間倒序排列
-            df_sql = pd.read_sql(f"SELECT * FROM production_logs ORDER BY 時間 DESC", conn)
+            with db.read() as conn:
+                # 讀取所有產線的紀錄 (依寫入順序，rowid 當索引)，並記下增量同步的水位線
+                df_sql = pd.read_sql("SELECT rowid AS rowid, * FROM production_logs ORDER BY rowid", conn, index_col="rowid")
             if not df_sql.empty:
-                st.session_state.production_logs = df_sql
-            conn.close()
+                st.session_state.production_logs = LogBuffer.from_frame(df_sql, LOG_COLUMNS)
+                st.session_state.sync_log_rowid = int(df_sql.index.max())
         except Exception:
             pass
         if st.session_state.production_logs.empty and os.path.exists(FILE_LOGS):
-            try: st.session_state.production_logs = pd.read_csv(FILE_LOGS)
+            try:
+                df_csv = pd.read_csv(FILE_LOGS)
+                if "產線" not in df_csv.columns: df_csv["產線"] = "Line 1"
+                st.session_state.production_logs = LogBuffer.from_frame(df_csv.reindex(columns=LOG_COLUMNS, fill_value="NULL"), LOG_COLUMNS, from_sql=False)
             except: pass
-            
-        if st.session_state.production_logs.empty:
-            st.session_state.production_logs = pd.DataFrame(columns=LOG_COLUMNS)
-    
-    if "產線" not in st.session_state.production_logs.columns: st.session_state.production_logs["產線"] = "Line 1"
-    for col in LOG_COLUMNS:
-        if col not in st.session_state.production_logs.columns: st.session_state.production_logs[col] = "NULL"
-    st.session_state.production_logs = st.session_state.production_logs[LOG_COLUMNS]
+
+def prepare_session_frames():
+    """欄位整理 + 排程正規化，只在 products_db / work_orders_db 被換成新物件時才做
+    (同步、排序、建檔都會換新物件；沒有異動的重繪直接跳過)"""
+    ss = st.session_state
+    if ss.get("prepared_products") is not ss.products_db:
+        ss.products_db = ss.prepared_products = prepare_products(ss.products_db)
+    if ss.get("prepared_orders") is not ss.work_orders_db:
+        ss.work_orders_db = ss.prepared_orders = prepare_work_orders(ss.work_orders_db)
 
 # [找到 save_data 內的這段，並替換]
 def save_data():
-    if 'products_db' in st.session_state: st.session_state.products_db.to_csv(FILE_PRODUCTS, index=False)
-    if 'work_orders_db' in st.session_state: st.session_state.work_orders_db.to_csv(FILE_ORDERS, index=False)
-    
-    # 修改：將 Streamlit 的操作存為總表，不影響 API 的分流檔案
-    if 'production_logs' in st.session_state: 
-        st.session_state.production_logs.to_csv(FILE_LOGS, index=False)
-
-def get_temp_color(temp_str):
-    t = str(temp_str).upper()
-    if "1260" in t: return "#ffffff" 
-    if "1200" in t: return "#bdc3c7"
-    if "1300" in t: return "#5dade2"
-    if "1400" in t: return "#f4d03f"
-    if "1500" in t: return "#58d68d"
-    if "BIO" in t: return "#d35400"
-    return "#ecf0f1" 
-
-def format_size(val):
-    try: f = float(val); return str(int(f)) if f.is_integer() else str(val)
-    except: return str(val)
-
-def safe_format_density(val):
-    try: return f"{float(val):.1f}"
-    except: return str(val)
-
-def safe_format_weight(val):
-    try: return f"{float(val):.3f}"
-    except: return str(val)
+    with prof.section("save_data"):
+        if 'products_db' in st.session_state: st.session_state.products_db.to_csv(FILE_PRODUCTS, index=False)
+        if 'work_orders_db' in st.session_state: st.session_state.work_orders_db.to_csv(FILE_ORDERS, index=False)
+    # 生產日誌不再整份重寫：由 log_journal 從 SQL 逐筆追加到分段 CSV
+
+def record_weigh_result(log_values):
+    """寫入一筆秤重紀錄 (失敗時顯示錯誤並回傳 None)"""
+    try:
+        with prof.query("record_weigh_result"):
+            return _record_weigh_result(db, log_values)
+    except Exception as e:
+        st.error(f"SQL寫入失敗: {e}")
+        return None
+
+def production_stats(scope, key):
+    """生產統計彙總 (寫入時由觸發器維護)；日誌同步水位線或筆數變了才重新查，其餘重繪直接用記憶體內的結果"""
+    cache = st.session_state.setdefault("stats_cache", StatsCache())
+    version = (st.session_state.get("sync_log_rowid"), len(st.session_state.production_logs))
+    try:
+        with prof.query("production_stats"):
+            return cache.get(db, scope, key, version)
+    except Exception:
+        return stats_payload(None, {})
+
+def order_change(fn, *args):
+    """工單批次異動 (order_batch.py) 直接寫 SQL，再增量同步回 Session 並備份 CSV
+    只動到指定的工單，ERP 從 API 加進來、這個畫面還沒同步到的工單不會被覆蓋或刪掉"""
+    try:
+        with prof.query(fn.__name__):
+            result = fn(*args)
+    except OrderBatchError as e:
+        st.error(f"❌ {e}")
+        return None
+    except Exception as e:
+        st.error(f"SQL寫入失敗: {e}")
+        return None
+    perform_global_sync()
+    save_data()
+    return result
+
+def add_products(new_products):
+    """新產品以單一交易寫進 SQLite，再一次併入 Session 與 CSV，回傳筆數 (失敗時顯示錯誤並回傳 0)"""
+    if new_products.empty: return 0
+    try:
+        with prof.query("insert_products"):
+            insert_products(db, new_products)
+    except Exception as e:
+        st.error(f"SQL寫入失敗: {e}")
+        return 0
+    st.session_state.products_db = pd.concat([st.session_state.products_db, new_products], ignore_index=True)
+    save_data()
+    return len(new_products)
+
+def api_base_url():
+    """瀏覽器端要連的 API 網址 (報表下載連結用)"""
+    if API_PUBLIC_URL: return API_PUBLIC_URL.rstrip("/")
+    host = st.context.headers.get("host") or "localhost"
+    return f"http://{host.rsplit(':', 1)[0]}:{API_PORT}"
+
+def line_queue(line_name):
+    """(待生產工單, 隊列表格, 下拉選單文字)；工單或產品表換新時才重算，平常重繪直接沿用"""
+    wo, products = st.session_state.work_orders_db, st.session_state.products_db
+    cache = st.session_state.setdefault("line_queue_cache", {})
+    hit = cache.get(line_name)
+    if hit is None or hit[0] is not wo or hit[1] is not products:
+        with prof.section("queue_table"):
+            pending = pending_orders(wo, line_name)
+            q_df, labels = queue_table(pending, product_catalog()) if not pending.empty else (pd.DataFrame(), [])
+        hit = cache[line_name] = (wo, products, pending, q_df, labels)
+    return hit[2:]
+
+def product_catalog():
+    """產品目錄索引 (products_db 被換成新的 DataFrame 才重建)"""
+    cat = st.session_state.get("catalog_index")
+    if cat is None or cat.is_stale(st.session_state.products_db):
+        cat = st.session_state.catalog_index = CatalogIndex(st.session_state.products_db)
+    return cat
 
 load_data()
+prof.lap("load")
 # --- 這裡原本是用來讓主機自己讀磅秤的，現在改由客戶端上傳，所以這整段都要註解掉 ---
-# if "thread_started" not in st.session_state:
-#     try:
-#         thread = threading.Thread(target=scale_reader_thread, daemon=True)
-#         add_script_run_context(thread) 
-#         thread.start()
-#         st.session_state.thread_started = True
-#     except Exception as e:
-#         st.error(f"無法啟動磅秤讀取服務: {e}")
-DENSITY_MAP = {64:(59.74,85.00),80:(74.03,93.75),96:(87.55,115.00),104:(96.24,121.88),112:(103.64,131.25),120:(111.05,140.63),128:(118.45,150.00),136:(125.85,159.38),144:(133.26,168.75),160:(154.50,175.50),192:(177.68,220.00),256:(226.60,312.00)}
-DENSITY_OPTIONS = list(DENSITY_MAP.keys())
-def get_p_label(d): return f"{d} ({d/16}P)"
-SPECIAL_VARIETIES = ["BULK", "BUXD", "SB", "BIOSTAR"] 
-ALL_VARIETIES = sorted(["ACPE", "ACBL", "BL", "BLOC(原反)", "RHK(S-F)"] + SPECIAL_VARIETIES)
-TEMP_OPTIONS = ["1260", "1200", "1300", "1400", "1500", "BIOSTAR"]
+# (需要時設定環境變數 FACTORY_SCALES，get_scales() 會替有設定序列埠的產線啟動讀取執行緒)
 # 1. 定義同步函式 (從 SQL 讀取最新資料覆蓋 Session)
+# 每個網頁 Session 各自記錄同步水位線：
+#   sync_log_rowid -> production_logs 已讀到的 rowid
+#   sync_wo_seq    -> work_order_changes 已讀到的序號
+# 每次心跳只抓水位線之後的新資料，沒有異動時只花兩個極小的查詢
 def perform_global_sync():
+    st.session_state.synced_at = time.monotonic()
     try:
-        with sqlite3.connect(SQL_DB_NAME, timeout=10) as conn:
+        with db.read() as conn:
             # 更新工單狀態 (例如: 數量、狀態變更)
-            df_wo = pd.read_sql("SELECT * FROM work_orders", conn)
-            if not df_wo.empty:
-                st.session_state.work_orders_db = df_wo
-            
+            sync_work_orders(conn)
             # 更新生產日誌 (讓良品紀錄表格會跳動)
-            df_log = pd.read_sql("SELECT * FROM production_logs ORDER BY 時間 DESC", conn)
-            if not df_log.empty:
-                st.session_state.production_logs = df_log
+            sync_production_logs(conn)
     except Exception as e:
         # 避免資料庫鎖定時報錯干擾畫面
         pass
 
-# 2. 啟動唯一的自動刷新器 (每 1 秒刷新一次)
-# 放在這裡，全域生效
-st_autorefresh(interval=1000, key="master_heartbeat")
+def sync_production_logs(conn):
+    last_rowid = st.session_state.get("sync_log_rowid")
+    if last_rowid is None or not st.session_state.production_logs.from_sql:
+        # 第一次同步 (或目前是 CSV 備援資料)：完整讀取，日誌以 rowid 當鍵值 (依寫入順序排列)
+        with prof.query("logs_full") as q:
+            df_log = pd.read_sql("SELECT rowid AS rowid, * FROM production_logs ORDER BY rowid", conn, index_col="rowid")
+            q.rows = len(df_log)
+        if not df_log.empty:
+            st.session_state.production_logs = LogBuffer.from_frame(df_log, LOG_COLUMNS)
+        st.session_state.sync_log_rowid = int(df_log.index.max()) if not df_log.empty else 0
+        return
+
+    # 水位線之後才抓：依賴 production_logs.序號 為 AUTOINCREMENT (db_schema LOG_TABLE_SQL)，撤銷最後一筆後 rowid 不會被重用
+    with prof.query("logs_incremental") as q:
+        df_new = pd.read_sql("SELECT rowid AS rowid, * FROM production_logs WHERE rowid > ? ORDER BY rowid", conn, index_col="rowid", params=(last_rowid,))
+        q.rows = len(df_new)
+    if df_new.empty: return
+    # 只追加新的幾筆，不複製整段歷史
+    st.session_state.production_logs.extend(df_new)
+    st.session_state.sync_log_rowid = int(df_new.index.max())
+
+def sync_work_orders(conn):
+    last_seq = st.session_state.get("sync_wo_seq")
+    try:
+        with prof.query("wo_journal_seq"):
+            min_seq, max_seq = conn.execute("SELECT MIN(序號), MAX(序號) FROM work_order_changes").fetchone()
+    except sqlite3.OperationalError:
+        # 舊版資料庫還沒有異動日誌：退回完整讀取
+        min_seq, max_seq, last_seq = None, None, None
+    max_seq = max_seq or 0
+    if last_seq is not None and last_seq == max_seq: return
+
+    changed_ids = None
+    # 水位線之後的日誌若已被清掉，只能完整讀取
+    if last_seq is not None and (min_seq is None or last_seq >= min_seq - 1):
+        changed_ids = [r[0] for r in conn.execute("SELECT DISTINCT 工單號碼 FROM work_order_changes WHERE 序號 > ?", (last_seq,))]
+        if None in changed_ids: changed_ids = None   # NULL = 整張表被重建
+
+    if changed_ids is None:
+        with prof.query("wo_full") as q:
+            df_wo = pd.read_sql("SELECT * FROM work_orders", conn)
+            q.rows = len(df_wo)
+        if not df_wo.empty:
+            st.session_state.work_orders_db = df_wo
+    elif changed_ids:
+        marks = ",".join("?" * len(changed_ids))
+        with prof.query("wo_changed") as q:
+            df_wo = pd.read_sql(f"SELECT * FROM work_orders WHERE 工單號碼 IN ({marks})", conn, params=changed_ids)
+            q.rows = len(df_wo)
+        st.session_state.work_orders_db = merge_work_orders(st.session_state.work_orders_db, changed_ids, df_wo)
+    st.session_state.sync_wo_seq = max_seq
+
+def current_queues():
+    """目前工單表的隊列結構 (queue_signature)，工單表換新時才重算"""
+    wo = st.session_state.work_orders_db
+    hit = st.session_state.get("queue_sig")
+    if hit is None or hit[0] is not wo:
+        hit = st.session_state.queue_sig = (wo, queue_signature(wo))
+    return hit[1]
+
+def rerun_if_queue_changed():
+    """片段內使用：隊列結構 (隊首、待生產工單的集合或順序) 在這次整頁重繪之後變了才整頁重繪
+    只是完成數量變了 (任何產線的 PASS) 不重繪整頁，剩餘數量 / 進度 / 最近紀錄由各自的片段更新"""
+    if current_queues() != st.session_state.get("rendered_queues"):
+        st.rerun()
+
+def fresh_order(curr):
+    """片段重跑時沿用整頁重繪時的工單列，數量改從最新的工單表取"""
+    wo = st.session_state.work_orders_db
+    row = wo[wo["工單號碼"] == curr["工單號碼"]]
+    return row.iloc[0] if not row.empty else curr
+
+def follow_db():
+    # 整頁重繪剛同步過就不再查一次
+    if time.monotonic() - st.session_state.get("synced_at", 0.0) >= SYNC_REFRESH_S / 2:
+        perform_global_sync()
+    rerun_if_queue_changed()
+
+# 2. 不再整頁定時刷新 (舊版 st_autorefresh 每秒重跑整個腳本)
+#    秤重頁的即時資料改由 st.fragment 各自定時重跑，見「功能 C」
 
 # 3. 【關鍵】每次網頁執行到這裡，都無條件執行同步
-# 不管是自動刷新觸發，還是您按了按鈕觸發，保證資料都是最新的
+# 不管是片段偵測到異動觸發，還是您按了按鈕觸發，保證資料都是最新的
 perform_global_sync()
+prepare_session_frames()
+st.session_state.rendered_queues = current_queues()
+prof.lap("sync")
 
 # ==========================================
 # 5. 主選單
@@ -613,12 +386,18 @@ perform_global_sync()
 with st.sidebar:
     st.markdown("### 🏭 產線系統 v13.30")
     menu = st.radio("功能導航", ["現場：產線秤重作業", "後台：系統管理中心"])
+    prof.page = menu
     st.divider()
     
     # 原有的儲存按鈕
     if st.button("💾 強制儲存資料 (CSV)", type="primary", use_container_width=True):
         st.session_state.work_orders_db = normalize_sequences(st.session_state.work_orders_db)
         save_data()
+        # 流水帳是背景維護狀態：API 在跑時由它的 leader 負責追加，這裡只有拿得到 leader 鎖才自己補一次
+        leader = LeaderLock()
+        if leader.try_acquire():
+            try: log_journal.flush()
+            finally: leader.release()
         st.toast("✅ 資料已同步至 CSV 檔案！")
 
     # --- 新增：SQL 生成按鈕 ---
@@ -632,21 +411,25 @@ with st.sidebar:
     # -----------------------
     
     st.markdown("### 📥 報表匯出")
-    if not st.session_state.production_logs.empty:
-        # 修正這裡：不要用 csv 當變數名
-        log_csv_data = st.session_state.production_logs.to_csv(index=False).encode('utf-8-sig')
-        st.download_button(
-            label="下載生產紀錄 (CSV)", 
-            data=log_csv_data,  # 這裡也要改
-            file_name=f"生產日報表_{datetime.now().strftime('%Y%m%d')}.csv", 
-            mime="text/csv"
-        )
+    # 報表由 API 直接從資料庫串流產生，網頁端只組連結，不再每秒把整份日誌轉成 CSV
+    exp_range = st.date_input("日期區間 (留空 = 全部)", value=(), key="exp_range")
+    exp_line = st.selectbox("產線", ["全部"] + PRODUCTION_LINES, key="exp_line")
+    exp_wo = st.text_input("工單號碼 (選填)", key="exp_wo")
+    exp_fmt = st.radio("格式", ["CSV", "Parquet"], horizontal=True, key="exp_fmt")
+    exp_params = {"format": exp_fmt.lower()}
+    if len(exp_range) >= 1: exp_params["start"] = exp_range[0].isoformat()
+    if len(exp_range) == 2: exp_params["end"] = exp_range[1].isoformat()
+    if exp_line != "全部": exp_params["line"] = exp_line
+    if exp_wo.strip(): exp_params["order_id"] = exp_wo.strip()
+    st.link_button(f"下載生產紀錄 ({exp_fmt})", f"{api_base_url()}/export/production_logs?{urlencode(exp_params)}", use_container_width=True)
+prof.lap("sidebar")
 # ==========================================
 # 功能 A: 後台管理
 # ==========================================
 if menu == "後台：系統管理中心":
     st.title("🛠️ 系統管理中心")
-    tab1, tab2 = st.tabs(["📦 產品建檔與管理", "🗓️ 產能排程與佇列"])
+    admin_tabs = st.tabs(["📦 產品建檔與管理", "🗓️ 產能排程與佇列"] + (["⏱️ 重繪效能"] if profiler.enabled else []))
+    tab1, tab2 = admin_tabs[:2]
     
     with tab1:
         st.subheader("1. 新增產品資料")
@@ -708,56 +491,61 @@ if menu == "後台：系統管理中心":
             
             with col_btn1:
                 if st.button("🔄 計算重量", type="primary", use_container_width=True):
-                    calc_df = edited_df.reset_index(drop=True)
-                    for index, row in calc_df.iterrows():
-                        if is_special:
-                            w = float(fixed_weight_opt)
-                            calc_df.at[index, "準重"], calc_df.at[index, "下限"], calc_df.at[index, "上限"] = w, w, w + 0.2
-                        else:
-                            if row["長"] > 0 and row["寬"] > 0 and row["高"] > 0:
-                                vol = (row["長"]/1000) * (row["寬"]/1000) * (row["高"]/1000)
-                                if batch_density in DENSITY_MAP:
-                                    d_min, d_max = DENSITY_MAP[batch_density]
-                                    calc_df.at[index, "準重"] = round(vol * batch_density, 3)
-                                    calc_df.at[index, "下限"] = round(vol * d_min, 1)
-                                    calc_df.at[index, "上限"] = round(vol * d_max, 1)
-                    st.session_state.editor_df_clean = calc_df
+                    st.session_state.editor_df_clean = calc_weights(edited_df.reset_index(drop=True), density=batch_density,
+                                                                    fixed_weight=fixed_weight_opt, special=is_special)
                     st.rerun()
 
             with col_btn2:
                 if st.button("💾 確認寫入資料庫", type="primary", use_container_width=True):
                     final_df = edited_df.reset_index(drop=True)
-                    saved = 0
                     if not batch_variety: st.error("❌ 請選擇品種")
                     else:
-                        for i, row in final_df.iterrows():
-                            if row["準重"] > 0:
-                                new_id = f"{batch_client}-{batch_variety}-{i}-{datetime.now().strftime('%M%S')}"
-                                new_data = pd.DataFrame([[new_id, batch_client, batch_temp, batch_variety, batch_density if not is_special else "N/A", row["長"], row["寬"], row["高"], row["下限"], row["準重"], row["上限"], row["備註1"], row["備註2"], row["備註3"]]], columns=st.session_state.products_db.columns)
-                                st.session_state.products_db = pd.concat([st.session_state.products_db, new_data], ignore_index=True)
-                                saved += 1
+                        new_df = final_df[final_df["準重"] > 0].assign(客戶名=batch_client, 溫度等級=batch_temp, 品種=batch_variety,
+                                                                     密度=batch_density if not is_special else "N/A")
+                        new_df["產品ID"] = new_product_ids(new_df, st.session_state.products_db["產品ID"])
+                        saved = add_products(prepare_products(new_df[PRODUCT_COLUMNS].reset_index(drop=True)))
                         if saved > 0:
-                            cols = ["備註1", "備註2", "備註3"]
-                            st.session_state.products_db[cols] = st.session_state.products_db[cols].fillna("NULL").replace(['', 'nan', 'None'], 'NULL')
-                            save_data()
                             st.toast(f"✅ 匯入 {saved} 筆成功！"); st.session_state.editor_df_clean = pd.DataFrame({"長": [0], "寬": [0], "高": [0], "下限": [0.0], "準重": [0.0], "上限": [0.0], "備註1": [""], "備註2": [""], "備註3": [""]}); st.rerun()
 
+        with st.expander("📥 批次匯入產品 (CSV / Excel)"):
+            st.caption("必要欄位: 客戶名、品種、長、寬、高；選填: 溫度等級、密度、備註1~3、固定包裝重 (特殊品種)。準重 / 下限 / 上限 由系統計算")
+            up = st.file_uploader("選擇檔案", type=["csv", "xlsx"] if excel_available() else ["csv"], key="product_import_file")
+            if up is not None:
+                # 檔案或產品目錄換了才重新解析 (按其他按鈕重繪時沿用)
+                cached = st.session_state.get("product_import")
+                if cached is None or cached[0] != up.file_id or cached[1] is not st.session_state.products_db:
+                    try:
+                        result = prepare_import(read_product_file(up.getvalue(), up.name), st.session_state.products_db)
+                    except Exception as e:
+                        result = e
+                    cached = st.session_state.product_import = (up.file_id, st.session_state.products_db, result)
+                result = cached[2]
+                if isinstance(result, Exception):
+                    st.error(f"❌ 檔案無法讀取: {result}")
+                else:
+                    ready, skipped = result
+                    st.info(f"可匯入 {len(ready)} 筆，略過 {len(skipped)} 筆")
+                    if not skipped.empty:
+                        st.dataframe(skipped, use_container_width=True, hide_index=True)
+                    if not ready.empty:
+                        st.dataframe(ready.head(200), use_container_width=True, hide_index=True)
+                        if st.button(f"💾 匯入 {len(ready)} 筆", type="primary", key="product_import_go"):
+                            saved = add_products(ready)
+                            if saved > 0:
+                                st.session_state.pop("product_import", None)
+                                st.toast(f"✅ 匯入 {saved} 筆成功！"); st.rerun()
+
         st.divider()
         st.subheader("2. 檢視與管理現有產品")
         if not st.session_state.products_db.empty:
-            db_disp = st.session_state.products_db.copy()
+            catalog = product_catalog()
             c_f1, c_f2, c_f3, c_f4, c_del = st.columns([2, 2, 2, 3, 2])
-            f_cli = c_f1.selectbox("篩選客戶", ["全部"] + list(db_disp["客戶名"].unique()), key="db_f_cli")
-            f_tmp = c_f2.selectbox("篩選溫度", ["全部"] + list(db_disp["溫度等級"].unique()), key="db_f_tmp")
-            f_var = c_f3.selectbox("篩選品種", ["全部"] + list(db_disp["品種"].unique()), key="db_f_var")
+            f_cli = c_f1.selectbox("篩選客戶", ["全部"] + catalog.options["客戶名"], key="db_f_cli")
+            f_tmp = c_f2.selectbox("篩選溫度", ["全部"] + catalog.options["溫度等級"], key="db_f_tmp")
+            f_var = c_f3.selectbox("篩選品種", ["全部"] + catalog.options["品種"], key="db_f_var")
             f_key = c_f4.text_input("關鍵字搜尋", placeholder="規格/備註...", key="db_f_key")
 
-            if f_cli != "全部": db_disp = db_disp[db_disp["客戶名"] == f_cli]
-            if f_tmp != "全部": db_disp = db_disp[db_disp["溫度等級"] == f_tmp]
-            if f_var != "全部": db_disp = db_disp[db_disp["品種"] == f_var]
-            if f_key:
-                mask = db_disp.astype(str).apply(lambda x: x.str.contains(f_key, case=False, na=False)).any(axis=1)
-                db_disp = db_disp[mask]
+            db_disp = catalog.filter(f_key, 客戶名=f_cli, 溫度等級=f_tmp, 品種=f_var)
 
             db_disp.insert(0, "刪除", False)
             db_disp = db_disp.reset_index(drop=False) 
@@ -787,6 +575,7 @@ if menu == "後台：系統管理中心":
                         st.toast(f"🗑️ 已刪除 {len(ids_to_remove)} 筆資料"); st.rerun()
         else: st.info("資料庫為空")
 
+    prof.lap("admin.products")
     # 後台管理 - 分層介面
     with tab2:
         if 'admin_line_choice' not in st.session_state:
@@ -796,11 +585,10 @@ if menu == "後台：系統管理中心":
             st.subheader("📊 選擇要管理的產線")
             st.markdown("請點選下方按鈕進入該產線的管理介面：")
             cols = st.columns(4)
+            wo_all = st.session_state.work_orders_db
+            pending_counts = wo_all.loc[wo_all["狀態"] != "已完成", "產線"].value_counts()
             for i, line in enumerate(PRODUCTION_LINES):
-                pending_count = len(st.session_state.work_orders_db[
-                    (st.session_state.work_orders_db["產線"] == line) & 
-                    (st.session_state.work_orders_db["狀態"] != "已完成")
-                ])
+                pending_count = int(pending_counts.get(line, 0))
                 with cols[i]:
                     label = f"📍 {line}\n\n待生產: {pending_count} 筆"
                     if st.button(label, key=f"btn_sel_{line}", use_container_width=True, type="primary"):
@@ -823,27 +611,22 @@ if menu == "後台：系統管理中心":
             # 1. 加入任務區塊 (詳細版)
             st.markdown("### ➕ 加入新任務")
             if not st.session_state.products_db.empty:
-                db_select = st.session_state.products_db.copy()
+                catalog = product_catalog()
                 c_f1, c_f2, c_f3, c_f4 = st.columns(4)
-                f_cli = c_f1.selectbox("篩選客戶", ["全部"] + list(db_select["客戶名"].unique()), key="sch_f_cli")
-                f_tmp = c_f2.selectbox("篩選溫度", ["全部"] + list(db_select["溫度等級"].unique()), key="sch_f_tmp")
-                f_var = c_f3.selectbox("篩選品種", ["全部"] + list(db_select["品種"].unique()), key="sch_f_var")
+                f_cli = c_f1.selectbox("篩選客戶", ["全部"] + catalog.options["客戶名"], key="sch_f_cli")
+                f_tmp = c_f2.selectbox("篩選溫度", ["全部"] + catalog.options["溫度等級"], key="sch_f_tmp")
+                f_var = c_f3.selectbox("篩選品種", ["全部"] + catalog.options["品種"], key="sch_f_var")
                 f_key = c_f4.text_input("關鍵字搜尋", placeholder="規格/備註...", key="sch_f_key")
 
-                if f_cli != "全部": db_select = db_select[db_select["客戶名"] == f_cli]
-                if f_tmp != "全部": db_select = db_select[db_select["溫度等級"] == f_tmp]
-                if f_var != "全部": db_select = db_select[db_select["品種"] == f_var]
-                if f_key:
-                    mask = db_select.astype(str).apply(lambda x: x.str.contains(f_key, case=False, na=False)).any(axis=1)
-                    db_select = db_select[mask]
-                
-                db_select = db_select.reset_index(drop=False)
+                sel_mask = catalog.mask(f_key, 客戶名=f_cli, 溫度等級=f_tmp, 品種=f_var)
+                db_select = catalog.source[sel_mask].reset_index(drop=False)
+                sel_spec = catalog.spec[sel_mask].tolist()
                 view_df = pd.DataFrame()
                 view_df["產品ID"] = db_select["產品ID"]
                 view_df["客戶名"] = db_select["客戶名"]
                 view_df["溫度"] = db_select["溫度等級"].astype(str)
                 view_df["品種"] = db_select["品種"]
-                view_df["📏 規格"] = db_select.apply(lambda x: f"{format_size(x['長'])}x{format_size(x['寬'])}x{format_size(x['高'])}", axis=1)
+                view_df["📏 規格"] = sel_spec
                 
                 view_df["下限"] = db_select["下限"]
                 view_df["準重"] = db_select["準重"]
@@ -889,40 +672,13 @@ if menu == "後台：系統管理中心":
                 if submit_btn:
                     items_index = edited_selection[edited_selection["📝 排程數量"] > 0].index
                     if not items_index.empty:
-                        # ... (原本的處理邏輯) ...
-                        global_count = len(st.session_state.work_orders_db)
-                        new_orders = []
-                        for idx in items_index:
-                            qty = edited_selection.loc[idx, "📝 排程數量"]
-                            original_row = db_select.iloc[idx-1]
-                            global_count += 1
-                            wo_id = f"WO-{datetime.now().strftime('%m%d')}-{global_count:04d}"
-                            
-                            # 處理備註與規格字串
-                            note_text = str(original_row['備註1']) if pd.notna(original_row['備註1']) else ""
-                            note_display = f" | {note_text}" if note_text else ""
-                            spec_str = f"{format_size(original_row['長'])}x{format_size(original_row['寬'])}x{format_size(original_row['高'])}"
-                            detail_str = f"[{original_row['客戶名']}] | {original_row['溫度等級']} | {original_row['品種']} | {spec_str} | {original_row['準重']}kg{note_display}"
-                            
-                            new_orders.append([
-                                target_line, 9999, wo_id, original_row['產品ID'], detail_str, 
-                                original_row['品種'], original_row['密度'], original_row['準重'], int(qty), 0, "待生產", datetime.now()
-                            ])
-                        
-                        # 1. 更新 Session State
-                        new_df = pd.DataFrame(new_orders, columns=ORDER_COLUMNS)
-                        st.session_state.work_orders_db = pd.concat([st.session_state.work_orders_db, new_df], ignore_index=True)
-                        st.session_state.work_orders_db = normalize_sequences(st.session_state.work_orders_db)
-                        
-                        # 2. 存入 CSV
-                        save_data()
-                        
-                        # 3. 【關鍵修正】立刻寫入 SQL，防止被自動同步覆蓋！
-                        export_to_sql()  
-                        
-                        st.toast(f"✅ 已成功加入 {len(new_orders)} 筆工單至 {target_line}！")
-                        time.sleep(1.5)
-                        st.rerun()
+                        # 與 ERP 的 POST /orders/batch 同一條路：單一交易發號 + 排到隊尾，不再整張表回寫
+                        new_orders = [(target_line, db_select.iloc[idx-1]['產品ID'], int(edited_selection.loc[idx, "📝 排程數量"]))
+                                      for idx in items_index]
+                        if order_change(add_orders, db, new_orders) is not None:
+                            st.toast(f"✅ 已成功加入 {len(new_orders)} 筆工單至 {target_line}！")
+                            time.sleep(1.5)
+                            st.rerun()
                     else: 
                         st.warning("請至少在一個項目輸入數量")
             else: st.warning("無產品資料")
@@ -977,14 +733,10 @@ if menu == "後台：系統管理中心":
                     
                     # --- 🔄 更新排序 (這裡也可以順便優化，使用 on_click) ---
                     def action_update_sort(line, df):
-                        for db_idx, row in df.iterrows():
-                            # 更新 session state 中的排序
-                            st.session_state.work_orders_db.at[db_idx, "排程順序"] = row["排序"]
-                        # 正規化並存檔
-                        st.session_state.work_orders_db = normalize_sequences(st.session_state.work_orders_db)
-                        save_data()
-                        export_to_sql()
-                        st.toast(f"✅ {line} 排序已更新")
+                        ordered = df.sort_values("排序", kind="stable").index
+                        ids = st.session_state.work_orders_db.loc[ordered, "工單號碼"].tolist()
+                        if order_change(reorder_orders, db, line, ids) is not None:
+                            st.toast(f"✅ {line} 排序已更新")
 
                     st.button(f"🔄 更新排序", 
                               type="primary", 
@@ -1000,11 +752,9 @@ if menu == "後台：系統管理中心":
                     def action_delete_orders(line, df):
                         indices_to_remove = df[df["刪除"] == True].index.tolist()
                         if indices_to_remove:
-                            st.session_state.work_orders_db = st.session_state.work_orders_db.drop(indices_to_remove)
-                            st.session_state.work_orders_db = normalize_sequences(st.session_state.work_orders_db)
-                            save_data()
-                            export_to_sql()
-                            st.toast("✅ 工單已移除")
+                            ids = st.session_state.work_orders_db.loc[indices_to_remove, "工單號碼"].tolist()
+                            if order_change(delete_orders, db, ids) is not None:
+                                st.toast("✅ 工單已移除")
                         else:
                             st.warning("⚠️ 未選擇任何工單")
 
@@ -1020,53 +770,221 @@ if menu == "後台：系統管理中心":
             # 請確保這個 else 跟最上面的 if 對齊 (通常是往左退兩格)
             else: 
                 st.info(f"{target_line} 目前無工單")
+    prof.lap("admin.queue")
+
+    if profiler.enabled:
+        with admin_tabs[2]:
+            st.caption(f"最近 {profiler.window} 次重繪 (共 {profiler.runs} 次，所有 Session 合計)；單位 ms，sql: 開頭為資料庫查詢")
+            st.dataframe(pd.DataFrame(profiler.stats()), use_container_width=True, hide_index=True)
+            if st.button("🧹 清除統計", key="profile_reset"): profiler.reset()
 
 # ==========================================
 # 功能 C: 現場秤重
 # ==========================================
 
 elif menu == "現場：產線秤重作業":
-    # 每 1000 毫秒 (1秒) 自動刷新一次網頁，確保抓到最新模擬重量
-    #from streamlit_autorefresh import st_autorefresh
-    #st_autorefresh(interval=1000, key="weight_refresh")
+    # 定時重跑的只有下面三種片段 (st.fragment)，整頁的隊列表格、規格卡不會每秒重畫
+    # 片段的參數在整頁重繪時決定，片段自己重跑時沿用 (所以產線名稱一定要當參數傳進去)
+    def live_weight(ln, v):
+        # 自動模式：畫面上的數字最多晚 LIVE_REFRESH_S 秒，按下當下改用磅秤最新讀數
+        scale = scales.snapshot(ln)
+        if scale.last_update <= 0: return v
+        return scale.stable_weight if scale.stable and scale.status == "ok" else scale.weight
+
+    def do_pass(c, v, ln, live=False, low=None, high=None):
+        if live:
+            v = live_weight(ln, v)
+            if not low <= v <= high:
+                st.session_state.flash = f"⚠️ {ln} 重量已變動為 {v:.3f} kg，不在規格內，未紀錄"
+                return
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_values = (current_time, ln, c["工單號碼"], c["產品ID"], float(v), "PASS", "")
+        
+        # 1. 【關鍵】直接寫入 SQL：日誌 INSERT + 工單數量 +1 同一個交易 (不再整張工單表回寫)
+        #    CSV 總表也只追加這一筆
+        if record_weigh_result(log_values) is None: return
+        
+        # 2. 增量同步 (只抓剛寫入的那幾筆與變動的工單，讓畫面立即顯示)
+        perform_global_sync()
+        
+        # 按鈕在片段內，callback 裡不能直接顯示元素，留到片段重跑時再跳通知
+        st.session_state.flash = f"✅ {ln} 良品紀錄成功: {v:.3f} kg"
+
+    def do_ng(c, v, ln, live=False):
+        if live: v = live_weight(ln, v)
+        reason = st.session_state.get(f"ng_sel_{ln}", "其他")
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_values = (current_time, ln, c["工單號碼"], c["產品ID"], float(v), "NG", reason)
+        
+        # 1. 【關鍵】直接寫入 SQL (CSV 總表只追加這一筆)
+        if record_weigh_result(log_values) is None: return
+        
+        # 2. 增量同步 (讓下面的表格立即顯示)
+        perform_global_sync()
+        
+        st.session_state.flash = f"🔴 {ln} NG 紀錄成功: {v:.3f} kg"
+
+    @st.fragment(run_every=SYNC_REFRESH_S)
+    def orders_watch():
+        # 整頁只有一個：增量同步 (其他產線電腦上傳、後台改排程)，隊列結構變了才整頁重繪
+        follow_db()
+
+    def weight_panel(line_name, curr, low, std, high, use_auto_scale):
+        # 自動模式每 LIVE_REFRESH_S 秒重跑；手動模式只在拉 Slider 時重跑
+        rerun_if_queue_changed()
+        curr = fresh_order(curr)
+        if "flash" in st.session_state: st.toast(st.session_state.pop("flash"))
+        auto_capture = False
+        if use_auto_scale:
+            scale = scales.snapshot(line_name)
+            val = scale.weight
+            if scale.last_update > 0:
+                update_str = datetime.fromtimestamp(scale.last_update).strftime('%H:%M:%S')
+                stable_str = "🟢 穩定" if scale.stable else "🟡 晃動中"
+                st.info(f"🛰️ 磅秤連線中... 實測重量: {val:.3f} kg {stable_str} (同步: {update_str})")
+            if scale.status == "error":
+                st.error(f"連線異常: {scale.error}")
+            elif scale.status == "stale" and scale.last_update > 0:
+                st.warning(f"⚠️ 磅秤讀數已 {time.time() - scale.last_update:.0f} 秒未更新")
+            
+            t_l, t_r = st.columns(2)
+            if t_l.button("⚖️ 歸零/去皮 (TARE)", key=f"tare_{line_name}", use_container_width=True):
+                scales.tare(line_name)
+                st.rerun(scope="fragment")
+            auto_capture = t_r.toggle("🤖 穩定後自動紀錄良品", value=False, key=f"auto_cap_{line_name}")
+            if scale.stable and scale.status == "ok": val = scale.stable_weight
+        else:
+            # 手動模式：由 Slider 完全控制 val
+            val = st.slider(f"⚖️ 手動調整重量", low*0.8, high*1.2, std, 0.001, format="%.3f", key=f"slider_{line_name}")
+            st.warning("⚠️ 目前處於手動輸入模式")
+
+        # 3. 判定與顯示
+        is_pass = low <= val <= high
+        is_ng_valid = val > 0.05 # 只要有東西在秤上(大於50g)就允許記 NG
+
+        status_cls = "status-pass" if is_pass else ("status-ng-ready" if is_ng_valid else "status-fail")
+        rem_qty = curr['預計數量'] - curr['已完成數量']
+        over_cls = "over-prod" if rem_qty < 0 else ""
+
+        # 顯示大儀表板 (修正數位顯示到小數點三位)
+        st.markdown(f"""
+            <div class="status-container {status_cls}">
+                <div class="countdown-box"><span class="countdown-label">剩餘數量</span><div class="countdown-val {over_cls}">{int(rem_qty)}</div></div>
+                <div class="weight-display digital-font">{val:.3f}</div>
+                <div style="font-size:1.5rem; font-weight:bold;">kg</div>
+            </div>""", unsafe_allow_html=True)
+
+        st.write("") # 間隔
+
+        # 4. 操作按鈕區
+        b_l, b_r = st.columns([3, 1])
+        with b_l:
+            st.button("🟢 紀錄良品 (PASS)", 
+                      disabled=not is_pass, 
+                      type="primary", 
+                      use_container_width=True, 
+                      on_click=do_pass, 
+                      args=(curr, val, line_name), 
+                      kwargs={"live": use_auto_scale, "low": low, "high": high},
+                      key=f"btn_pass_{line_name}")
+
+        with b_r:
+            st.button("🔴 紀錄 NG", 
+                      disabled=not is_ng_valid, 
+                      type="primary", 
+                      use_container_width=True, 
+                      on_click=do_ng, 
+                      args=(curr, val, line_name),
+                      kwargs={"live": use_auto_scale},
+                      key=f"btn_ng_{line_name}")
+
+        # 自動紀錄：每次由晃動轉為穩定 (stable_seq 變了) 且在規格內，只記一次
+        cap_key = f"cap_seq_{line_name}"
+        if auto_capture and scale.stable and scale.status == "ok" and is_pass and st.session_state.get(cap_key) != scale.stable_seq:
+            st.session_state[cap_key] = scale.stable_seq
+            do_pass(curr, val, line_name)
+            st.rerun()
+
+        if is_ng_valid and not is_pass:
+            st.selectbox("NG 原因說明", ["不足重尾數", "規格切換廢料", "外觀不良", "其他"], key=f"ng_sel_{line_name}")
+
+    @st.fragment(run_every=SYNC_REFRESH_S)
+    def queue_panel(line_name, curr_label):
+        # 隊列表格的進度欄：工單表換新 (完成數量變了) 時只重畫這張表
+        _, q_df, _ = line_queue(line_name)
+        if q_df.empty: return
+        def highlight_current(s):
+            return ['background-color: #d4e6f1' if str(s["客戶"]) in str(curr_label) else '' for v in s]
+
+        with prof.section("queue_styler"):
+            st.dataframe(q_df.style.apply(highlight_current, axis=1), use_container_width=True, hide_index=True)
+
+    @st.fragment(run_every=HISTORY_REFRESH_S)
+    def history_panel(line_name):
+        # 5. 歷史紀錄 (修正排版，確保隨時可見)
+        # 由最新的資料往回找，不用先篩選整段歷史 (資料由 orders_watch 的增量同步追加)
+        logs_buf = st.session_state.production_logs
+        last_idx, last_row = logs_buf.last(line_name)
+        # 統計數字來自彙總表 (寫入時維護)，不再從整段日誌重算
+        shift_stats = production_stats("班別", shift_key(line_name))
+        line_stats = production_stats("產線", line_name)
+        h_l, h_r = st.columns(2)
+        
+        with h_l:
+            st.markdown(f'<div class="history-header">✅ 良品紀錄 (最近5筆) ｜ 本班 {shift_stats["pass"]} 件 / {shift_stats["pass_weight"]:.1f} kg</div>', unsafe_allow_html=True)
+            st.dataframe(logs_buf.recent(5, 產線=line_name, 判定結果="PASS"), use_container_width=True, hide_index=True)
+        
+        with h_r:
+            top_ng = next(iter(shift_stats["ng_reasons"]), None)
+            top_ng = f"，最多: {top_ng or '未填'} {shift_stats['ng_reasons'][top_ng]} 件" if top_ng is not None else ""
+            st.markdown(f'<div class="history-header">🔴 NG 紀錄 (最近5筆) ｜ 本班 {shift_stats["ng"]} 件{top_ng}</div>', unsafe_allow_html=True)
+            st.dataframe(logs_buf.recent(5, 產線=line_name, 判定結果="NG"), use_container_width=True, hide_index=True)
+
+        if line_stats["pass"] or line_stats["ng"]:
+            st.caption(f"📊 {line_name} 累計：良品 {line_stats['pass']} 件 ({line_stats['pass_weight']:.1f} kg，"
+                       f"平均 {line_stats['pass_mean'] or 0:.3f} kg)、NG {line_stats['ng']} 件")
+
+        # 6. 撤銷功能
+        if st.button("↩️ 撤銷上一筆紀錄", type="primary", use_container_width=True, key=f"undo_{line_name}", disabled=last_row is None):
+            last_wo = last_row["工單號碼"]
+            is_last_pass = last_row["判定結果"] == "PASS"
+            # 增量同步不會再重讀舊資料，所以撤銷也要同步刪除 SQL 中的那一筆 (鍵值即 rowid)
+            # 真的刪到那一筆才扣完成數量：兩個畫面同時撤銷、或重繪前連點兩下都只會扣一次
+            # 刪不到又沒有作廢紀錄的，是已經被搬到月份封存檔 (log_archive) 的舊紀錄：不能撤銷，重新完整同步
+            removed, archived = True, False
+            if logs_buf.from_sql:
+                try:
+                    with db.write() as conn:
+                        removed = conn.execute("DELETE FROM production_logs WHERE rowid = ?", (int(last_idx),)).rowcount == 1
+                        if removed and is_last_pass:
+                            conn.execute("UPDATE work_orders SET 已完成數量 = 已完成數量 - 1 WHERE 工單號碼 = ? AND 已完成數量 > 0", (last_wo,))
+                        if not removed:
+                            archived = conn.execute("SELECT 1 FROM production_log_voids WHERE 序號 = ?", (int(last_idx),)).fetchone() is None
+                except Exception as e:
+                    st.error(f"SQL寫入失敗: {e}")
+                    removed = None
+                if archived:
+                    st.session_state.flash = f"⚠️ {line_name} 這筆紀錄已經封存，無法撤銷"
+                    st.session_state.pop("sync_log_rowid", None)
+                elif removed is False:
+                    st.session_state.flash = f"⚠️ {line_name} 這筆紀錄已經被撤銷過，完成數量未再扣除"
+            if removed and is_last_pass:
+                st.session_state.work_orders_db = update_order(st.session_state.work_orders_db, last_wo, 已完成數量=lambda s: s - 1)
+            logs_buf.remove(last_idx)
+            save_data()
+            st.rerun()
+
+    orders_watch()
     st.write("### 🏭 現場作業儀表板")
     op_tabs = st.tabs(PRODUCTION_LINES)
     
     for i, line_name in enumerate(PRODUCTION_LINES):
         with op_tabs[i]:
-            mask = (st.session_state.work_orders_db["狀態"].isin(["待生產", "生產中"])) & \
-                   (st.session_state.work_orders_db["產線"] == line_name)
-            pending = st.session_state.work_orders_db[mask].sort_values(by="排程順序")
+            pending, q_df, options_list = line_queue(line_name)
             curr = pending.iloc[0] if not pending.empty else None
             
             if not pending.empty:
                 st.markdown(f'<div class="queue-header">📋 {line_name} 生產隊列</div>', unsafe_allow_html=True)
-                if not st.session_state.products_db.empty:
-                      p_db = st.session_state.products_db.copy()
-                      queue_view = pending.merge(p_db, on="產品ID", how="left")
-                else: queue_view = pending.copy()
-                
-                q_df = pd.DataFrame()
-                q_df["序"] = range(1, len(queue_view) + 1)
-                
-                if "客戶名" in queue_view.columns:
-                    q_df["客戶"] = queue_view["客戶名"]
-                    q_df["溫度等級"] = queue_view["溫度等級"].astype(str)
-                    q_df["品種"] = queue_view["品種_x"]
-                    q_df["規格"] = queue_view.apply(lambda x: f"{format_size(x['長'])}x{format_size(x['寬'])}x{format_size(x['高'])}", axis=1)
-                    q_df["下限"] = queue_view["下限"].apply(lambda x: f"{float(x):.1f}" if pd.notna(x) else "-")
-                    q_df["準重"] = queue_view["準重_x"].apply(safe_format_weight)
-                    q_df["上限"] = queue_view["上限"].apply(lambda x: f"{float(x):.1f}" if pd.notna(x) else "-")
-                    q_df["備註1"] = queue_view["備註1"].fillna('')
-                    q_df["備註2"] = queue_view["備註2"].fillna('')
-                    q_df["備註3"] = queue_view["備註3"].fillna('')
-                else: q_df["內容"] = queue_view["詳細規格字串"]
-                
-                q_df["進度"] = queue_view.apply(lambda x: f"{int(x['已完成數量'])} / {int(x['預計數量'])}", axis=1)
-                
-                pending["temp_sort"] = range(1, len(pending) + 1)
-                pending["選單顯示"] = pending.apply(lambda x: f"【序{x['temp_sort']}】 {x['顯示內容']} (數:{int(x['預計數量'])})", axis=1)
-                options_list = pending["選單顯示"].tolist()
                 
                 col_sel, col_finish_btn = st.columns([3, 1])
                 with col_sel:
@@ -1076,9 +994,7 @@ elif menu == "現場：產線秤重作業":
                         current_idx = options_list.index(st.session_state[key_sel])
                     wo_label = st.selectbox("👇 切換當前任務", options=options_list, index=current_idx, key=key_sel)
                 
-                curr_row_list = [row for index, row in pending.iterrows() if f"【序{row['temp_sort']}】 {row['顯示內容']} (數:{int(row['預計數量'])})" == wo_label]
-                if curr_row_list: curr = curr_row_list[0]
-                else: curr = pending.iloc[0]
+                curr = pending.iloc[options_list.index(wo_label)] if wo_label in options_list else pending.iloc[0]
                 
                 
             # 判斷是否有當前工單
@@ -1092,16 +1008,12 @@ elif menu == "現場：產線秤重作業":
                         if st.button("🏁 生產結束", type="primary", use_container_width=True, key=f"fin_{line_name}"):
                             try:
                                 # 1. SQL 直接寫入 (確保資料庫更新)
-                                conn_btn = sqlite3.connect(SQL_DB_NAME, timeout=10)
-                                c_btn = conn_btn.cursor()
-                                c_btn.execute("UPDATE work_orders SET 狀態='已完成' WHERE 工單號碼=?", (curr["工單號碼"],))
-                                conn_btn.commit(); conn_btn.close()
+                                with db.write() as conn_btn:
+                                    conn_btn.execute("UPDATE work_orders SET 狀態='已完成' WHERE 工單號碼=?", (curr["工單號碼"],))
                                 
                                 # 2. 更新 Session State (讓畫面立刻反應)
-                                idx_list = st.session_state.work_orders_db.index[st.session_state.work_orders_db["工單號碼"] == curr["工單號碼"]].tolist()
-                                if idx_list:
-                                    st.session_state.work_orders_db.at[idx_list[0], "狀態"] = "已完成"
-                                    save_data() # 同步存入 CSV
+                                st.session_state.work_orders_db = update_order(st.session_state.work_orders_db, curr["工單號碼"], 狀態="已完成")
+                                save_data() # 同步存入 CSV
                                 
                                 # 3. 清除選單快取並重整
                                 if key_sel in st.session_state: del st.session_state[key_sel]
@@ -1111,15 +1023,11 @@ elif menu == "現場：產線秤重作業":
                         # (B) 🔴 取消/下錯單按鈕 (垂直排在下方)
                         if st.button("❌ 取消工單", type="secondary", use_container_width=True, key=f"can_{line_name}"):
                             try:
-                                conn_btn = sqlite3.connect(SQL_DB_NAME, timeout=10)
-                                c_btn = conn_btn.cursor()
-                                c_btn.execute("UPDATE work_orders SET 狀態='已取消' WHERE 工單號碼=?", (curr["工單號碼"],))
-                                conn_btn.commit(); conn_btn.close()
+                                with db.write() as conn_btn:
+                                    conn_btn.execute("UPDATE work_orders SET 狀態='已取消' WHERE 工單號碼=?", (curr["工單號碼"],))
 
-                                idx_list = st.session_state.work_orders_db.index[st.session_state.work_orders_db["工單號碼"] == curr["工單號碼"]].tolist()
-                                if idx_list:
-                                    st.session_state.work_orders_db.at[idx_list[0], "狀態"] = "已取消"
-                                    save_data()
+                                st.session_state.work_orders_db = update_order(st.session_state.work_orders_db, curr["工單號碼"], 狀態="已取消")
+                                save_data()
 
                                 if key_sel in st.session_state: del st.session_state[key_sel]
                                 st.toast(f"🗑️ {line_name} 工單已取消！"); time.sleep(0.5); st.rerun()
@@ -1130,10 +1038,7 @@ elif menu == "現場：產線秤重作業":
                     # ⚠️ 關鍵：這裡必須「往左縮排」，跳出 with col_finish_btn
                     # 這樣表格才會顯示在下方，並且是全寬的
                     # ========================================================
-                    def highlight_current(s):
-                        return ['background-color: #d4e6f1' if str(s["客戶"]) in str(curr["顯示內容"]) else '' for v in s]
-                    
-                    st.dataframe(q_df.style.apply(highlight_current, axis=1), use_container_width=True, hide_index=True)
+                    queue_panel(line_name, curr["顯示內容"])
                     st.divider()
                     try:
                         spec = st.session_state.products_db[st.session_state.products_db["產品ID"] == curr["產品ID"]].iloc[0]
@@ -1171,213 +1076,13 @@ elif menu == "現場：產線秤重作業":
                     # 修改後的秤重區塊
                     # --- 找到 with col_right: 之後的部分並替換 ---
                     with col_right:
-                        # 這是要放在 with col_right: 裡面的輔助函式
-                        def insert_log_to_sql(log_data):
-                            try:
-                                with sqlite3.connect(SQL_DB_NAME, timeout=10) as conn:
-                                    cursor = conn.cursor()
-                                    cursor.execute("""
-                                        INSERT INTO production_logs (時間, 產線, 工單號碼, 產品ID, 實測重, 判定結果, NG原因)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                                    """, log_data)
-                                    conn.commit()
-                            except Exception as e:
-                                st.error(f"SQL寫入失敗: {e}")
-
-                        def do_pass(c, v, ln):
-                            # 1. 更新主機端畫面上的工單數量
-                            idx = st.session_state.work_orders_db[st.session_state.work_orders_db["工單號碼"] == c["工單號碼"]].index[0]
-                            st.session_state.work_orders_db.at[idx, "已完成數量"] += 1
-                            st.session_state.work_orders_db.at[idx, "狀態"] = "生產中"
-                            
-                            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            log_values = (current_time, ln, c["工單號碼"], c["產品ID"], float(v), "PASS", "")
-                            
-                            # 2. 更新 Session (讓下面的表格立即顯示)
-                            new_log = pd.DataFrame([list(log_values)], columns=LOG_COLUMNS)
-                            st.session_state.production_logs = pd.concat([st.session_state.production_logs, new_log], ignore_index=True)
-                            
-                            # 3. 備份 CSV
-                            save_data()
-                            
-                            # 4. 【關鍵】直接寫入 SQL (不會覆蓋別人的資料)
-                            insert_log_to_sql(log_values)
-                            # 順便更新工單狀態 (數量) 到 SQL
-                            export_to_sql() 
-                            
-                            st.toast(f"✅ {ln} 良品紀錄成功: {v:.3f} kg")
-
-                        def do_ng(c, v, ln):
-                            reason = st.session_state.get(f"ng_sel_{ln}", "其他")
-                            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            log_values = (current_time, ln, c["工單號碼"], c["產品ID"], float(v), "NG", reason)
-                            
-                            # 1. 更新 Session
-                            new_log = pd.DataFrame([list(log_values)], columns=LOG_COLUMNS)
-                            st.session_state.production_logs = pd.concat([st.session_state.production_logs, new_log], ignore_index=True)
-                            
-                            # 2. 備份 CSV
-                            save_data()
-                            
-                            # 3. 【關鍵】直接寫入 SQL
-                            insert_log_to_sql(log_values)
-                            
-                            st.toast(f"🔴 {ln} NG 紀錄成功: {v:.3f} kg")
                         # 2. 獲取數據邏輯 (修正了自動/手動衝突)
                         use_auto_scale = st.toggle("🔌 連接實體磅秤", value=True, key=f"auto_{line_name}")
-                        
-                        if use_auto_scale:
-                            val = shared_data.weight - shared_data.offset
-                            last_ts = shared_data.last_update
-                            if last_ts > 0:
-                                update_str = datetime.fromtimestamp(last_ts).strftime('%H:%M:%S')
-                                st.info(f"🛰️ 磅秤連線中... 實測重量: {val:.3f} kg (同步: {update_str})")
-                            if shared_data.error:
-                                st.error(f"連線異常: {shared_data.error}")
-                            
-                            if st.button("⚖️ 歸零/去皮 (TARE)", key=f"tare_{line_name}", use_container_width=True):
-                                shared_data.offset = shared_data.weight
-                                st.rerun()
-                        else:
-                            # 手動模式：由 Slider 完全控制 val
-                            val = st.slider(f"⚖️ 手動調整重量", low*0.8, high*1.2, std, 0.001, format="%.3f", key=f"slider_{line_name}")
-                            st.warning("⚠️ 目前處於手動輸入模式")
-
-                        # 3. 判定與顯示
-                        is_pass = low <= val <= high
-                        is_ng_valid = val > 0.05 # 只要有東西在秤上(大於50g)就允許記 NG
-
-                        status_cls = "status-pass" if is_pass else ("status-ng-ready" if is_ng_valid else "status-fail")
-                        rem_qty = curr['預計數量'] - curr['已完成數量']
-                        over_cls = "over-prod" if rem_qty < 0 else ""
-
-                        # 顯示大儀表板 (修正數位顯示到小數點三位)
-                        st.markdown(f"""
-                            <div class="status-container {status_cls}">
-                                <div class="countdown-box"><span class="countdown-label">剩餘數量</span><div class="countdown-val {over_cls}">{int(rem_qty)}</div></div>
-                                <div class="weight-display digital-font">{val:.3f}</div>
-                                <div style="font-size:1.5rem; font-weight:bold;">kg</div>
-                            </div>""", unsafe_allow_html=True)
-
-                        st.write("") # 間隔
-
-                        # 4. 操作按鈕區
-                        b_l, b_r = st.columns([3, 1])
-                        with b_l:
-                            st.button("🟢 紀錄良品 (PASS)", 
-                                      disabled=not is_pass, 
-                                      type="primary", 
-                                      use_container_width=True, 
-                                      on_click=do_pass, 
-                                      args=(curr, val, line_name), 
-                                      key=f"btn_pass_{line_name}")
-
-                        with b_r:
-                            st.button("🔴 紀錄 NG", 
-                                      disabled=not is_ng_valid, 
-                                      type="primary", 
-                                      use_container_width=True, 
-                                      on_click=do_ng, 
-                                      args=(curr, val, line_name),
-                                      key=f"btn_ng_{line_name}")
-
-                        if is_ng_valid and not is_pass:
-                            st.selectbox("NG 原因說明", ["不足重尾數", "規格切換廢料", "外觀不良", "其他"], key=f"ng_sel_{line_name}")
-
+                        st.fragment(weight_panel, run_every=LIVE_REFRESH_S if use_auto_scale else None)(line_name, curr, low, std, high, use_auto_scale)
                         st.divider()
-
-                        # 5. 歷史紀錄 (修正排版，確保隨時可見)
-                        line_logs = st.session_state.production_logs[st.session_state.production_logs["產線"] == line_name]
-                        h_l, h_r = st.columns(2)
-                        
-                        with h_l:
-                            st.markdown('<div class="history-header">✅ 良品紀錄 (最近5筆)</div>', unsafe_allow_html=True)
-                            st.dataframe(line_logs[line_logs["判定結果"]=="PASS"].tail(5).sort_index(ascending=False), use_container_width=True, hide_index=True)
-                        
-                        with h_r:
-                            st.markdown('<div class="history-header">🔴 NG 紀錄 (最近5筆)</div>', unsafe_allow_html=True)
-                            st.dataframe(line_logs[line_logs["判定結果"]=="NG"].tail(5).sort_index(ascending=False), use_container_width=True, hide_index=True)
-
-                        # 6. 撤銷功能
-                        if st.button("↩️ 撤銷上一筆紀錄", type="primary", use_container_width=True, key=f"undo_{line_name}", disabled=line_logs.empty):
-                            last_idx = line_logs.index[-1]
-                            last_wo = line_logs.loc[last_idx, "工單號碼"]
-                            if line_logs.loc[last_idx, "判定結果"] == "PASS":
-                                wo_indices = st.session_state.work_orders_db.index[st.session_state.work_orders_db["工單號碼"] == last_wo].tolist()
-                                if wo_indices:
-                                    st.session_state.work_orders_db.at[wo_indices[0], "已完成數量"] -= 1
-                            st.session_state.production_logs = st.session_state.production_logs.drop(last_idx)
-                            save_data()
-                            st.rerun()
-                            
-                            # [v13.29 修改] 顯示全產線紀錄 (不隨工單清空)
-                            line_logs = st.session_state.production_logs[st.session_state.production_logs["產線"] == line_name]
-                            
-                            # 良品統計
-                            pass_all = line_logs[line_logs["判定結果"] == "PASS"]
-                            total_weight = 0.0
-                            if not pass_all.empty:
-                                wo_map = st.session_state.work_orders_db.set_index("工單號碼")["準重"].to_dict()
-                                for _, row in pass_all.iterrows():
-                                    w_std = wo_map.get(row["工單號碼"], 0)
-                                    total_weight += float(w_std)
-
-                            # NG 統計
-                            ng_all = line_logs[line_logs["判定結果"] == "NG"]
-                            total_ng = len(ng_all)
-
-                            with h_l:
-                                st.markdown(f'<div class="history-header">✅ 良品紀錄 (累計: {total_weight:.1f} kg)</div>', unsafe_allow_html=True)
-                                # 使用全產線紀錄
-                                c_logs = line_logs
-                                
-                                if not c_logs.empty: 
-                                    pass_df = c_logs[c_logs["判定結果"]=="PASS"].copy()
-                                    if not pass_df.empty:
-                                        pass_df = pass_df.reset_index(drop=True)
-                                        pass_df["序號"] = range(1, len(pass_df) + 1)
-                                        display_cols = ["序號", "時間", "實測重"]
-                                        st.dataframe(
-                                            pass_df[display_cols].sort_index(ascending=False), 
-                                            use_container_width=True, 
-                                            hide_index=True,
-                                            column_config={
-                                                "實測重": st.column_config.NumberColumn(format="%.1f")
-                                            }
-                                        )
-                                    else: st.info("尚無良品")
-                                else: st.info("尚無生產紀錄")
-                                    
-                            with h_r:
-                                st.markdown(f'<div class="history-header">🔴 NG 紀錄 (累計數量: {total_ng})</div>', unsafe_allow_html=True)
-                                if not c_logs.empty: 
-                                    ng_df = c_logs[c_logs["判定結果"]=="NG"].copy()
-                                    if not ng_df.empty:
-                                        ng_df = ng_df.reset_index(drop=True)
-                                        ng_df["序號"] = range(1, len(ng_df) + 1)
-                                        display_cols = ["序號", "時間", "NG原因"]
-                                        st.dataframe(ng_df[display_cols].sort_index(ascending=False), use_container_width=True, hide_index=True)
-                                    else: st.info("尚無NG品")
-                                else: st.info("尚無生產紀錄")
-                                
-                                st.markdown("---")
-                                # 撤銷功能：邏輯改為撤銷該產線最新的一筆
-                                def do_undo():
-                                    w = st.session_state.production_logs[st.session_state.production_logs["產線"] == line_name]
-                                    if not w.empty:
-                                        last = w.index[-1]
-                                        last_wo = w.loc[last, "工單號碼"]
-                                        # 嘗試回扣工單數量
-                                        idx_list = st.session_state.work_orders_db.index[st.session_state.work_orders_db["工單號碼"] == last_wo].tolist()
-                                        if idx_list:
-                                            idx = idx_list[0]
-                                            if w.loc[last, "判定結果"] == "PASS":
-                                                if st.session_state.work_orders_db.at[idx, "已完成數量"] > 0:
-                                                    st.session_state.work_orders_db.at[idx, "已完成數量"] -= 1
-                                        
-                                        st.session_state.production_logs = st.session_state.production_logs.drop(last)
-                                        save_data(); st.toast("↩️ 已撤銷上一筆紀錄")
-                            
-                            st.button("↩️ 撤銷", type="primary", disabled=c_logs.empty, use_container_width=True, on_click=do_undo, key=f"undo_{line_name}")
+                        history_panel(line_name)
             else:
-                st.info(f"💤 {line_name} 目前閒置中，請至後台加入排程。")
\ No newline at end of file
+                st.info(f"💤 {line_name} 目前閒置中，請至後台加入排程。")
+        prof.lap(f"render.{line_name}")
+
+prof.finish()
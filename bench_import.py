@@ -0,0 +1,86 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from factory_core import DENSITY_MAP, SPECIAL_VARIETIES, ALL_VARIETIES, PRODUCT_COLUMNS
+from product_import import calc_weights, prepare_import, FIXED_WEIGHT_COL, SPECIAL_UPPER_KG
+
+# ==========================================
+# 產品重量計算壓測：確認 calc_weights / prepare_import 與舊版逐列公式相同，並量整批匯入的耗時
+# 用法: python bench_import.py [筆數]
+# ==========================================
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 3
+
+def legacy_row(row, density, special, fixed):
+    """舊版建檔表格的逐列公式 (對照組)；算不出來時回傳 None"""
+    if special:
+        return fixed, fixed, fixed + SPECIAL_UPPER_KG
+    if row["長"] > 0 and row["寬"] > 0 and row["高"] > 0 and density in DENSITY_MAP:
+        vol = (row["長"] / 1000) * (row["寬"] / 1000) * (row["高"] / 1000)
+        d_min, d_max = DENSITY_MAP[density]
+        return round(vol * density, 3), round(vol * d_min, 1), round(vol * d_max, 1)
+    return None
+
+def make_file(n, seed=0):
+    """模擬上傳的檔案：全部是字串，混進非整數 / 不在清單內的密度、缺尺寸、特殊品種"""
+    rng = np.random.default_rng(seed)
+    dens = rng.choice(list(DENSITY_MAP) + [65, 64.5], n)
+    dims = rng.integers(0, 1200, (n, 3))
+    return pd.DataFrame({
+        "客戶名": [f"C{i % 50}" for i in range(n)],
+        "品種": rng.choice(ALL_VARIETIES, n),
+        "密度": [f"{d:g}" if i % 3 else f"{d:.1f}" for i, d in enumerate(dens)],   # "64" / "64.0" / "64.5"
+        "長": dims[:, 0].astype(str), "寬": dims[:, 1].astype(str), "高": dims[:, 2].astype(str),
+        FIXED_WEIGHT_COL: rng.integers(1, 30, n).astype(str),
+        "備註1": [f"R{i}" for i in range(n)],
+    })
+
+def check(sample):
+    # 建檔表格：整批指定密度 / 特殊品種
+    editor = sample[["長", "寬", "高"]].astype(float).assign(準重=0.0, 下限=0.0, 上限=0.0)
+    for density, special, fixed in ((64, False, None), (256, False, None), (None, True, 12.5)):
+        got = calc_weights(editor, density=density, fixed_weight=fixed, special=special)
+        for i, row in editor.iterrows():
+            want = legacy_row(row, density, special, fixed)
+            assert tuple(got.loc[i, ["準重", "下限", "上限"]]) == (want or (0.0, 0.0, 0.0)), (i, density, special)
+
+    # 批次匯入：每列自己的密度；可匯入的列重量要與逐列公式相同，非整數密度不能被四捨五入收進來
+    products, skipped = prepare_import(sample, pd.DataFrame(columns=PRODUCT_COLUMNS))
+    assert len(products) + len(skipped) == len(sample)
+    src = sample.set_index("備註1")
+    for _, p in products.iterrows():
+        row = src.loc[p["備註1"]]
+        special = row["品種"] in SPECIAL_VARIETIES
+        dims = {c: float(row[c]) for c in ("長", "寬", "高")}
+        density = None if special else float(row["密度"])
+        assert special or density.is_integer(), row["密度"]
+        want = legacy_row(dims, int(density) if density else None, special, float(row[FIXED_WEIGHT_COL]))
+        assert want and tuple(float(p[c]) for c in ("準重", "下限", "上限")) == want, (p["備註1"], want)
+        assert p["密度"] == ("N/A" if special else int(density))
+    bad = ~src["品種"].isin(SPECIAL_VARIETIES) & (pd.to_numeric(src["密度"]) % 1 != 0)
+    assert not products["備註1"].isin(src.index[bad]).any()
+    return len(products), len(skipped)
+
+def best_of(fn, *args):
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    kept, skipped = check(make_file(n, seed=1))
+    print(f"結果與逐列公式一致 ✅  ({n} 列：匯入 {kept}、略過 {skipped})")
+
+    empty = pd.DataFrame(columns=PRODUCT_COLUMNS)
+    print(f"{'筆數':>8} {'calc_weights ms':>16} {'prepare_import ms':>18} {'µs/筆':>8}")
+    for size in SIZES:
+        df = make_file(size)
+        calc_t, prep_t = best_of(calc_weights, df), best_of(prepare_import, df, empty)
+        print(f"{size:>8} {calc_t * 1e3:>16.2f} {prep_t * 1e3:>18.2f} {prep_t / size * 1e6:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from factory_core import normalize_sequences
+
+# ==========================================
+# normalize_sequences 壓測：確認結果與舊版逐產線 concat 相同，且耗時隨筆數線性成長
+# 用法: python bench_normalize.py [產線數]
+# ==========================================
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 5
+
+def legacy_normalize(df):
+    """舊版實作 (對照組)；同號時改用 stable 排序，結果才有唯一答案可以比對"""
+    if df.empty: return df
+    df = df.reset_index(drop=True)
+    new_df = pd.DataFrame()
+    for line in df['產線'].unique():
+        line_df = df[df['產線'] == line].sort_values(by='排程順序', kind="stable")
+        line_df['排程順序'] = range(1, len(line_df) + 1)
+        new_df = pd.concat([new_df, line_df])
+    return new_df
+
+def make_orders(n, lines, seed=0):
+    rng = np.random.default_rng(seed)
+    seq = rng.integers(1, n // lines + 2, n).astype(float)
+    seq[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({
+        "工單號碼": [f"WO-{i:06d}" for i in range(n)],
+        "產線": [f"Line {k}" for k in rng.integers(1, lines + 1, n)],
+        "排程順序": seq,
+        "狀態": "待生產",
+    })
+
+def best_of(fn, df):
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    sample = make_orders(5_000, lines, seed=1)
+    pd.testing.assert_frame_equal(normalize_sequences(sample), legacy_normalize(sample), check_dtype=False)
+    print(f"結果與舊版一致 ✅  (產線數 {lines})")
+
+    print(f"{'筆數':>8} {'新版 ms':>10} {'µs/筆':>8} {'舊版 ms':>10} {'倍數':>6}")
+    for n in SIZES:
+        df = make_orders(n, lines)
+        new_t, old_t = best_of(normalize_sequences, df), best_of(legacy_normalize, df)
+        print(f"{n:>8} {new_t * 1e3:>10.2f} {new_t / n * 1e6:>8.3f} {old_t * 1e3:>10.2f} {old_t / new_t:>6.1f}")
+
+if __name__ == "__main__":
+    main()
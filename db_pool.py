@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# SQLite 共用連線池 (WAL 模式)
+# - 讀取：每條執行緒借用自己的唯讀連線，用完歸還，讀者之間、讀者與寫入者互不阻塞
+# - 寫入：整個程序只有一條寫入連線，用鎖排隊，程序內不會再出現 "database is locked"
+# ==========================================
+BUSY_TIMEOUT_MS = 5000
+MAX_IDLE_READERS = 8
+
+PRAGMAS = {
+    "synchronous": "NORMAL",      # WAL 下 NORMAL 已可保證不損毀，只是斷電可能少最後幾筆
+    "cache_size": -16000,         # 負數 = KB，約 16 MB 頁快取
+    "mmap_size": 268435456,       # 256 MB 記憶體映射讀取
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+class SQLitePool:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._idle_readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        # 選用的監控回呼 observer(事件, 秒數)：wait = 排隊拿寫入鎖 + BEGIN IMMEDIATE、commit、busy (被其他程序鎖住而失敗)
+        self.observer = None
+
+    def _connect(self, readonly):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for key, val in PRAGMAS.items():
+            conn.execute(f"PRAGMA {key} = {val}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _get_writer(self):
+        if self._writer is None:
+            self._writer = self._connect(readonly=False)
+            # journal_mode 會寫進資料庫檔案，設定一次之後所有連線 (含其他程序) 都是 WAL
+            self._writer.execute("PRAGMA journal_mode = WAL")
+        return self._writer
+
+    def _ensure_wal(self):
+        # 第一次讀取前先確保資料庫已切到 WAL，否則唯讀連線會沿用舊的 rollback journal
+        if self._writer is None:
+            with self._write_lock:
+                self._get_writer()
+
+    @contextmanager
+    def read(self):
+        """借一條唯讀連線；同一時間只會有一條執行緒使用它"""
+        with self._readers_lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+        if conn is None:
+            self._ensure_wal()
+            conn = self._connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction: conn.rollback()
+            with self._readers_lock:
+                if len(self._idle_readers) < MAX_IDLE_READERS:
+                    self._idle_readers.append(conn)
+                    conn = None
+            if conn is not None: conn.close()
+
+    @contextmanager
+    def write(self, transaction=True):
+        """取得唯一的寫入連線。transaction=True 時包成 BEGIN IMMEDIATE ... COMMIT，出錯自動 ROLLBACK；
+        transaction=False 只排隊拿連線，交易由呼叫端自己控制 (例如資料庫遷移)"""
+        observer = self.observer
+        t0 = time.perf_counter()
+        with self._write_lock:
+            conn = self._get_writer()
+            if not transaction:
+                yield conn
+                return
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                if observer is not None: observer("busy", time.perf_counter() - t0)
+                raise
+            if observer is not None: observer("wait", time.perf_counter() - t0)
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            t1 = time.perf_counter()
+            conn.commit()
+            if observer is not None: observer("commit", time.perf_counter() - t1)
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._idle_readers: conn.close()
+            self._idle_readers.clear()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path):
+    """同一個程序、同一個資料庫檔只會有一個連線池 (Streamlit 每次 rerun 重新執行腳本也拿到同一個)"""
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = SQLitePool(db_path)
+        return _pools[db_path]
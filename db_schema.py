@@ -0,0 +1,386 @@
+# ==========================================
+# factory_data.db 資料表結構與版本遷移
+# 版本號記錄在 PRAGMA user_version，每個遷移步驟只會執行一次
+# ==========================================
+
+PRODUCT_TABLE_SQL = """
+    CREATE TABLE {name} (
+        "產品ID" TEXT PRIMARY KEY, "客戶名" TEXT, "溫度等級" TEXT, "品種" TEXT,
+        "密度" REAL, "長" REAL, "寬" REAL, "高" REAL, "下限" REAL,
+        "準重" REAL, "上限" REAL, "備註1" TEXT, "備註2" TEXT, "備註3" TEXT
+    )"""
+
+ORDER_TABLE_SQL = """
+    CREATE TABLE {name} (
+        "產線" TEXT, "排程順序" INTEGER, "工單號碼" TEXT PRIMARY KEY, "產品ID" TEXT,
+        "顯示內容" TEXT, "品種" TEXT, "密度" REAL, "準重" REAL,
+        "預計數量" INTEGER, "已完成數量" INTEGER, "狀態" TEXT, "建立時間" TEXT
+    )"""
+
+# 序號 = rowid 的別名；AUTOINCREMENT 保證撤銷刪掉最後一筆後序號也不會被重用 (增量同步靠它當水位線)
+LOG_TABLE_SQL = """
+    CREATE TABLE {name} (
+        "序號" INTEGER PRIMARY KEY AUTOINCREMENT,
+        "時間" TEXT, "產線" TEXT, "工單號碼" TEXT, "產品ID" TEXT,
+        "實測重" REAL, "判定結果" TEXT, "NG原因" TEXT
+    )"""
+
+PRODUCT_COLS = ["產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", "下限", "準重", "上限", "備註1", "備註2", "備註3"]
+ORDER_COLS = ["產線", "排程順序", "工單號碼", "產品ID", "顯示內容", "品種", "密度", "準重", "預計數量", "已完成數量", "狀態", "建立時間"]
+LOG_COLS = ["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"]
+
+def _quote(cols):
+    return ", ".join(f'"{c}"' for c in cols)
+
+def _table_exists(cursor, name):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+def _rebuild(cursor, name, create_sql, cols, keep_rowid=False):
+    """依新結構重建資料表並搬移資料 (SQLite 不能 ALTER 主鍵，只能建新表再改名)
+    重複的主鍵以最後寫入的那筆為準"""
+    cursor.execute(create_sql.format(name=f"{name}_new"))
+    if _table_exists(cursor, name):
+        old_cols = {r[1] for r in cursor.execute(f'PRAGMA table_info("{name}")')}
+        src = [f'"{c}"' if c in old_cols else "NULL" for c in cols]
+        dst = _quote(cols)
+        if keep_rowid:
+            dst, src = '"序號", ' + dst, ["rowid"] + src
+        cursor.execute(f'INSERT OR REPLACE INTO {name}_new ({dst}) SELECT {", ".join(src)} FROM "{name}" ORDER BY rowid')
+        cursor.execute(f'DROP TABLE "{name}"')
+    cursor.execute(f'ALTER TABLE {name}_new RENAME TO {name}')
+
+def ensure_sync_journal(cursor):
+    """建立工單異動日誌與觸發器 (給網頁端增量同步用)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS work_order_changes (
+            "序號" INTEGER PRIMARY KEY AUTOINCREMENT, "工單號碼" TEXT
+        )""")
+    for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_work_orders_{event.lower()}
+            AFTER {event} ON work_orders
+            BEGIN
+                INSERT INTO work_order_changes (工單號碼) VALUES ({ref}.工單號碼);
+            END""")
+
+# ------------------------------------------
+# 遷移步驟：(版本, 函式)，只能往後加，不能修改已發佈的步驟
+# ------------------------------------------
+def _v1_base_tables(cursor):
+    # 舊版 init_db 的三張表；已存在時保持原樣，由 v2 統一改建
+    if not _table_exists(cursor, "production_logs"):
+        cursor.execute(LOG_TABLE_SQL.format(name="production_logs"))
+    if not _table_exists(cursor, "work_orders"):
+        cursor.execute(ORDER_TABLE_SQL.format(name="work_orders"))
+    if not _table_exists(cursor, "products"):
+        cursor.execute(PRODUCT_TABLE_SQL.format(name="products"))
+
+def _v2_keys_and_indexes(cursor):
+    # pandas to_sql(replace) 建出來的表沒有主鍵，這裡重建成有主鍵的正式結構
+    _rebuild(cursor, "products", PRODUCT_TABLE_SQL, PRODUCT_COLS)
+    _rebuild(cursor, "work_orders", ORDER_TABLE_SQL, ORDER_COLS)
+    log_cols = {r[1] for r in cursor.execute('PRAGMA table_info("production_logs")')}
+    if "序號" not in log_cols:
+        _rebuild(cursor, "production_logs", LOG_TABLE_SQL, LOG_COLS, keep_rowid=True)
+
+    # 派單查詢 / 工單計數 / 日誌依產線時間排序 都靠這幾個索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_work_orders_queue ON work_orders ("產線", "狀態", "排程順序")')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_line_time ON production_logs ("產線", "時間")')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_order ON production_logs ("工單號碼")')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_time ON production_logs ("時間")')
+
+    # 重建 work_orders 會把觸發器一起刪掉，補回來並通知所有網頁完整重讀一次
+    ensure_sync_journal(cursor)
+    cursor.execute("INSERT INTO work_order_changes (工單號碼) VALUES (NULL)")
+
+def _when(*conds):
+    conds = [c for c in conds if c]
+    return f"WHEN {' AND '.join(conds)}" if conds else ""
+
+def _voids_trigger_sql(guard=None):
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_production_logs_delete
+        AFTER DELETE ON production_logs
+        {_when(guard)}
+        BEGIN
+            INSERT OR IGNORE INTO production_log_voids (序號) VALUES (OLD.序號);
+        END"""
+
+def _v3_log_voids(cursor):
+    # 撤銷 (刪除) 過的日誌序號：CSV 流水帳只能追加，匯出時靠這張表略過已撤銷的紀錄
+    cursor.execute('CREATE TABLE IF NOT EXISTS production_log_voids ("序號" INTEGER PRIMARY KEY)')
+    cursor.execute(_voids_trigger_sql())
+
+def _v4_id_sequences(cursor):
+    # 流水號發號表 (例如 工單號碼 WO-月日 -> 已發到第幾號)，在寫入交易內遞增，多程序同時加單也不會撞號
+    cursor.execute('CREATE TABLE IF NOT EXISTS id_sequences ("名稱" TEXT PRIMARY KEY, "值" INTEGER NOT NULL)')
+
+# ------------------------------------------
+# 生產統計彙總 (v5)：由 production_logs 的觸發器在同一個交易內加減
+# 範圍：工單 (鍵=工單號碼)、產線 (鍵=產線)、班別 (鍵=產線|班別開始時間)
+# ------------------------------------------
+SHIFT_STARTS = ("08:00:00", "20:00:00")   # 班別開始時間；跨午夜的班別算在開始那天。修改時要另加遷移步驟重建觸發器
+
+def shift_start_sql(col):
+    """時間欄位 -> 所屬班別的開始時間 ('2026-01-21 20:00:00')，與 production_stats.shift_start 相同規則"""
+    starts = sorted(SHIFT_STARTS)
+    whens = " ".join(f"WHEN time({col}) >= '{s}' THEN date({col}) || ' {s}'" for s in reversed(starts))
+    return f"(CASE {whens} ELSE date({col}, '-1 day') || ' {starts[-1]}' END)"
+
+STAT_SCOPES = {
+    "工單": "COALESCE({r}.工單號碼, '')",
+    "產線": "COALESCE({r}.產線, '')",
+    "班別": "COALESCE({r}.產線, '') || '|' || " + shift_start_sql("{r}.時間"),
+}
+# 撤銷後重算首筆 / 末筆時間用的條件 (都走得到 idx_logs_order / idx_logs_line_time)
+_STAT_MATCH = {
+    "工單": "工單號碼 = OLD.工單號碼",
+    "產線": "產線 = OLD.產線",
+    "班別": f"產線 = OLD.產線 AND 時間 >= {shift_start_sql('OLD.時間')} AND {shift_start_sql('時間')} = {shift_start_sql('OLD.時間')}",
+}
+
+def _v5_production_stats(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS production_stats (
+            "範圍" TEXT NOT NULL, "鍵" TEXT NOT NULL,
+            "PASS數" INTEGER NOT NULL DEFAULT 0, "NG數" INTEGER NOT NULL DEFAULT 0,
+            "PASS重量" REAL NOT NULL DEFAULT 0, "NG重量" REAL NOT NULL DEFAULT 0,
+            "首筆時間" TEXT, "末筆時間" TEXT,
+            PRIMARY KEY ("範圍", "鍵")
+        )""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS production_stats_ng (
+            "範圍" TEXT NOT NULL, "鍵" TEXT NOT NULL, "NG原因" TEXT NOT NULL, "數量" INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ("範圍", "鍵", "NG原因")
+        )""")
+
+    # 既有日誌一次補算
+    for scope, key in STAT_SCOPES.items():
+        key = key.format(r="l")
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO production_stats
+            SELECT '{scope}', {key},
+                   SUM(判定結果 = 'PASS'), SUM(判定結果 = 'NG'),
+                   SUM(CASE WHEN 判定結果 = 'PASS' THEN COALESCE(實測重, 0) ELSE 0 END),
+                   SUM(CASE WHEN 判定結果 = 'NG' THEN COALESCE(實測重, 0) ELSE 0 END),
+                   MIN(時間), MAX(時間)
+            FROM production_logs l GROUP BY 2""")
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO production_stats_ng
+            SELECT '{scope}', {key}, COALESCE(NG原因, ''), COUNT(*)
+            FROM production_logs l WHERE 判定結果 = 'NG' GROUP BY 2, 3""")
+
+    on_insert = []
+    for scope, key in STAT_SCOPES.items():
+        new_key = key.format(r="NEW")
+        on_insert.append(f"""
+            INSERT INTO production_stats ("範圍", "鍵", "PASS數", "NG數", "PASS重量", "NG重量", "首筆時間", "末筆時間")
+            VALUES ('{scope}', {new_key}, NEW.判定結果 = 'PASS', NEW.判定結果 = 'NG',
+                    CASE WHEN NEW.判定結果 = 'PASS' THEN COALESCE(NEW.實測重, 0) ELSE 0 END,
+                    CASE WHEN NEW.判定結果 = 'NG' THEN COALESCE(NEW.實測重, 0) ELSE 0 END,
+                    NEW.時間, NEW.時間)
+            ON CONFLICT ("範圍", "鍵") DO UPDATE SET
+                "PASS數" = "PASS數" + excluded."PASS數", "NG數" = "NG數" + excluded."NG數",
+                "PASS重量" = "PASS重量" + excluded."PASS重量", "NG重量" = "NG重量" + excluded."NG重量",
+                "首筆時間" = COALESCE(MIN("首筆時間", excluded."首筆時間"), "首筆時間", excluded."首筆時間"),
+                "末筆時間" = COALESCE(MAX("末筆時間", excluded."末筆時間"), "末筆時間", excluded."末筆時間");
+            INSERT INTO production_stats_ng ("範圍", "鍵", "NG原因", "數量")
+            SELECT '{scope}', {new_key}, COALESCE(NEW.NG原因, ''), 1 WHERE NEW.判定結果 = 'NG'
+            ON CONFLICT ("範圍", "鍵", "NG原因") DO UPDATE SET "數量" = "數量" + 1;""")
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_production_stats_insert
+        AFTER INSERT ON production_logs
+        BEGIN {"".join(on_insert)}
+        END""")
+    cursor.execute(_stats_delete_trigger_sql())
+
+def _stat_bounds(scope):
+    return f"""("首筆時間", "末筆時間") = (SELECT MIN(時間), MAX(時間) FROM production_logs WHERE {_STAT_MATCH[scope]})"""
+
+def _stats_delete_trigger_sql(guard=None, bounds=_stat_bounds):
+    on_delete = []
+    for scope, key in STAT_SCOPES.items():
+        old_key = key.format(r="OLD")
+        on_delete.append(f"""
+            UPDATE production_stats SET
+                "PASS數" = "PASS數" - (OLD.判定結果 = 'PASS'), "NG數" = "NG數" - (OLD.判定結果 = 'NG'),
+                "PASS重量" = "PASS重量" - CASE WHEN OLD.判定結果 = 'PASS' THEN COALESCE(OLD.實測重, 0) ELSE 0 END,
+                "NG重量" = "NG重量" - CASE WHEN OLD.判定結果 = 'NG' THEN COALESCE(OLD.實測重, 0) ELSE 0 END,
+                {bounds(scope)}
+            WHERE "範圍" = '{scope}' AND "鍵" = {old_key};
+            UPDATE production_stats_ng SET "數量" = "數量" - 1
+            WHERE OLD.判定結果 = 'NG' AND "範圍" = '{scope}' AND "鍵" = {old_key} AND "NG原因" = COALESCE(OLD.NG原因, '');""")
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_production_stats_delete
+        AFTER DELETE ON production_logs
+        {_when(guard)}
+        BEGIN {"".join(on_delete)}
+        END"""
+
+# ------------------------------------------
+# SPC 快照 (v6)：背景維護的 leader 計算，各 worker 的 /spc 都讀這張表，回應不會因 worker 而不同
+# 範圍：產線 (鍵=產線) / 工單 (鍵=工單號碼)；內容為 JSON (統計摘要 + 管制圖點)
+# ------------------------------------------
+def _v6_spc_snapshots(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS spc_snapshots (
+            "範圍" TEXT NOT NULL, "鍵" TEXT NOT NULL, "內容" TEXT NOT NULL, "更新時間" TEXT,
+            PRIMARY KEY ("範圍", "鍵")
+        )""")
+
+# ------------------------------------------
+# 時段彙總 (v7)：分 / 時 / 日 × 產線 / 工單 / 產品；由 log_rollup 依水位線 (id_sequences) 增量累加
+# 撤銷已彙總過的紀錄時，觸發器在同一個交易內把該筆從三種時段扣掉
+# ------------------------------------------
+ROLLUP_GRAINS = {"分": (16, ":00"), "時": (13, ":00:00"), "日": (10, " 00:00:00")}   # 時間取前 n 字 + 補齊成時段開始時間
+ROLLUP_WATERMARK = "production_rollups"    # id_sequences 中記錄已彙總到哪個序號
+
+def rollup_bucket_sql(grain, col):
+    n, pad = ROLLUP_GRAINS[grain]
+    return f"(substr({col}, 1, {n}) || '{pad}')"
+
+def _v7_production_rollups(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS production_rollups (
+            "粒度" TEXT NOT NULL, "時段" TEXT NOT NULL,
+            "產線" TEXT NOT NULL, "工單號碼" TEXT NOT NULL, "產品ID" TEXT NOT NULL,
+            "筆數" INTEGER NOT NULL DEFAULT 0, "PASS數" INTEGER NOT NULL DEFAULT 0, "NG數" INTEGER NOT NULL DEFAULT 0,
+            "PASS重量" REAL NOT NULL DEFAULT 0, "NG重量" REAL NOT NULL DEFAULT 0,
+            "最小重" REAL, "最大重" REAL,
+            PRIMARY KEY ("粒度", "時段", "產線", "工單號碼", "產品ID")
+        )""")
+    # 既有日誌不在遷移內補算 (可能有數百萬筆)，交給 log_rollup 從水位線 0 分批追上
+    cursor.execute(_rollup_delete_trigger_sql())
+
+def _rollup_delete_trigger_sql(guard=None):
+    on_delete = []
+    for grain, (n, _) in ROLLUP_GRAINS.items():
+        on_delete.append(f"""
+            UPDATE production_rollups SET
+                "筆數" = "筆數" - 1,
+                "PASS數" = "PASS數" - (OLD.判定結果 = 'PASS'), "NG數" = "NG數" - (OLD.判定結果 = 'NG'),
+                "PASS重量" = "PASS重量" - CASE WHEN OLD.判定結果 = 'PASS' THEN COALESCE(OLD.實測重, 0) ELSE 0 END,
+                "NG重量" = "NG重量" - CASE WHEN OLD.判定結果 = 'NG' THEN COALESCE(OLD.實測重, 0) ELSE 0 END,
+                ("最小重", "最大重") = (
+                    SELECT MIN(實測重), MAX(實測重) FROM production_logs
+                    WHERE 產線 = OLD.產線 AND 時間 >= {rollup_bucket_sql(grain, "OLD.時間")} AND 時間 < substr(OLD.時間, 1, {n}) || '~'
+                      AND COALESCE(工單號碼, '') = COALESCE(OLD.工單號碼, '') AND COALESCE(產品ID, '') = COALESCE(OLD.產品ID, '')
+                      AND 序號 <= (SELECT "值" FROM id_sequences WHERE "名稱" = '{ROLLUP_WATERMARK}'))
+            WHERE "粒度" = '{grain}' AND "時段" = {rollup_bucket_sql(grain, "OLD.時間")}
+              AND "產線" = COALESCE(OLD.產線, '') AND "工單號碼" = COALESCE(OLD.工單號碼, '') AND "產品ID" = COALESCE(OLD.產品ID, '');""")
+    rolled_up = f"""OLD.序號 <= (SELECT "值" FROM id_sequences WHERE "名稱" = '{ROLLUP_WATERMARK}')"""
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_production_rollups_delete
+        AFTER DELETE ON production_logs
+        {_when(rolled_up, guard)}
+        BEGIN {"".join(on_delete)}
+        END"""
+
+# ------------------------------------------
+# 冷熱分區 (v8)：封存搬走的紀錄不是「撤銷」，刪除時不能記成作廢、也不能從統計 / 時段彙總扣掉
+# log_archive 在同一個寫入交易內先寫入旗標列、刪除、再移除旗標，其他連線看不到旗標
+# 撤銷時統計的首筆 / 末筆時間只在熱資料庫重算得準的情況才重算 (見 _archived_stat_bounds)
+# ------------------------------------------
+ARCHIVE_FLAG = "archiving"     # id_sequences 中的旗標列名稱
+NOT_ARCHIVING = f"""NOT EXISTS (SELECT 1 FROM id_sequences WHERE "名稱" = '{ARCHIVE_FLAG}')"""
+ARCHIVED_UNTIL = "archived_until"     # id_sequences 中記錄已封存紀錄最晚的 時間 (unix 秒)，統計觸發器用
+_ARCHIVED_UNTIL_SQL = f"""(SELECT "值" FROM id_sequences WHERE "名稱" = '{ARCHIVED_UNTIL}')"""
+
+def _after_archived(col):
+    """col 晚於所有已封存紀錄 (從沒封存過也算)；時間格式無法解析時當作不是"""
+    return f"COALESCE(CAST(strftime('%s', {col}) AS INTEGER) > {_ARCHIVED_UNTIL_SQL}, {_ARCHIVED_UNTIL_SQL} IS NULL)"
+
+def _archived_stat_bounds(scope):
+    # 首筆 / 末筆時間只在刪掉的正是那一筆時才重算，而且只看熱資料庫：
+    # - 首筆晚於已封存範圍 = 這個範圍沒有紀錄被封存，熱資料庫重算是準的；否則首筆保留原值
+    # - 有紀錄被封存時，末筆只採用晚於封存範圍的熱資料庫最晚一筆，找不到就保留原值 (封存檔裡可能有更晚的)
+    hot_only = _after_archived('"首筆時間"')
+    return f"""
+                "首筆時間" = CASE WHEN OLD.時間 = "首筆時間" AND {hot_only}
+                    THEN (SELECT MIN(時間) FROM production_logs WHERE {_STAT_MATCH[scope]}) ELSE "首筆時間" END,
+                "末筆時間" = CASE WHEN OLD.時間 IS NOT "末筆時間" THEN "末筆時間"
+                    WHEN {hot_only} THEN (SELECT MAX(時間) FROM production_logs WHERE {_STAT_MATCH[scope]})
+                    ELSE COALESCE((SELECT m FROM (SELECT MAX(時間) AS m FROM production_logs WHERE {_STAT_MATCH[scope]})
+                                   WHERE {_after_archived("m")}), "末筆時間") END"""
+
+def _v8_archive_guard(cursor):
+    for name, sql in (("trg_production_logs_delete", _voids_trigger_sql(NOT_ARCHIVING)),
+                      ("trg_production_stats_delete", _stats_delete_trigger_sql(NOT_ARCHIVING, _archived_stat_bounds)),
+                      ("trg_production_rollups_delete", _rollup_delete_trigger_sql(NOT_ARCHIVING))):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+
+MIGRATIONS = [
+    (1, _v1_base_tables),
+    (2, _v2_keys_and_indexes),
+    (3, _v3_log_voids),
+    (4, _v4_id_sequences),
+    (5, _v5_production_stats),
+    (6, _v6_spc_snapshots),
+    (7, _v7_production_rollups),
+    (8, _v8_archive_guard),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    """把資料庫升級到最新版本，回傳升級後的版本號 (多個程序同時呼叫也安全)"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, step in MIGRATIONS:
+        if version >= target: continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # 取得寫入鎖後再確認一次，避免兩個程序重複執行同一步
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version < target:
+                step(cursor)
+                cursor.execute(f"PRAGMA user_version = {target}")
+                version = target
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
+
+# ------------------------------------------
+# 針對性寫入：只寫有變動的列，取代 to_sql(if_exists='replace')
+# ------------------------------------------
+def upsert_rows(cursor, table, key, cols, rows):
+    """INSERT ... ON CONFLICT DO UPDATE；內容完全相同的列不會被更新 (也不會觸發異動日誌)"""
+    if not rows: return
+    others = [c for c in cols if c != key]
+    assign = ", ".join(f'"{c}" = excluded."{c}"' for c in others)
+    changed = " OR ".join(f'"{table}"."{c}" IS NOT excluded."{c}"' for c in others)
+    cursor.executemany(f"""
+        INSERT INTO "{table}" ({_quote(cols)}) VALUES ({", ".join("?" * len(cols))})
+        ON CONFLICT("{key}") DO UPDATE SET {assign}
+        WHERE {changed}
+    """, rows)
+
+def delete_missing(cursor, table, key, keep_ids):
+    """刪除資料庫中有、但目前資料裡已經沒有的列"""
+    keep = set(keep_ids)
+    gone = [r[0] for r in cursor.execute(f'SELECT "{key}" FROM "{table}"') if r[0] not in keep]
+    cursor.executemany(f'DELETE FROM "{table}" WHERE "{key}" = ?', [(g,) for g in gone])
+    return len(gone)
+
+# ------------------------------------------
+# 啟動時的資料庫準備 (API 服務與網頁端都會呼叫，重複執行沒有副作用)
+# ------------------------------------------
+SYNC_JOURNAL_KEEP = 5000          # 工單異動日誌保留筆數
+SYNC_JOURNAL_TRIM_S = 600.0       # API 背景維護修剪異動日誌的間隔 (每次 PASS / 改單都會多一筆)
+
+def init_db(db, journal_keep=SYNC_JOURNAL_KEEP):
+    # 建表 / 主鍵 / 索引 全部交給版本遷移，已是最新版本時不會做任何事
+    with db.write(transaction=False) as conn:
+        migrate(conn)
+    trim_order_changes(db, journal_keep)
+
+def trim_order_changes(db, keep=SYNC_JOURNAL_KEEP):
+    """工單異動日誌 (給網頁端增量同步用) 只保留最近 keep 筆，太舊的網頁會自動改為完整同步；回傳刪除筆數"""
+    with db.write() as conn:
+        return conn.execute("""
+            DELETE FROM work_order_changes
+            WHERE 序號 <= (SELECT MAX(序號) FROM work_order_changes) - ?
+        """, (keep,)).rowcount
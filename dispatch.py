@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+# ==========================================
+# 派單快取：每條產線的「隊首工單 + 下限/準重/上限」放在記憶體
+# - 工單表有任何異動 (work_order_changes 日誌序號變大) 就整批失效
+# - 產品規格的修改不會寫入工單異動日誌，靠 DISPATCH_TTL_S 限制最長過期時間
+# - 長輪詢 / SSE 的等待者在異動發生時立即被喚醒
+# - 異動日誌序號由背景檢查放在記憶體 (self._version)，命中快取時不借連線、不查 SQLite
+# ==========================================
+DISPATCH_TTL_S = 5.0        # 快取最長保留秒數
+DISPATCH_POLL_S = 0.05      # 背景檢查異動日誌的間隔 (抓其他程序，例如網頁端按下結束/取消)
+
+CURRENT_ORDER_SQL = """
+    SELECT
+        w.工單號碼, w.產品ID,
+        p.下限, p.準重, p.上限
+    FROM work_orders w
+    LEFT JOIN products p ON w.產品ID = p.產品ID
+    WHERE w.產線 = ?
+      AND w.狀態 IN ('待生產', '生產中')
+      AND w.已完成數量 < w.預計數量
+    ORDER BY w.排程順序 ASC LIMIT 1
+"""
+
+EMPTY_ORDER = {"order_id": None, "product_id": None}
+
+# 操作畫面 (/kiosk) 用：同一張隊首工單，另外帶出規格卡需要的產品欄位與數量
+ORDER_DETAIL_SQL = """
+    SELECT
+        w.工單號碼, w.產品ID, w.顯示內容, w.預計數量, w.已完成數量,
+        p.客戶名, p.溫度等級, p.品種, p.密度, p.長, p.寬, p.高,
+        p.下限, p.準重, p.上限, p.備註1, p.備註2, p.備註3
+    FROM work_orders w
+    LEFT JOIN products p ON w.產品ID = p.產品ID
+    WHERE w.產線 = ?
+      AND w.狀態 IN ('待生產', '生產中')
+      AND w.已完成數量 < w.預計數量
+    ORDER BY w.排程順序 ASC LIMIT 1
+"""
+ORDER_DETAIL_COLS = ["工單號碼", "產品ID", "顯示內容", "預計數量", "已完成數量", "客戶名", "溫度等級", "品種", "密度",
+                     "長", "寬", "高", "下限", "準重", "上限", "備註1", "備註2", "備註3"]
+
+def _num(val, default):
+    try: return float(val) if val is not None else default
+    except (TypeError, ValueError): return default
+
+def _order_payload(row):
+    if not row: return dict(EMPTY_ORDER)
+    return {
+        "order_id": row[0],
+        "product_id": row[1],
+        # ✅ 將後台設定好的精準規格，全部傳給產線電腦
+        "target_weight": _num(row[3], 25.0),
+        "min_weight": _num(row[2], 0.0),
+        "max_weight": _num(row[4], 999.0),
+    }
+
+class DispatchCache:
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._entries = {}          # (種類, line) -> (版本, 建立時間, payload)
+        self._version = None        # 目前看到的異動日誌序號
+        self._local_bumps = 0       # 本程序主動通知的次數 (寫入後不用等背景檢查)
+        self._event = None
+        self._loop = None
+        self._watcher = None
+
+    # ------------------------------------------
+    # 查詢
+    # ------------------------------------------
+    def _journal_seq(self, conn):
+        try:
+            return conn.execute("SELECT MAX(序號) FROM work_order_changes").fetchone()[0] or 0
+        except Exception:
+            return None
+
+    def get(self, line_name):
+        """回傳產線目前的派單資料 (與 /current_order 相同格式)"""
+        return self.query("order", line_name, CURRENT_ORDER_SQL, _order_payload)
+
+    def _cached(self, kind, line_name, key):
+        if key[0] is None: return None
+        with self._lock:
+            hit = self._entries.get((kind, line_name))
+        if hit and hit[0] == key and time.monotonic() - hit[1] < DISPATCH_TTL_S:
+            return hit[2]
+        return None
+
+    def query(self, kind, line_name, sql, build):
+        """共用同一套失效規則的產線查詢：sql 只取一列 (參數為產線)，build(row 或 None) 轉成回傳內容
+        背景檢查在跑時直接比對它記下的日誌序號，命中時完全不碰 SQLite"""
+        bumps = self._local_bumps
+        key = (self._version if self._watcher is not None else None, bumps)
+        payload = self._cached(kind, line_name, key)
+        if payload is not None: return payload
+
+        with self.db.read() as conn:
+            if key[0] is None:
+                # 沒有背景檢查 (或還沒讀到第一次)：改查日誌序號
+                key = (self._journal_seq(conn), bumps)
+                payload = self._cached(kind, line_name, key)
+                if payload is not None: return payload
+            row = conn.execute(sql, (line_name,)).fetchone()
+        payload = build(row)
+        with self._lock:
+            self._entries[(kind, line_name)] = (key, time.monotonic(), payload)
+        return payload
+
+    def invalidate(self, line_name=None):
+        with self._lock:
+            if line_name is None: self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[1] == line_name]:
+                    del self._entries[key]
+
+    # ------------------------------------------
+    # 推播：喚醒所有等待中的長輪詢 / SSE
+    # ------------------------------------------
+    def notify(self):
+        """本程序剛寫入工單 (例如 /upload 的 PASS)：立即失效並喚醒等待者，可從任何執行緒呼叫"""
+        with self._lock:
+            self._local_bumps += 1
+            self._entries.clear()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._event is not None:
+            self._event.set()
+        self._event = asyncio.Event()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._watcher = asyncio.create_task(self._watch_journal())
+
+    async def stop(self):
+        if self._watcher is None: return
+        self._watcher.cancel()
+        try: await self._watcher
+        except asyncio.CancelledError: pass
+        self._watcher = None
+        self._loop = None
+
+    async def _watch_journal(self):
+        while True:
+            seq = await self._loop.run_in_executor(None, self._read_seq)
+            if seq is not None and seq != self._version:
+                if self._version is not None:
+                    self._wake()
+                self._version = seq
+            await asyncio.sleep(DISPATCH_POLL_S)
+
+    def _read_seq(self):
+        with self.db.read() as conn:
+            return self._journal_seq(conn)
+
+    async def wait_for_change(self, line_name, is_changed, timeout):
+        """長輪詢：直到 is_changed(該產線派單資料) 成立 (或逾時) 才回傳目前的派單資料"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # 先拿事件再查詢：查詢途中發生的異動也一定會喚醒下面的等待
+            event = self._event
+            payload = await loop.run_in_executor(None, self.get, line_name)
+            remaining = deadline - loop.time()
+            if is_changed(payload) or remaining <= 0 or event is None:
+                return payload
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, DISPATCH_TTL_S))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,246 @@
+from bisect import bisect_right
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 系統設定 (網頁與 API 服務共用)
+# ==========================================
+SQL_DB_NAME = "factory_data.db"
+FILE_PRODUCTS = "db_products.csv"
+FILE_ORDERS = "db_orders.csv"
+FILE_LOGS_PREFIX = "db_logs"      # 流水帳分段檔名前綴 (log_journal/db_logs_20260121_001.csv)
+FILE_LOGS = "db_logs_All.csv"     # 舊版總表，只在 SQL 沒資料時當備援讀取
+PRODUCTION_LINES = ["Line 1", "Line 2", "Line 3", "Line 4"]
+API_PORT = 8000
+
+# 欄位定義
+# 工單表：與您預期的 factory_data.db 格式完全對齊
+ORDER_COLUMNS = ["產線", "排程順序", "工單號碼", "產品ID", "顯示內容", "品種", "密度", "準重", "預計數量", "已完成數量", "狀態", "建立時間"]
+
+# 產品表：對應預期格式中的 products 表
+PRODUCT_COLUMNS = ["產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", "下限", "準重", "上限", "備註1", "備註2", "備註3"]
+
+# 日誌表：用於分類歸納 4 台電腦傳來的數據
+LOG_COLUMNS = ["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"]
+
+# 建檔選項
+DENSITY_MAP = {64:(59.74,85.00),80:(74.03,93.75),96:(87.55,115.00),104:(96.24,121.88),112:(103.64,131.25),120:(111.05,140.63),128:(118.45,150.00),136:(125.85,159.38),144:(133.26,168.75),160:(154.50,175.50),192:(177.68,220.00),256:(226.60,312.00)}
+DENSITY_OPTIONS = list(DENSITY_MAP.keys())
+SPECIAL_VARIETIES = ["BULK", "BUXD", "SB", "BIOSTAR"] 
+ALL_VARIETIES = sorted(["ACPE", "ACBL", "BL", "BLOC(原反)", "RHK(S-F)"] + SPECIAL_VARIETIES)
+TEMP_OPTIONS = ["1260", "1200", "1300", "1400", "1500", "BIOSTAR"]
+NOTE_COLS = ["備註1", "備註2", "備註3"]
+
+# ==========================================
+# 顯示格式
+# ==========================================
+def get_p_label(d): return f"{d} ({d/16}P)"
+
+def get_temp_color(temp_str):
+    t = str(temp_str).upper()
+    if "1260" in t: return "#ffffff" 
+    if "1200" in t: return "#bdc3c7"
+    if "1300" in t: return "#5dade2"
+    if "1400" in t: return "#f4d03f"
+    if "1500" in t: return "#58d68d"
+    if "BIO" in t: return "#d35400"
+    return "#ecf0f1" 
+
+def format_size(val):
+    try: f = float(val); return str(int(f)) if f.is_integer() else str(val)
+    except: return str(val)
+
+def safe_format_density(val):
+    try: return f"{float(val):.1f}"
+    except: return str(val)
+
+def safe_format_weight(val):
+    try: return f"{float(val):.3f}"
+    except: return str(val)
+
+def _format_limit(x):
+    return f"{float(x):.1f}" if pd.notna(x) else "-"
+
+def order_display_text(p):
+    """工單的 顯示內容：[客戶] | 溫度 | 品種 | 長x寬x高 | 準重kg | 備註1 (p 為產品的一列，dict 或 Series 皆可)"""
+    note = str(p["備註1"]) if pd.notna(p["備註1"]) else ""
+    note_display = f" | {note}" if note else ""
+    spec = f"{format_size(p['長'])}x{format_size(p['寬'])}x{format_size(p['高'])}"
+    return f"[{p['客戶名']}] | {p['溫度等級']} | {p['品種']} | {spec} | {p['準重']}kg{note_display}"
+
+# ==========================================
+# 工單 / 產品資料的純運算 (不依賴 Streamlit，可單獨匯入或壓測)
+# ==========================================
+def normalize_sequences(df):
+    """每條產線的排程順序重新編成 1..n
+    - 產線依第一次出現的順序排列，同產線內依原排程順序 (同號維持原本先後，空值排最後)
+    - 沒有產線的工單不屬於任何佇列，與舊版一樣不會留在結果中
+    - 一次排序 + groupby cumcount，不再逐條產線 concat"""
+    if df.empty: return df
+    df = df.reset_index(drop=True)
+    df = df[df['產線'].notna()]
+    df = (df.assign(_line=pd.factorize(df['產線'])[0])
+            .sort_values(["_line", "排程順序"], kind="stable", na_position="last"))
+    df['排程順序'] = df.groupby("_line").cumcount() + 1
+    return df.drop(columns="_line")
+
+def prepare_products(df):
+    """產品表欄位整理 (溫度等級轉字串、備註空值統一為 NULL)"""
+    if df.empty: return df
+    df["溫度等級"] = df["溫度等級"].astype(str)
+    df[NOTE_COLS] = df[NOTE_COLS].fillna("NULL").replace(['', 'nan', 'None'], 'NULL')
+    return df
+
+def prepare_work_orders(df):
+    """工單表補齊欄位、數量轉整數、排程順序正規化，回傳新的 DataFrame"""
+    if "產線" not in df.columns: df["產線"] = "Line 1"
+    for col in ORDER_COLUMNS:
+        if col not in df.columns: df[col] = ""
+    df = df[ORDER_COLUMNS].copy()
+    for col in ["排程順序", "預計數量", "已完成數量"]:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    return normalize_sequences(df)
+
+def update_order(wo, order_id, **values):
+    """修改一張工單 (值可以是函式，例如 已完成數量=lambda s: s - 1)，回傳新的 DataFrame
+    不直接改原本的物件：網頁端的快取靠「是不是同一個 DataFrame」判斷要不要重算"""
+    hit = wo["工單號碼"] == order_id
+    if not hit.any(): return wo
+    wo = wo.copy()
+    for col, val in values.items():
+        wo.loc[hit, col] = val(wo.loc[hit, col]) if callable(val) else val
+    return wo
+
+def merge_work_orders(wo, changed_ids, df_changed):
+    """把異動的工單合併回來，保留原本的索引 (排序/刪除功能靠索引對應)"""
+    hit = wo["工單號碼"].isin(changed_ids)
+    label_of = dict(zip(wo.loc[hit, "工單號碼"], wo.index[hit]))
+    next_label = int(wo.index.max()) + 1 if len(wo) else 0
+    labels = []
+    for wo_id in df_changed["工單號碼"]:
+        if wo_id not in label_of:
+            label_of[wo_id] = next_label
+            next_label += 1
+        labels.append(label_of[wo_id])
+    df_changed.index = labels
+    # 資料庫裡已不存在的工單 (被刪除) 不會出現在 df_changed，直接移除
+    return pd.concat([wo[~hit], df_changed.reindex(columns=wo.columns)]).sort_index()
+
+def sql_rows(df, cols):
+    """DataFrame -> sqlite3 可以直接綁定的 tuple 列 (numpy 數值轉成 Python 型別，NaN 轉 None)"""
+    return [tuple(None if pd.isna(v) else v for v in row) for row in df[cols].astype(object).itertuples(index=False)]
+
+def count_passes(conn, pass_counts):
+    """PASS 計入工單完成數量 ({工單號碼: 件數})，網頁與 API 共用這一條規則
+    待生產改成生產中；已完成 / 已取消的工單不再計數也不會被改回生產中 (與結束、取消按鈕同時發生時)"""
+    for order_id, n in pass_counts.items():
+        conn.execute("""
+            UPDATE work_orders
+            SET 已完成數量 = 已完成數量 + ?,
+                狀態 = CASE WHEN 狀態 = '待生產' THEN '生產中' ELSE 狀態 END
+            WHERE 工單號碼 = ? AND 狀態 NOT IN ('已完成', '已取消')
+        """, (n, order_id))
+
+def record_weigh_result(db, log_values):
+    """寫入一筆秤重紀錄；PASS 時在同一個交易內把工單完成數量 +1，回傳 rowid"""
+    with db.write() as conn:
+        cursor = conn.execute("""
+            INSERT INTO production_logs (時間, 產線, 工單號碼, 產品ID, 實測重, 判定結果, NG原因)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, log_values)
+        if log_values[5] == "PASS":
+            count_passes(conn, {log_values[2]: 1})
+        return cursor.lastrowid
+
+# ==========================================
+# 現場秤重：產線生產隊列
+# ==========================================
+def pending_orders(wo, line_name):
+    mask = wo["狀態"].isin(["待生產", "生產中"]) & (wo["產線"] == line_name)
+    return wo[mask].sort_values(by="排程順序")
+
+def queue_signature(wo):
+    """各產線待生產工單的 (產線, 工單號碼, 產品ID, 預計數量)，依排程順序
+    只有已完成數量 / 生產中狀態變動 (每次 PASS) 時不變；隊首換人、加單、刪單、改排程才會變"""
+    active = wo[wo["狀態"].isin(["待生產", "生產中"])].sort_values(by=["產線", "排程順序"])
+    return tuple(active[["產線", "工單號碼", "產品ID", "預計數量"]].itertuples(index=False, name=None))
+
+def queue_table(pending, catalog):
+    """隊列表格 + 下拉選單文字 (工單或產品表換新時才需要重算)"""
+    if catalog.size:
+        queue_view = pending.merge(catalog.source.assign(_spec=catalog.spec), on="產品ID", how="left")
+    else: queue_view = pending.copy()
+
+    q_df = pd.DataFrame()
+    q_df["序"] = range(1, len(queue_view) + 1)
+    if "客戶名" in queue_view.columns:
+        q_df["客戶"] = queue_view["客戶名"]
+        q_df["溫度等級"] = queue_view["溫度等級"].astype(str)
+        q_df["品種"] = queue_view["品種_x"]
+        q_df["規格"] = queue_view["_spec"].fillna("-")
+        q_df["下限"] = queue_view["下限"].map(_format_limit)
+        q_df["準重"] = queue_view["準重_x"].map(safe_format_weight)
+        q_df["上限"] = queue_view["上限"].map(_format_limit)
+        for c in NOTE_COLS: q_df[c] = queue_view[c].fillna('')
+    else: q_df["內容"] = queue_view["詳細規格字串"]
+    q_df["進度"] = queue_view["已完成數量"].astype(int).astype(str) + " / " + queue_view["預計數量"].astype(int).astype(str)
+
+    labels = [f"【序{n}】 {content} (數:{int(qty)})"
+              for n, content, qty in zip(range(1, len(pending) + 1), pending["顯示內容"], pending["預計數量"])]
+    return q_df, labels
+
+# ==========================================
+# 產品目錄索引：products_db 換新時建一次，之後篩選 / 搜尋只查索引
+# - 客戶名 / 溫度等級 / 品種 先轉成整數代碼，下拉篩選只是整數比較
+# - 每個產品的所有欄位 + 規格字串 (長x寬x高) 預先轉小寫接成一條長字串，
+#   關鍵字用 str.find 在整條字串上跳著找，只會碰到有命中的產品
+# ==========================================
+CATALOG_FACETS = ("客戶名", "溫度等級", "品種")
+_CELL_SEP, _ROW_SEP = "\x1f", "\n"
+
+class CatalogIndex:
+    def __init__(self, df):
+        self.source = df
+        self.size = len(df)
+        self._codes, self._lookup, self.options = {}, {}, {}
+        for col in CATALOG_FACETS:
+            codes, uniques = pd.factorize(df[col]) if col in df else (np.full(self.size, -1), [])
+            self._codes[col] = codes
+            self.options[col] = list(uniques)
+            self._lookup[col] = {v: i for i, v in enumerate(uniques)}
+
+        dims = [df[c] if c in df else pd.Series("", index=df.index) for c in ("長", "寬", "高")]
+        self.spec = pd.Series([f"{format_size(a)}x{format_size(b)}x{format_size(c)}" for a, b, c in zip(*dims)],
+                              index=df.index, dtype=object)
+        cells = df.astype(str).assign(_spec=self.spec)
+        rows = [_CELL_SEP.join(r) for r in cells.itertuples(index=False, name=None)]
+        self._text = _ROW_SEP.join(rows).lower()
+        self._starts = np.cumsum([0] + [len(r) + 1 for r in rows]).tolist()
+
+    def is_stale(self, df):
+        return df is not self.source or len(df) != self.size
+
+    def search(self, keyword):
+        """關鍵字 (不分大小寫、一般字串比對) 命中的列位置"""
+        kw = keyword.lower()
+        hits, pos = [], self._text.find(kw)
+        while pos != -1:
+            row = bisect_right(self._starts, pos) - 1
+            hits.append(row)
+            pos = self._text.find(kw, self._starts[row + 1])
+        return hits
+
+    def mask(self, keyword="", **facets):
+        """例如 mask("600", 客戶名="A廠")；值為 None 或 "全部" 代表不篩選"""
+        m = np.ones(self.size, dtype=bool)
+        for col, val in facets.items():
+            if val is None or val == "全部": continue
+            m &= self._codes[col] == self._lookup[col].get(val, -2)
+        if keyword:
+            hit = np.zeros(self.size, dtype=bool)
+            hit[self.search(keyword)] = True
+            m &= hit
+        return m
+
+    def filter(self, keyword="", **facets):
+        return self.source[self.mask(keyword, **facets)]
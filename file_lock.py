@@ -0,0 +1,51 @@
+import os
+
+# ==========================================
+# 跨程序檔案鎖 (不等待)
+# - 拿到的程序結束 (含當機) 時作業系統自動釋放，不會留下死鎖
+# - 同一個程序內另外開的鎖也互斥 (每次都開新的檔案描述子)
+# - Windows 用 msvcrt.locking，其他平台用 fcntl.flock
+# ==========================================
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """不等待；拿到 (或本來就持有) 回傳 True"""
+        if self._fd is not None: return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if msvcrt is not None:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None: return
+        try:
+            if msvcrt is not None:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,249 @@
+import html
+import json
+from functools import lru_cache
+from dispatch import ORDER_DETAIL_COLS
+from factory_core import format_size, get_temp_color, safe_format_density
+
+# ==========================================
+# 產線操作畫面 (/kiosk/{產線})：FastAPI 直接送出的單頁 HTML
+# - 只顯示一條產線：規格卡、即時重量、剩餘數量、PASS / NG 按鈕
+# - 頁面本身是靜態字串，資料全靠瀏覽器向小型 JSON 端點輪詢 / 訂閱：
+#     GET  /kiosk/{產線}/state  隊首工單 + 規格 (派單快取，工單沒異動時不查資料庫)
+#     WS   /ws/weight/{產線}    API 主機直連的磅秤讀數，依磅秤速率推送 (沒接磅秤時改為手動輸入)
+#     GET  /scale/{產線}        同上的單次讀取；瀏覽器不支援或連不上 WebSocket 時改用輪詢
+#     POST /upload              與產線電腦相同的上傳介面
+# - PASS / NG 是否可按由瀏覽器依最新一筆讀數與工單的下限 / 上限即時判斷，送出的也是該筆讀數
+# ==========================================
+KIOSK_STATE_POLL_MS = 1000
+KIOSK_SCALE_POLL_MS = 250
+
+def kiosk_state_payload(row):
+    """ORDER_DETAIL_SQL 的一列 -> 操作畫面需要的欄位 (數字已格式化成要顯示的字串)"""
+    if not row: return {"order_id": None}
+    r = dict(zip(ORDER_DETAIL_COLS, row))
+    num = lambda v, d: float(v) if v not in (None, "") else d
+    planned, done = int(r["預計數量"] or 0), int(r["已完成數量"] or 0)
+    return {
+        "order_id": r["工單號碼"],
+        "product_id": r["產品ID"],
+        "content": r["顯示內容"],
+        "planned": planned,
+        "done": done,
+        "remaining": planned - done,
+        "client": r["客戶名"] or "-",
+        "temp": str(r["溫度等級"] or "-"),
+        "temp_color": get_temp_color(r["溫度等級"]),
+        "variety": r["品種"] or "-",
+        "density": safe_format_density(r["密度"]),
+        "size": f"{format_size(r['長'])}x{format_size(r['寬'])}x{format_size(r['高'])}",
+        "min_weight": num(r["下限"], 0.0),
+        "target_weight": num(r["準重"], 25.0),
+        "max_weight": num(r["上限"], 999.0),
+        "notes": [str(n) for n in (r["備註1"], r["備註2"], r["備註3"]) if n not in (None, "", "NULL")],
+    }
+
+@lru_cache(maxsize=32)
+def kiosk_html(line_name):
+    return (KIOSK_HTML
+            .replace("__TITLE__", html.escape(line_name))
+            .replace("__LINE__", json.dumps(line_name))
+            .replace("__STATE_MS__", str(KIOSK_STATE_POLL_MS))
+            .replace("__SCALE_MS__", str(KIOSK_SCALE_POLL_MS)))
+
+KIOSK_HTML = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>__TITLE__ 秤重作業</title>
+<style>
+    body { margin: 0; font-family: 'Microsoft JhengHei', 'Noto Sans TC', sans-serif; background: #ecf0f1; }
+    .digital-font { font-family: 'Roboto Mono', 'Consolas', monospace; font-weight: 700; }
+    .topbar { background: #2c3e50; color: white; padding: 8px 16px; display: flex; justify-content: space-between; align-items: center; }
+    .topbar .line { font-size: 1.6rem; font-weight: 900; }
+    .topbar .wo { font-size: 1.1rem; opacity: 0.9; }
+    .wrap { display: flex; gap: 14px; padding: 12px; }
+    .left { flex: 4; } .right { flex: 6; }
+
+    .card { background: #2c3e50; border-radius: 12px; border-left: 8px solid #95a5a6; color: white; overflow: hidden;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.2); min-height: 460px; display: flex; flex-direction: column; }
+    .card .u-label { color: #b0bec5; font-size: 0.8rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; }
+    .c-head { background: rgba(0,0,0,0.3); padding: 8px 10px; text-align: center; }
+    .c-head .u-value { font-size: 2.4rem; font-weight: 900; line-height: 1.1; }
+    .c-grid { display: flex; background: #34495e; }
+    .c-grid > div { flex: 1; text-align: center; padding: 6px; border-right: 1px solid #455a64; }
+    .c-grid > div:last-child { border-right: none; }
+    .c-grid .u-value { font-size: 1.6rem; font-weight: bold; }
+    .c-size { background: #233140; padding: 8px; text-align: center; }
+    .c-size .u-value { font-size: 1.8rem; font-weight: 900; font-family: 'Roboto Mono', monospace; }
+    .c-range { padding: 6px; text-align: center; }
+    .c-range .u-value { font-size: 1.3rem; font-weight: bold; color: #f1c40f; font-family: 'Roboto Mono', monospace; }
+    .c-notes { background: rgba(255,255,255,0.05); padding: 8px 15px; flex-grow: 1; font-weight: bold; }
+
+    .status { border-radius: 12px; height: 250px; display: flex; flex-direction: column; justify-content: center; align-items: center; color: white; transition: background-color 0.2s; }
+    .status-pass { background: #2980b9; border: 4px solid #3498db; }
+    .status-fail { background: #c0392b; border: 4px solid #e74c3c; }
+    .status-ng-ready { background: #d35400; border: 4px solid #e67e22; }
+    .countdown { background: rgba(0,0,0,0.2); padding: 2px 15px; border-radius: 8px; text-align: center; }
+    .countdown .lbl { font-size: 0.8rem; letter-spacing: 1px; }
+    .countdown .val { font-size: 1.8rem; font-weight: 900; color: #f1c40f; }
+    .countdown .val.over { color: #ff6b6b; }
+    .weight { font-size: 7rem; font-weight: 900; line-height: 1; }
+    .scale-info { margin: 8px 0; padding: 6px 10px; border-radius: 6px; background: #d6eaf8; }
+    .scale-info.warn { background: #fdebd0; }
+
+    .btns { display: flex; gap: 12px; margin-top: 15px; }
+    .btns button { height: 130px; font-size: 32px; font-weight: 900; border-radius: 15px; color: white; border: 2px solid; cursor: pointer; }
+    #btn-pass { flex: 3; background: #27ae60; border-color: #145a32; }
+    #btn-ng { flex: 1; background: #c0392b; border-color: #641e16; }
+    .btns button:disabled { background: #bdc3c7; border-color: #95a5a6; color: #7f8c8d; cursor: not-allowed; }
+    #manual, #ng-reason { font-size: 1.4rem; padding: 6px; margin-top: 8px; width: 100%; box-sizing: border-box; }
+    .idle { padding: 60px; text-align: center; font-size: 2rem; color: #7f8c8d; }
+    #toast { position: fixed; right: 20px; bottom: 20px; background: #2c3e50; color: white; padding: 12px 18px; border-radius: 8px; opacity: 0; transition: opacity 0.3s; font-size: 1.2rem; }
+    #toast.show { opacity: 1; }
+</style>
+</head>
+<body>
+<div class="topbar"><span class="line">🏭 __TITLE__</span><span class="wo" id="wo">-</span></div>
+<div id="idle" class="idle" hidden>💤 目前閒置中，請至後台加入排程。</div>
+<div class="wrap" id="main" hidden>
+    <div class="left">
+        <div class="card" id="card">
+            <div class="c-head"><div class="u-label">Client / 客戶</div><div class="u-value" id="client">-</div></div>
+            <div class="c-grid">
+                <div><div class="u-label">Temp / 溫度</div><div class="u-value" id="temp">-</div></div>
+                <div><div class="u-label">Variety / 品種</div><div class="u-value" id="variety">-</div></div>
+                <div><div class="u-label">Density / 密度</div><div class="u-value" id="density">-</div></div>
+            </div>
+            <div class="c-size"><div class="u-label">Size / 尺寸</div><div class="u-value" id="size">-</div></div>
+            <div class="c-range"><div class="u-label">Range</div><div class="u-value" id="range">-</div></div>
+            <div class="c-notes"><div class="u-label">Notes / 備註</div><div id="notes"></div></div>
+        </div>
+    </div>
+    <div class="right">
+        <div class="scale-info" id="scale-info">磅秤連線中...</div>
+        <input id="manual" type="number" step="0.001" placeholder="手動輸入重量 (kg)" hidden>
+        <div class="status status-fail" id="status">
+            <div class="countdown"><div class="lbl">剩餘數量</div><div class="val" id="remaining">-</div></div>
+            <div class="weight digital-font" id="weight">0.000</div>
+            <div style="font-size:1.5rem; font-weight:bold;">kg</div>
+        </div>
+        <div class="btns">
+            <button id="btn-pass" disabled>🟢 紀錄良品 (PASS)</button>
+            <button id="btn-ng" disabled>🔴 紀錄 NG</button>
+        </div>
+        <select id="ng-reason" hidden>
+            <option>不足重尾數</option><option>規格切換廢料</option><option>外觀不良</option><option>其他</option>
+        </select>
+    </div>
+</div>
+<div id="toast"></div>
+<script>
+const LINE = __LINE__;
+const enc = encodeURIComponent(LINE);
+let order = null, weight = 0, manual = false, busy = false;
+const $ = (id) => document.getElementById(id);
+
+function toast(msg) {
+    const t = $("toast"); t.textContent = msg; t.classList.add("show");
+    clearTimeout(t._h); t._h = setTimeout(() => t.classList.remove("show"), 2000);
+}
+
+function renderOrder(s) {
+    const changed = !order || !s.order_id || order.order_id !== s.order_id;
+    order = s.order_id ? s : null;
+    $("idle").hidden = !!order; $("main").hidden = !order;
+    if (!order) { $("wo").textContent = "-"; return; }
+    $("wo").textContent = `${s.order_id}  ${s.content || ""}`;
+    const r = $("remaining"); r.textContent = s.remaining; r.classList.toggle("over", s.remaining < 0);
+    if (!changed) return evaluate();
+    $("client").textContent = s.client;
+    $("temp").textContent = s.temp; $("temp").style.color = s.temp_color;
+    $("card").style.borderLeftColor = s.temp_color;
+    $("variety").textContent = s.variety; $("density").textContent = s.density; $("size").textContent = s.size;
+    $("range").textContent = `${s.min_weight} - ${s.target_weight} - ${s.max_weight}`;
+    const notes = $("notes"); notes.replaceChildren();
+    (s.notes.length ? s.notes : ["(無特殊備註)"]).forEach(n => { const d = document.createElement("div"); d.textContent = "• " + n; notes.appendChild(d); });
+    evaluate();
+}
+
+function evaluate() {
+    if (!order) return;
+    const isPass = order.min_weight <= weight && weight <= order.max_weight;
+    const ngValid = weight > 0.05;
+    $("status").className = "status " + (isPass ? "status-pass" : (ngValid ? "status-ng-ready" : "status-fail"));
+    $("weight").textContent = weight.toFixed(3);
+    $("btn-pass").disabled = busy || !isPass;
+    $("btn-ng").disabled = busy || !ngValid;
+    $("ng-reason").hidden = !(ngValid && !isPass);
+}
+
+async function pollState() {
+    try {
+        const res = await fetch(`/kiosk/${enc}/state`, { cache: "no-store" });
+        if (res.ok) renderOrder(await res.json());
+    } catch (e) { /* 網路中斷：下一輪再試 */ }
+}
+
+function applyScale(s) {
+    const info = $("scale-info");
+    if (s.status === "offline") {
+        // API 主機沒有接這條產線的磅秤：改成手動輸入
+        manual = true; $("manual").hidden = false; info.className = "scale-info warn";
+        info.textContent = "⚠️ 目前處於手動輸入模式"; return;
+    }
+    weight = (s.stable && s.status === "ok" && s.stable_weight !== null) ? s.stable_weight : s.weight;
+    info.className = "scale-info" + (s.status === "ok" ? "" : " warn");
+    info.textContent = s.status === "error" ? `連線異常: ${s.error}`
+        : s.status === "stale" ? `⚠️ 磅秤讀數已 ${Math.round(s.age)} 秒未更新`
+        : `🛰️ 實測重量: ${s.weight.toFixed(3)} kg ${s.stable ? "🟢 穩定" : "🟡 晃動中"}`;
+    evaluate();
+}
+
+async function pollScale() {
+    if (manual) return;
+    try { applyScale(await (await fetch(`/scale/${enc}`, { cache: "no-store" })).json()); }
+    catch (e) { /* 下一輪再試 */ }
+}
+
+let pollTimer = null;
+function connectScale() {
+    if (manual) return;
+    if (!window.WebSocket) { pollTimer = pollTimer || setInterval(pollScale, __SCALE_MS__); return; }
+    const ws = new WebSocket(`${location.protocol === "https:" ? "wss" : "ws"}://${location.host}/ws/weight/${enc}`);
+    let opened = false;
+    ws.onopen = () => { opened = true; if (pollTimer) { clearInterval(pollTimer); pollTimer = null; } };
+    ws.onmessage = (e) => applyScale(JSON.parse(e.data));
+    ws.onclose = () => {
+        if (manual) return;
+        // 連不上 (例如代理伺服器不轉 WebSocket) 先改輪詢，之後再試著重連
+        if (!opened && !pollTimer) pollTimer = setInterval(pollScale, __SCALE_MS__);
+        setTimeout(connectScale, opened ? 1000 : 10000);
+    };
+}
+
+async function record(status) {
+    if (!order || busy) return;
+    busy = true; evaluate();
+    const body = { line_name: LINE, order_id: order.order_id, product_id: order.product_id,
+                   weight: String(weight), status: status, reason: status === "NG" ? $("ng-reason").value : "" };
+    try {
+        const res = await (await fetch("/upload", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(body) })).json();
+        toast(res.status === "success" ? `${status === "PASS" ? "✅ 良品" : "🔴 NG"} 紀錄成功: ${weight.toFixed(3)} kg` : `寫入失敗: ${res.message}`);
+    } catch (e) { toast("寫入失敗: 無法連線"); }
+    busy = false;
+    await pollState();
+}
+
+$("btn-pass").onclick = () => record("PASS");
+$("btn-ng").onclick = () => record("NG");
+$("manual").oninput = (e) => { weight = parseFloat(e.target.value) || 0; evaluate(); };
+document.addEventListener("keydown", (e) => {
+    if (e.code === "Space" && e.target.tagName !== "INPUT" && !$("btn-pass").disabled) { e.preventDefault(); record("PASS"); }
+});
+pollState(); connectScale();
+setInterval(pollState, __STATE_MS__);
+</script>
+</body>
+</html>
+"""
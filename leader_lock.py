@@ -0,0 +1,14 @@
+from file_lock import FileLock
+
+# ==========================================
+# 多 worker 時挑一個程序做背景維護 (CSV 流水帳、SPC、時段彙總、封存、修剪工單異動日誌)
+# - 拿到這把檔案鎖的程序就是 leader，程序結束 (含當機) 時作業系統自動釋放
+# - 沒拿到的 worker 定時再試，leader 掛掉後由其他 worker 接手
+# - API 以外要動維護狀態的地方 (例如網頁的強制儲存) 也先拿這把鎖，拿不到就交給 leader
+# ==========================================
+LEADER_LOCK_FILE = "factory_api.leader.lock"
+LEADER_RETRY_S = 5.0
+
+class LeaderLock(FileLock):
+    def __init__(self, path=LEADER_LOCK_FILE):
+        super().__init__(path)
@@ -0,0 +1,134 @@
+import heapq
+import json
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from itertools import islice
+from db_schema import LOG_TABLE_SQL, LOG_COLS, ARCHIVE_FLAG, ARCHIVED_UNTIL
+from log_rollup import rollup_watermark
+from report_export import EXPORT_CHUNK_ROWS, build_log_query, parse_time_bound
+
+# ==========================================
+# production_logs 冷熱分區
+# - 熱資料庫 (factory_data.db) 只留最近 ARCHIVE_KEEP_MONTHS 個月，之前的紀錄依 時間 搬到
+#   log_archive/production_logs_{年-月}.db (序號不變)；網頁端 / API / 增量同步只碰熱資料庫
+# - 只搬已寫進 CSV 流水帳且已累加進時段彙總的紀錄，搬走後歷史趨勢照樣從 production_rollups 查
+# - 刪除時帶上 ARCHIVE_FLAG：觸發器不會把搬走的紀錄當成撤銷 (不記作廢、不扣統計 / 彙總)
+# - ARCHIVED_UNTIL 記下搬走的最晚時間，之後撤銷時統計觸發器才知道首筆 / 末筆時間能不能只看熱資料庫重算
+# - 月份檔先 commit、熱資料庫後刪除；中途當機時兩邊都有的紀錄匯出時只出現一次
+# - 報表查詢用 iter_log_chunks：熱資料庫 + 有交集的月份檔依時間合併，呼叫端不用管資料在哪裡
+# ==========================================
+ARCHIVE_DIR = "log_archive"
+ARCHIVE_KEEP_MONTHS = 1         # 熱資料庫保留幾個月 (含本月)
+ARCHIVE_BATCH = 5000            # 每次最多搬幾筆 (搬移期間持有寫入鎖)
+ARCHIVE_CHECK_S = 600.0         # API 背景檢查間隔
+
+_PARTITION_RE = re.compile(r"^production_logs_(\d{4}-\d{2})\.db$")
+_COLS = ", ".join(LOG_COLS)
+
+def hot_start(now=None, keep=ARCHIVE_KEEP_MONTHS):
+    """熱資料庫保留範圍的起點 ('2026-10-01 00:00:00')"""
+    now = now or datetime.now()
+    months = now.year * 12 + now.month - 1 - (keep - 1)
+    return f"{months // 12:04d}-{months % 12 + 1:02d}-01 00:00:00"
+
+def partition_path(month, directory=ARCHIVE_DIR):
+    return os.path.join(directory, f"production_logs_{month}.db")
+
+def list_partitions(directory=ARCHIVE_DIR):
+    """已封存的月份 ['2026-08', '2026-09', ...]"""
+    if not os.path.isdir(directory): return []
+    return sorted(m.group(1) for m in map(_PARTITION_RE.match, os.listdir(directory)) if m)
+
+def _open_partition(month, directory, readonly):
+    path = partition_path(month, directory)
+    if readonly:
+        return sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    conn = sqlite3.connect(path)
+    conn.execute(LOG_TABLE_SQL.format(name="IF NOT EXISTS production_logs"))
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_line_time ON production_logs ("產線", "時間")')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_order ON production_logs ("工單號碼")')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_time ON production_logs ("時間")')
+    return conn
+
+# ------------------------------------------
+# 封存
+# ------------------------------------------
+def archive_logs(db, journal_seq, now=None, directory=ARCHIVE_DIR, batch=ARCHIVE_BATCH):
+    """把保留範圍以前、序號 <= journal_seq (已進 CSV 流水帳) 且已彙總的紀錄搬到月份檔，回傳筆數"""
+    cutoff = hot_start(now)
+    with db.write() as conn:
+        limit = min(journal_seq, rollup_watermark(conn))
+        rows = conn.execute(f"""
+            SELECT 序號, {_COLS} FROM production_logs WHERE 時間 < ? AND 序號 <= ? ORDER BY 序號 LIMIT ?
+        """, (cutoff, limit, batch)).fetchall()
+        if not rows: return 0
+
+        os.makedirs(directory, exist_ok=True)
+        by_month = {}
+        for r in rows:
+            by_month.setdefault(str(r[1])[:7], []).append(r)
+        for month, part in by_month.items():
+            with closing(_open_partition(month, directory, readonly=False)) as cold, cold:
+                cold.executemany(f"""
+                    INSERT OR IGNORE INTO production_logs (序號, {_COLS}) VALUES ({", ".join("?" * (len(LOG_COLS) + 1))})
+                """, part)
+
+        conn.execute("""
+            INSERT INTO id_sequences ("名稱", "值")
+            SELECT ?, t FROM (SELECT MAX(CAST(strftime('%s', value) AS INTEGER)) AS t FROM json_each(?)) WHERE t IS NOT NULL
+            ON CONFLICT("名稱") DO UPDATE SET "值" = MAX("值", excluded."值")
+        """, (ARCHIVED_UNTIL, json.dumps([r[1] for r in rows])))
+        conn.execute('INSERT OR REPLACE INTO id_sequences ("名稱", "值") VALUES (?, 1)', (ARCHIVE_FLAG,))
+        n = conn.execute("DELETE FROM production_logs WHERE 序號 IN (SELECT value FROM json_each(?))",
+                         (json.dumps([r[0] for r in rows]),)).rowcount
+        conn.execute('DELETE FROM id_sequences WHERE "名稱" = ?', (ARCHIVE_FLAG,))
+    return n
+
+# ------------------------------------------
+# 跨分區讀取
+# ------------------------------------------
+def _pages(read, filters):
+    """依 (時間, 序號) 一頁一頁讀，每頁一個短查詢：長時間的匯出不會一直佔著讀取交易 (WAL 才能 checkpoint)"""
+    after = None
+    while True:
+        sql, params = build_log_query(*filters, after=after, limit=EXPORT_CHUNK_ROWS)
+        rows = read(sql, params)
+        yield from rows
+        if len(rows) < EXPORT_CHUNK_ROWS: return
+        after = (rows[-1][1], rows[-1][0])
+
+def _hot_rows(db, filters):
+    def read(sql, params):
+        with db.read() as conn:
+            return conn.execute(sql, params).fetchall()
+    return _pages(read, filters)
+
+def _cold_rows(month, directory, filters):
+    with closing(_open_partition(month, directory, readonly=True)) as conn:
+        yield from _pages(lambda sql, params: conn.execute(sql, params).fetchall(), filters)
+
+def iter_log_chunks(db, start=None, end=None, line=None, order_id=None, directory=ARCHIVE_DIR):
+    """條件同 build_log_query，回傳依 時間 排序的讀取塊 (每塊最多 EXPORT_CHUNK_ROWS 筆，欄位同 LOG_COLS)
+    日期格式錯誤時在呼叫當下就丟出 ValueError (不是在開始讀取之後)"""
+    filters = (start, end, line, order_id)
+    build_log_query(*filters)
+    lo, hi = parse_time_bound(start, False), parse_time_bound(end, True)
+    months = [m for m in list_partitions(directory) if (not lo or m >= lo[:7]) and (not hi or m <= hi[:7])]
+
+    def rows():
+        # 中途當機時同一筆可能同時在熱資料庫與月份檔：合併後相鄰，只輸出一次
+        sources = [_cold_rows(m, directory, filters) for m in months] + [_hot_rows(db, filters)]
+        last = None
+        for r in heapq.merge(*sources, key=lambda r: (r[1] or "", r[0])):
+            if r[0] == last: continue
+            last = r[0]
+            yield r[1:]
+
+    def chunks():
+        it = rows()
+        while chunk := list(islice(it, EXPORT_CHUNK_ROWS)):
+            yield chunk
+    return chunks()
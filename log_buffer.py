@@ -0,0 +1,126 @@
+import pandas as pd
+
+# ==========================================
+# 生產日誌的記憶體緩衝 (只追加、分塊、欄式儲存)
+# - 每個欄位各自一條 list，寫滿 CHUNK_ROWS 筆就封存成一塊，新增一筆是攤銷 O(1)
+# - 只有畫面需要時才轉成 DataFrame；已封存的塊會快取，之後只重建最後一塊
+# - 每筆都有鍵值：來自 SQL 的資料用 rowid，CSV 備援資料用負數流水號
+# ==========================================
+CHUNK_ROWS = 4096
+
+class _Chunk:
+    __slots__ = ("keys", "cols", "frame")
+
+    def __init__(self, columns):
+        self.keys = []
+        self.cols = {c: [] for c in columns}
+        self.frame = None       # 已轉好的 DataFrame (資料有變動就清掉)
+
+class LogBuffer:
+    def __init__(self, columns, from_sql=True):
+        self.columns = list(columns)
+        self.from_sql = from_sql       # True = 鍵值就是 production_logs 的 rowid
+        self._chunks = [_Chunk(self.columns)]
+        self._len = 0
+        self._next_local_key = -1
+        self._frame = None
+
+    @classmethod
+    def from_frame(cls, df, columns, from_sql=True):
+        buf = cls(columns, from_sql=from_sql)
+        buf.extend(df)
+        return buf
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def empty(self):
+        return self._len == 0
+
+    @property
+    def last_key(self):
+        for chunk in reversed(self._chunks):
+            if chunk.keys: return chunk.keys[-1]
+        return None
+
+    # ------------------------------------------
+    # 寫入
+    # ------------------------------------------
+    def append(self, values, key=None):
+        """新增一筆 (values 依 columns 順序)，回傳鍵值"""
+        if key is None:
+            key = self._next_local_key
+            self._next_local_key -= 1
+        chunk = self._chunks[-1]
+        if len(chunk.keys) >= CHUNK_ROWS:
+            chunk = _Chunk(self.columns)
+            self._chunks.append(chunk)
+        chunk.keys.append(key)
+        for col, val in zip(self.columns, values):
+            chunk.cols[col].append(val)
+        chunk.frame = None
+        self._frame = None
+        self._len += 1
+        return key
+
+    def extend(self, df):
+        """整批追加 DataFrame；索引名稱為 rowid 時當作鍵值"""
+        keyed = self.from_sql and df.index.name == "rowid"
+        data = df.reindex(columns=self.columns)
+        keys = df.index.tolist() if keyed else [None] * len(df)
+        for key, values in zip(keys, data.itertuples(index=False, name=None)):
+            self.append(values, None if key is None else int(key))
+
+    def remove(self, key):
+        """刪除一筆 (從最新的資料往回找，撤銷通常只會動到最後幾筆)"""
+        for chunk in reversed(self._chunks):
+            for pos in range(len(chunk.keys) - 1, -1, -1):
+                if chunk.keys[pos] == key:
+                    del chunk.keys[pos]
+                    for col in self.columns: del chunk.cols[col][pos]
+                    chunk.frame = None
+                    self._frame = None
+                    self._len -= 1
+                    return True
+        return False
+
+    # ------------------------------------------
+    # 讀取
+    # ------------------------------------------
+    def iter_reverse(self):
+        """由新到舊逐筆走訪 (key, dict)，找最近幾筆時不用掃過整段歷史"""
+        for chunk in reversed(self._chunks):
+            for pos in range(len(chunk.keys) - 1, -1, -1):
+                yield chunk.keys[pos], {c: chunk.cols[c][pos] for c in self.columns}
+
+    def last(self, line=None):
+        """最新一筆 (可指定產線)，回傳 (key, dict)；沒有資料回傳 (None, None)"""
+        for key, row in self.iter_reverse():
+            if line is None or row["產線"] == line:
+                return key, row
+        return None, None
+
+    def recent(self, n, **match):
+        """最近 n 筆符合條件的資料 (新的在前)，例如 recent(5, 產線="Line 1", 判定結果="PASS")"""
+        rows, keys = [], []
+        for key, row in self.iter_reverse():
+            if all(row[c] == v for c, v in match.items()):
+                rows.append(row); keys.append(key)
+                if len(rows) >= n: break
+        return pd.DataFrame(rows, columns=self.columns, index=pd.Index(keys, name="rowid"))
+
+    def _chunk_frame(self, chunk):
+        if chunk.frame is None:
+            chunk.frame = pd.DataFrame(chunk.cols, columns=self.columns, index=pd.Index(chunk.keys, name="rowid"))
+        return chunk.frame
+
+    def to_frame(self):
+        """整份資料轉成 DataFrame (快取到下一次寫入為止)"""
+        if self._frame is None:
+            frames = [self._chunk_frame(c) for c in self._chunks if c.keys]
+            if frames:
+                self._frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+            else:
+                self._frame = pd.DataFrame(columns=self.columns, index=pd.Index([], name="rowid"))
+        return self._frame
@@ -0,0 +1,151 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from file_lock import FileLock
+
+# ==========================================
+# 生產日誌 CSV 流水帳 (只追加 + 分段輪替 + 背景壓縮)
+# - 由 production_logs 的序號往後追，寫成 {prefix}_{日期}_{流水號}.csv
+# - 換日或單檔超過 JOURNAL_MAX_BYTES 就關檔換下一段，關閉的分段在背景壓成 .csv.gz
+# - manifest.json 記錄每一段的序號/時間範圍 (報表匯出改由 API 直接查資料庫，不讀流水帳)
+# - 新紀錄用讀取連線抓，寫分段檔 / manifest 時只持有流水帳自己的檔案鎖，不佔 SQLite 寫入鎖
+#   (收料與網頁的 PASS 不用等磁碟 I/O)；多個程序同時執行也只會有一個在寫，其餘直接略過
+# ==========================================
+JOURNAL_DIR = "log_journal"
+JOURNAL_MAX_BYTES = 32 * 1024 * 1024
+JOURNAL_BATCH = 5000            # 每次最多搬幾筆
+JOURNAL_FLUSH_S = 1.0           # API 背景搬移間隔
+
+LOG_COLS = ["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"]
+JOURNAL_HEADER = ["序號"] + LOG_COLS
+
+class LogJournal:
+    def __init__(self, db, directory=JOURNAL_DIR, prefix="db_logs", max_bytes=JOURNAL_MAX_BYTES):
+        self.db = db
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(directory, f"{prefix}_manifest.json")
+        self.lock_path = os.path.join(directory, f"{prefix}.lock")
+        self._compressor = None
+
+    # ------------------------------------------
+    # manifest
+    # ------------------------------------------
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"last_seq": 0, "segments": []}
+
+    def _save_manifest(self, manifest):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def segment_path(self, seg):
+        """已壓縮的分段優先 (壓縮完成才會改名成 .gz，所以存在就一定完整)"""
+        base = os.path.join(self.directory, seg["name"])
+        return base + ".csv.gz" if os.path.exists(base + ".csv.gz") else base + ".csv"
+
+    # ------------------------------------------
+    # 寫入
+    # ------------------------------------------
+    def flush(self):
+        """把 production_logs 中還沒寫進流水帳的資料追加到目前分段，回傳搬了幾筆
+        別的程序 (或執行緒) 正在寫時直接回傳 0，由它搬"""
+        os.makedirs(self.directory, exist_ok=True)
+        lock = FileLock(self.lock_path)
+        if not lock.try_acquire(): return 0
+        try:
+            manifest = self.load_manifest()
+            with self.db.read() as conn:
+                rows = conn.execute(f"""
+                    SELECT 序號, {", ".join(LOG_COLS)} FROM production_logs
+                    WHERE 序號 > ? ORDER BY 序號 LIMIT ?
+                """, (manifest["last_seq"], JOURNAL_BATCH)).fetchall()
+            if not rows: return 0
+
+            start = 0
+            while start < len(rows):
+                day = str(rows[start][1])[:10].replace("-", "")
+                seg = self._active_segment(manifest, day)
+                end = start
+                while end < len(rows) and str(rows[end][1])[:10].replace("-", "") == day:
+                    end += 1
+                self._append(seg, rows[start:end])
+                start = end
+
+            manifest["last_seq"] = rows[-1][0]
+            self._save_manifest(manifest)
+            return len(rows)
+        finally:
+            lock.release()
+
+    def _active_segment(self, manifest, day):
+        segs = manifest["segments"]
+        seg = segs[-1] if segs and not segs[-1]["closed"] else None
+        if seg is not None and seg["day"] == day and seg["bytes"] < self.max_bytes:
+            return seg
+        if seg is not None:
+            seg["closed"] = True
+            self._compress_later(seg["name"])
+        n = sum(1 for s in segs if s["day"] == day) + 1
+        seg = {"name": f"{self.prefix}_{day}_{n:03d}", "day": day, "rows": 0, "bytes": 0,
+               "first_seq": None, "last_seq": None, "first_time": None, "last_time": None, "closed": False}
+        segs.append(seg)
+        return seg
+
+    def _append(self, seg, rows):
+        path = os.path.join(self.directory, seg["name"] + ".csv")
+        new_file = not os.path.exists(path)
+        with open(path, mode="a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file: writer.writerow(JOURNAL_HEADER)
+            writer.writerows(rows)
+            seg["bytes"] = f.tell()
+        seg["rows"] += len(rows)
+        if seg["first_seq"] is None:
+            seg["first_seq"], seg["first_time"] = rows[0][0], rows[0][1]
+        seg["last_seq"], seg["last_time"] = rows[-1][0], rows[-1][1]
+
+    # ------------------------------------------
+    # 背景壓縮
+    # ------------------------------------------
+    def _compress_later(self, name):
+        if self._compressor is None:
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-gzip")
+        self._compressor.submit(self._compress, name)
+
+    def _compress(self, name):
+        src = os.path.join(self.directory, name + ".csv")
+        dst = os.path.join(self.directory, name + ".csv.gz")
+        if not os.path.exists(src) or os.path.exists(dst): return
+        # 暫存檔帶上 pid：多個 API worker 啟動時可能同時補壓同一段
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        try:
+            with open(src, "rb") as fin, gzip.open(tmp, "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+            os.replace(tmp, dst)
+            os.remove(src)
+        except FileNotFoundError:
+            # 別的程序已經壓好並刪掉原檔
+            if os.path.exists(tmp): os.remove(tmp)
+        except Exception as e:
+            print(f"⚠️ 流水帳壓縮失敗 ({name}): {e}")
+
+    def compress_closed(self):
+        """啟動時補壓上次來不及壓的分段"""
+        for seg in self.load_manifest()["segments"]:
+            if seg["closed"] and not self.segment_path(seg).endswith(".gz"):
+                self._compress_later(seg["name"])
+
+    def close(self):
+        if self._compressor is not None:
+            self._compressor.shutdown(wait=True)
+            self._compressor = None
@@ -0,0 +1,104 @@
+from db_schema import ROLLUP_GRAINS, ROLLUP_WATERMARK, rollup_bucket_sql
+from report_export import parse_time_bound
+
+# ==========================================
+# 生產日誌時段彙總 (production_rollups，db_schema v7)
+# - 背景依序號水位線把新紀錄累加進 分 / 時 / 日 三種時段，鍵為 產線 + 工單號碼 + 產品ID
+# - 累加與水位線在同一個寫入交易內，多個 worker 同時跑也不會重複計算
+# - 已彙總過的紀錄被撤銷時由觸發器扣回；還沒彙總的紀錄 (水位線之後) 不會出現在查詢結果
+# - 趨勢圖 / 報表只讀這張表：90 天的日彙總是幾千列，而不是幾百萬筆日誌
+# ==========================================
+ROLLUP_BATCH = 20000            # 每次最多彙總幾筆
+ROLLUP_FLUSH_S = 5.0            # API 背景彙總間隔
+ROLLUP_MAX_ROWS = 50000         # 單次查詢最多回傳幾列，超過請改用較粗的粒度或縮小範圍
+
+GRAIN_NAMES = {"minute": "分", "hour": "時", "day": "日"}
+ROLLUP_DIMS = {"line": "產線", "order": "工單號碼", "product": "產品ID"}
+_DIM_KEYS = {"line": "line", "order": "order_id", "product": "product_id"}
+
+def rollup_watermark(conn):
+    row = conn.execute('SELECT "值" FROM id_sequences WHERE "名稱" = ?', (ROLLUP_WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+def rollup_backlog(conn):
+    """production_logs 中還沒彙總的筆數 (以序號估計)"""
+    top = conn.execute("SELECT MAX(序號) FROM production_logs").fetchone()[0] or 0
+    return max(0, top - rollup_watermark(conn))
+
+def rollup_logs(db, batch=ROLLUP_BATCH):
+    """把水位線之後最多 batch 筆日誌累加進三種時段，回傳筆數"""
+    with db.write() as conn:
+        last = rollup_watermark(conn)
+        hi, n = conn.execute("""
+            SELECT MAX(序號), COUNT(*) FROM (SELECT 序號 FROM production_logs WHERE 序號 > ? ORDER BY 序號 LIMIT ?)
+        """, (last, batch)).fetchone()
+        if not n: return 0
+        for grain in ROLLUP_GRAINS:
+            conn.execute(f"""
+                INSERT INTO production_rollups
+                    ("粒度", "時段", "產線", "工單號碼", "產品ID", "筆數", "PASS數", "NG數", "PASS重量", "NG重量", "最小重", "最大重")
+                SELECT '{grain}', COALESCE({rollup_bucket_sql(grain, "時間")}, ''),
+                       COALESCE(產線, ''), COALESCE(工單號碼, ''), COALESCE(產品ID, ''),
+                       COUNT(*), SUM(判定結果 = 'PASS'), SUM(判定結果 = 'NG'),
+                       SUM(CASE WHEN 判定結果 = 'PASS' THEN COALESCE(實測重, 0) ELSE 0 END),
+                       SUM(CASE WHEN 判定結果 = 'NG' THEN COALESCE(實測重, 0) ELSE 0 END),
+                       MIN(實測重), MAX(實測重)
+                FROM production_logs WHERE 序號 > ? AND 序號 <= ?
+                GROUP BY 2, 3, 4, 5
+                ON CONFLICT ("粒度", "時段", "產線", "工單號碼", "產品ID") DO UPDATE SET
+                    "筆數" = "筆數" + excluded."筆數",
+                    "PASS數" = "PASS數" + excluded."PASS數", "NG數" = "NG數" + excluded."NG數",
+                    "PASS重量" = "PASS重量" + excluded."PASS重量", "NG重量" = "NG重量" + excluded."NG重量",
+                    "最小重" = COALESCE(MIN("最小重", excluded."最小重"), "最小重", excluded."最小重"),
+                    "最大重" = COALESCE(MAX("最大重", excluded."最大重"), "最大重", excluded."最大重")
+            """, (last, hi))
+        conn.execute("""
+            INSERT INTO id_sequences ("名稱", "值") VALUES (?, ?)
+            ON CONFLICT("名稱") DO UPDATE SET "值" = excluded."值"
+        """, (ROLLUP_WATERMARK, hi))
+    return n
+
+# ------------------------------------------
+# 查詢
+# ------------------------------------------
+def query_rollups(conn, grain="day", start=None, end=None, line=None, order_id=None, product_id=None, by=()):
+    """依時段 (+ by 指定的 line / order / product) 加總，回傳 list[dict]；參數錯誤時丟出 ValueError"""
+    if grain not in GRAIN_NAMES: raise ValueError(f"grain 只支援 {', '.join(GRAIN_NAMES)}")
+    bad = [d for d in by if d not in ROLLUP_DIMS]
+    if bad: raise ValueError(f"by 只支援 {', '.join(ROLLUP_DIMS)}")
+    by = list(dict.fromkeys(by))
+
+    where, params = ['"粒度" = ?'], [GRAIN_NAMES[grain]]
+    try:
+        lo, hi = parse_time_bound(start, False), parse_time_bound(end, True)
+    except ValueError:
+        raise ValueError("日期格式錯誤，請用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS") from None
+    if lo:
+        # 起點落在時段中間時，該時段整段算進來
+        n, pad = ROLLUP_GRAINS[GRAIN_NAMES[grain]]
+        where.append('"時段" >= ?'); params.append(lo[:n] + pad)
+    if hi:
+        where.append('"時段" < ?' if end and len(end) <= 10 else '"時段" <= ?'); params.append(hi)
+    for col, val in (("產線", line), ("工單號碼", order_id), ("產品ID", product_id)):
+        if val:
+            where.append(f'"{col}" = ?'); params.append(val)
+
+    dims = [f'"{ROLLUP_DIMS[d]}"' for d in by]
+    keys = ", ".join(['"時段"'] + dims)
+    rows = conn.execute(f"""
+        SELECT {keys}, SUM("筆數"), SUM("PASS數"), SUM("NG數"), SUM("PASS重量"), SUM("NG重量"), MIN("最小重"), MAX("最大重")
+        FROM production_rollups WHERE {" AND ".join(where)}
+        GROUP BY {keys} HAVING SUM("筆數") > 0
+        ORDER BY {keys} LIMIT ?
+    """, params + [ROLLUP_MAX_ROWS + 1]).fetchall()
+    if len(rows) > ROLLUP_MAX_ROWS:
+        raise ValueError(f"結果超過 {ROLLUP_MAX_ROWS} 列，請改用較粗的粒度或縮小日期範圍")
+
+    names = ["time"] + [_DIM_KEYS[d] for d in by] + ["count", "pass", "ng", "pass_weight", "ng_weight", "min", "max"]
+    out = []
+    for r in rows:
+        rec = dict(zip(names, r))
+        rec["pass_weight"] = round(rec["pass_weight"], 3)
+        rec["ng_weight"] = round(rec["ng_weight"], 3)
+        out.append(rec)
+    return out
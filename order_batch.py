@@ -0,0 +1,133 @@
+import json
+from datetime import datetime
+from factory_core import PRODUCTION_LINES, ORDER_COLUMNS, order_display_text
+
+# ==========================================
+# 工單批次異動 (ERP 排程匯入、後台加單 / 排序 / 取消 / 刪除共用)
+# - 每個動作整批在同一個寫入交易內完成，任何一筆有問題整批不寫
+# - 工單號碼由 id_sequences 發號 (WO-月日-流水號)，不再用工單總數推算，多程序同時加單也不會撞號
+# - 新工單排在該產線隊尾；排序只改有變動的列
+# - 所有異動都經過 work_orders 的觸發器寫進異動日誌，網頁端與派單快取照常增量同步
+# ==========================================
+BATCH_MAX_ORDERS = 2000
+OPEN_STATES = ("待生產", "生產中")
+_PRODUCT_FIELDS = ["產品ID", "客戶名", "溫度等級", "品種", "密度", "長", "寬", "高", "準重", "備註1"]
+
+class OrderBatchError(ValueError):
+    """整批被拒絕；problems = [(第幾筆 (從 1 起算，0 表示整批), 原因)]"""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(f"#{i} {msg}" for i, msg in problems[:10]))
+        self.problems = problems
+
+def _check_size(items):
+    if len(items) > BATCH_MAX_ORDERS:
+        raise OrderBatchError([(0, f"一次最多 {BATCH_MAX_ORDERS} 筆")])
+
+def allocate_order_ids(conn, n, now=None):
+    """在呼叫端的寫入交易內取 n 個工單號碼"""
+    prefix = f"WO-{(now or datetime.now()).strftime('%m%d')}"
+    row = conn.execute('SELECT "值" FROM id_sequences WHERE "名稱" = ?', (prefix,)).fetchone()
+    if row is not None:
+        start = row[0]
+    else:
+        # 這個前綴第一次發號：接在既有工單 (舊版依工單總數編號) 的最大流水號後面
+        start = conn.execute("""
+            SELECT MAX(CAST(substr(工單號碼, ?) AS INTEGER)) FROM work_orders WHERE 工單號碼 LIKE ?
+        """, (len(prefix) + 2, prefix + "-%")).fetchone()[0] or 0
+    conn.execute("""
+        INSERT INTO id_sequences ("名稱", "值") VALUES (?, ?)
+        ON CONFLICT("名稱") DO UPDATE SET "值" = excluded."值"
+    """, (prefix, start + n))
+    return [f"{prefix}-{start + i:04d}" for i in range(1, n + 1)]
+
+# ------------------------------------------
+# 加單
+# ------------------------------------------
+def add_orders(db, orders, now=None):
+    """orders = [(產線, 產品ID, 預計數量)]；全部排到各產線隊尾，回傳新工單號碼 (順序同輸入)"""
+    if not orders: return []
+    _check_size(orders)
+    now = now or datetime.now()
+    with db.write() as conn:
+        ids = json.dumps(sorted({str(pid) for _, pid, _ in orders}))
+        products = {r[0]: dict(zip(_PRODUCT_FIELDS, r)) for r in conn.execute(f"""
+            SELECT {", ".join(_PRODUCT_FIELDS)} FROM products
+            WHERE 產品ID IN (SELECT value FROM json_each(?))
+        """, (ids,))}
+
+        problems = []
+        for i, (line, pid, qty) in enumerate(orders, 1):
+            if line not in PRODUCTION_LINES: problems.append((i, f"未知的產線: {line}"))
+            elif pid not in products: problems.append((i, f"產品不存在: {pid}"))
+            elif not isinstance(qty, int) or qty <= 0: problems.append((i, f"數量需為正整數: {qty}"))
+        if problems: raise OrderBatchError(problems)
+
+        new_ids = allocate_order_ids(conn, len(orders), now)
+        tails = dict(conn.execute("SELECT 產線, MAX(排程順序) FROM work_orders GROUP BY 產線").fetchall())
+        created = now.strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for wo_id, (line, pid, qty) in zip(new_ids, orders):
+            tails[line] = (tails.get(line) or 0) + 1
+            p = products[pid]
+            rows.append((line, tails[line], wo_id, pid, order_display_text(p), p["品種"], p["密度"], p["準重"],
+                         qty, 0, "待生產", created))
+        conn.executemany(f"""
+            INSERT INTO work_orders ({", ".join(ORDER_COLUMNS)}) VALUES ({", ".join("?" * len(ORDER_COLUMNS))})
+        """, rows)
+    return new_ids
+
+# ------------------------------------------
+# 排序 / 取消 / 刪除
+# ------------------------------------------
+def reorder_orders(db, line_name, order_ids):
+    """order_ids 依序排到該產線最前面，其餘工單維持原本先後接在後面；回傳實際改動的筆數"""
+    _check_size(order_ids)
+    with db.write() as conn:
+        seq_of = dict(conn.execute("SELECT 工單號碼, 排程順序 FROM work_orders WHERE 產線 = ?", (line_name,)).fetchall())
+        problems, seen = [], set()
+        for i, wo_id in enumerate(order_ids, 1):
+            if wo_id not in seq_of: problems.append((i, f"工單不在 {line_name}: {wo_id}"))
+            elif wo_id in seen: problems.append((i, f"工單重複: {wo_id}"))
+            seen.add(wo_id)
+        if problems: raise OrderBatchError(problems)
+        return _renumber(conn, line_name, order_ids)
+
+def _renumber(conn, line_name, first=()):
+    """該產線的排程順序重新編成 1..n (first 排最前面，其餘維持原本先後)，只更新有變動的列"""
+    current = conn.execute("""
+        SELECT 工單號碼, 排程順序 FROM work_orders WHERE 產線 = ? ORDER BY 排程順序, rowid
+    """, (line_name,)).fetchall()
+    seq_of, head = dict(current), set(first)
+    new_order = list(first) + [wo_id for wo_id, _ in current if wo_id not in head]
+    updates = [(n, wo_id) for n, wo_id in enumerate(new_order, 1) if seq_of[wo_id] != n]
+    conn.executemany("UPDATE work_orders SET 排程順序 = ? WHERE 工單號碼 = ?", updates)
+    return len(updates)
+
+def cancel_orders(db, order_ids):
+    """把工單改為 已取消 (已取消的再取消不算錯)；已完成或不存在的工單整批拒絕，回傳實際改動的筆數"""
+    _check_size(order_ids)
+    with db.write() as conn:
+        state_of = dict(conn.execute("""
+            SELECT 工單號碼, 狀態 FROM work_orders WHERE 工單號碼 IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(order_ids)),)).fetchall())
+        problems = []
+        for i, wo_id in enumerate(order_ids, 1):
+            if wo_id not in state_of: problems.append((i, f"工單不存在: {wo_id}"))
+            elif state_of[wo_id] == "已完成": problems.append((i, f"工單已完成，不能取消: {wo_id}"))
+        if problems: raise OrderBatchError(problems)
+
+        todo = [(wo_id,) for wo_id in dict.fromkeys(order_ids) if state_of[wo_id] in OPEN_STATES]
+        conn.executemany("UPDATE work_orders SET 狀態 = '已取消' WHERE 工單號碼 = ?", todo)
+    return len(todo)
+
+def delete_orders(db, order_ids):
+    """直接刪除工單 (後台「移除選中」)，刪除後該產線重新由 1 編排序；回傳刪除筆數"""
+    _check_size(order_ids)
+    with db.write() as conn:
+        marks = json.dumps(list(order_ids))
+        lines = [r[0] for r in conn.execute("SELECT DISTINCT 產線 FROM work_orders WHERE 工單號碼 IN (SELECT value FROM json_each(?))", (marks,))]
+        n = conn.execute("DELETE FROM work_orders WHERE 工單號碼 IN (SELECT value FROM json_each(?))", (marks,)).rowcount
+        for line in lines:
+            _renumber(conn, line)
+    return n
@@ -0,0 +1,135 @@
+# ==========================================
+# 網頁樣式 (CSS + 按鈕放大 / 空白鍵紀錄良品的 JS)
+# 放在獨立模組：只在程序啟動時建立一次字串，每次 rerun 只需把它送出
+# ==========================================
+PAGE_STYLE = """
+<style>
+    .main .block-container { padding-top: 0.5rem; padding-bottom: 1rem; }
+    .digital-font { font-family: 'Roboto Mono', 'Consolas', monospace; font-weight: 700; }
+    h1, h2, h3 { margin-top: 0.5rem !important; margin-bottom: 0.5rem !important; }
+
+    /* ============================================================ */
+    /* 按鈕樣式核心邏輯                                             */
+    /* ============================================================ */
+    
+    /* 1. 全域設定：任何 Disabled 的按鈕，優先權最高，強制變灰 */
+    div.stButton > button:disabled {
+        background-color: #bdc3c7 !important;
+        border: 2px solid #95a5a6 !important;
+        color: #7f8c8d !important;
+        opacity: 1 !important;
+        cursor: not-allowed !important;
+        box-shadow: none !important;
+    }
+
+    /* 2. 一般 Primary 按鈕 (例如存檔、確認)，預設紅色 */
+    div.stButton > button[kind="primary"] {
+        background-color: #e74c3c;
+        border: 2px solid #c0392b;
+        color: white;
+        box-shadow: 0 3px 6px rgba(0,0,0,0.2);
+    }
+    /* 3. 只有在沒被 Disabled 時，才有 Hover 效果 */
+    div.stButton > button[kind="primary"]:hover:not(:disabled) {
+        background-color: #ec7063;
+        transform: translateY(-2px);
+    }
+    div.stButton > button[kind="primary"]:active:not(:disabled) {
+        background-color: #c0392b;
+        transform: translateY(1px);
+    }
+
+    /* 資訊卡 */
+    .unified-spec-card {
+        background-color: #2c3e50; border-radius: 12px; border-left: 8px solid #95a5a6;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.2); color: white; overflow: hidden;
+        margin-bottom: 10px; border: 1px solid #455a64; height: 460px !important; 
+        display: flex; flex-direction: column; justify-content: space-between;
+    }
+    .usc-header { background: rgba(0,0,0,0.3); padding: 8px 10px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
+    .usc-header .u-label { color: #cfd8dc; font-size: 0.8rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; }
+    .usc-header .u-value { font-size: 2.4rem; font-weight: 900; color: #ffffff; margin-top: 0px; line-height: 1.1; text-shadow: 0 2px 4px rgba(0,0,0,0.5); }
+
+    .usc-grid { display: flex; border-bottom: 1px solid #455a64; background-color: #34495e; flex: 0 0 auto; }
+    .usc-item { flex: 1; text-align: center; padding: 5px; border-right: 1px solid #455a64; min-width: 0; display: flex; flex-direction: column; justify-content: center; }
+    .usc-item:last-child { border-right: none; }
+    .usc-item .u-label { color: #b0bec5; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; margin-bottom: 2px; display: block; }
+    .usc-item .u-value { font-size: 1.6rem; font-weight: bold; line-height: 1; white-space: nowrap; color: white; }
+
+    .usc-size-row { background: #233140; padding: 8px 10px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
+    .usc-size-row .u-label { color: #b0bec5; font-size: 0.8rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 2px; }
+    .usc-size-row .u-value { font-size: 1.8rem; font-weight: 900; color: #ffffff !important; font-family: 'Roboto Mono', monospace; letter-spacing: 0.5px; white-space: nowrap; }
+
+    .usc-range-row { background-color: #2c3e50; padding: 6px 15px; text-align: center; border-bottom: 1px solid #455a64; flex: 0 0 auto; }
+    .usc-range-row .u-label { color: #95a5a6; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; }
+    .usc-range-row .u-value { font-size: 1.3rem; font-weight: bold; color: #f1c40f; font-family: 'Roboto Mono', monospace; letter-spacing: 1px; }
+
+    .usc-notes { background: rgba(255, 255, 255, 0.05); padding: 8px 15px; flex-grow: 1; display: flex; flex-direction: column; justify-content: flex-start; text-align: left; overflow-y: auto; }
+    .usc-notes .u-label { color: #e74c3c; font-size: 0.75rem; font-weight: bold; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 3px; border-bottom: 1px solid #e74c3c; display: inline-block; }
+    .usc-notes .u-content { color: #ecf0f1; font-size: 1.0rem; line-height: 1.3; font-weight: bold; }
+
+    .status-container { padding: 5px; border-radius: 12px; text-align: center; display: flex; flex-direction: column; justify-content: center; align-items: center; transition: background-color 0.2s; height: 250px !important; }
+    .status-pass { background-color: #2980b9; color: white; border: 4px solid #3498db; box-shadow: 0 0 10px rgba(41, 128, 185, 0.3); }
+    .status-fail { background-color: #c0392b; color: white; border: 4px solid #e74c3c; box-shadow: 0 0 10px rgba(192, 57, 43, 0.3); }
+    .status-ng-ready { background-color: #d35400; color: white; border: 4px solid #e67e22; } 
+    
+    .weight-display { font-size: 7rem; font-weight: 900; line-height: 1; text-shadow: 2px 2px 5px rgba(0,0,0,0.3); margin-top: 0px; margin-bottom: 0px; }
+    .queue-header { font-size: 1.0rem; font-weight: bold; margin-bottom: 5px; color: #2c3e50; padding-bottom: 5px; }
+    .history-header { font-size: 0.9rem; font-weight: bold; color: #7f8c8d; margin-bottom: 5px; border-bottom: 2px solid #ddd; }
+    .countdown-box { background: rgba(0,0,0,0.2); padding: 2px 15px; border-radius: 8px; margin-bottom: 5px; backdrop-filter: blur(5px); }
+    .countdown-label { font-size: 0.8rem; color: #ecf0f1; text-transform: uppercase; letter-spacing: 1px; opacity: 0.9; }
+    .countdown-val { font-size: 1.8rem; font-weight: 900; color: #f1c40f; text-shadow: 1px 1px 2px rgba(0,0,0,0.5); line-height: 1; }
+    .over-prod { color: #ff6b6b !important; }
+
+    button[data-baseweb="tab"] { font-size: 1.2rem !important; font-weight: bold !important; padding: 10px 20px !important; }
+</style>
+
+<script>
+const observer = new MutationObserver((mutations) => {
+    const buttons = window.parent.document.querySelectorAll('button');
+    buttons.forEach(btn => {
+        const text = btn.innerText;
+        // 現場作業按鈕 - 巨大化與強制變色邏輯
+        if (text.includes("紀錄良品") || text.includes("紀錄 NG")) {
+            btn.style.height = "130px"; btn.style.fontSize = "32px"; btn.style.fontWeight = "900"; btn.style.marginTop = "15px"; btn.style.borderRadius = "15px"; 
+            
+            // 使用 setProperty(..., 'important') 確保 JS 權重最高，壓過所有 CSS
+            if (btn.disabled) {
+                // 強制灰色 (雙重保險)
+                btn.style.setProperty('background-color', '#bdc3c7', 'important');
+                btn.style.setProperty('border-color', '#95a5a6', 'important');
+                btn.style.setProperty('color', '#7f8c8d', 'important');
+                btn.style.setProperty('cursor', 'not-allowed', 'important');
+                btn.style.boxShadow = "none";
+            } else {
+                // 啟用狀態 - 強制上色
+                if (text.includes("紀錄良品")) {
+                    btn.style.setProperty('background-color', '#27ae60', 'important'); // 綠色
+                    btn.style.setProperty('border-color', '#145a32', 'important');
+                    btn.style.setProperty('color', 'white', 'important');
+                    btn.style.boxShadow = "0 6px 12px rgba(0,0,0,0.2)";
+                } else if (text.includes("紀錄 NG")) {
+                    btn.style.setProperty('background-color', '#c0392b', 'important'); // 紅色
+                    btn.style.setProperty('border-color', '#641e16', 'important');
+                    btn.style.setProperty('color', 'white', 'important');
+                    btn.style.boxShadow = "0 6px 12px rgba(0,0,0,0.2)";
+                }
+            }
+        }
+        // 後台儀表板按鈕 - 加大
+        if ((text.includes("Line") && text.includes("待生產")) || text.includes("返回列表")) {
+            btn.style.minHeight = "80px"; btn.style.fontSize = "20px"; btn.style.fontWeight = "bold"; btn.style.boxShadow = "0 4px 6px rgba(0,0,0,0.2)"; 
+        }
+    });
+});
+observer.observe(window.parent.document.body, { childList: true, subtree: true });
+document.addEventListener('keydown', function(e) {
+    if (e.code === 'Space') {
+        var buttons = window.parent.document.querySelectorAll('button');
+        for (var i = 0; i < buttons.length; i++) {
+            if (buttons[i].innerText.includes("紀錄良品") && !buttons[i].disabled) { buttons[i].click(); break; }
+        }
+    }
+});
+</script>
+"""
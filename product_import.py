@@ -0,0 +1,177 @@
+import io
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from db_schema import upsert_rows
+from factory_core import DENSITY_MAP, SPECIAL_VARIETIES, ALL_VARIETIES, TEMP_OPTIONS, NOTE_COLS, PRODUCT_COLUMNS, prepare_products, sql_rows
+
+# ==========================================
+# 產品批次匯入 (CSV / Excel) 與重量計算
+# - 準重 / 下限 / 上限 整批一次算完：體積 × DENSITY_MAP 上下限；特殊品種用固定包裝重 (上限 +0.2)
+# - 流程：讀檔 -> 算重量 -> 檢查 -> 檔內去重 -> 略過目錄已有的同規格 -> 產生產品ID -> 單一交易寫入
+# - Excel 需要 openpyxl (選用套件)；沒裝時只收 CSV
+# ==========================================
+REQUIRED_COLS = ["客戶名", "品種", "長", "寬", "高"]
+SPEC_COLS = ["客戶名", "溫度等級", "品種", "密度", "長", "寬", "高"] + NOTE_COLS   # 判斷「同規格」用
+FIXED_WEIGHT_COL = "固定包裝重"       # 特殊品種的包裝重；沒有這欄時改讀 準重
+SPECIAL_UPPER_KG = 0.2
+
+_DENSITY_LOW = {d: lo for d, (lo, _) in DENSITY_MAP.items()}
+_DENSITY_HIGH = {d: hi for d, (_, hi) in DENSITY_MAP.items()}
+
+def excel_available():
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _num(df, col):
+    return pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(np.nan, index=df.index)
+
+def _density(df):
+    """密度欄統一成數字 (float)；不是整數的 ("64.5"、空白、文字) 一律視為沒填 (NaN)，不會被四捨五入成清單內的密度"""
+    dens = _num(df, "密度")
+    return dens.where(dens == dens.round())
+
+# ------------------------------------------
+# 重量計算 (建檔表格與批次匯入共用)
+# ------------------------------------------
+def calc_weights(df, density=None, fixed_weight=None, special=None):
+    """一次算出整批的 準重 / 下限 / 上限，回傳新的 DataFrame；算不出來的列保留原值
+    密度、固定包裝重、是否特殊品種可整批指定 (建檔表格只選一種品種)，沒指定就逐列讀欄位"""
+    out = df.copy()
+    dens = pd.Series(float(density), index=out.index) if density is not None else _num(out, "密度")
+    if special is not None:
+        is_special = pd.Series(bool(special), index=out.index)
+    else:
+        is_special = out["品種"].isin(SPECIAL_VARIETIES) if "品種" in out.columns else pd.Series(False, index=out.index)
+    if fixed_weight is not None:
+        fixed = pd.Series(float(fixed_weight), index=out.index)
+    else:
+        fixed = _num(out, FIXED_WEIGHT_COL).fillna(_num(out, "準重"))
+
+    length, width, height = _num(out, "長"), _num(out, "寬"), _num(out, "高")
+    vol = (length / 1000) * (width / 1000) * (height / 1000)
+    calc = pd.DataFrame({"準重": (vol * dens).round(3),
+                         "下限": (vol * dens.map(_DENSITY_LOW)).round(1),
+                         "上限": (vol * dens.map(_DENSITY_HIGH)).round(1)})
+    by_volume = ~is_special & (length > 0) & (width > 0) & (height > 0) & calc["下限"].notna()
+    by_fixed = is_special & (fixed > 0)
+    calc.loc[by_fixed, "準重"] = fixed[by_fixed]
+    calc.loc[by_fixed, "下限"] = fixed[by_fixed]
+    calc.loc[by_fixed, "上限"] = fixed[by_fixed] + SPECIAL_UPPER_KG
+
+    done = by_volume | by_fixed
+    for col in ("準重", "下限", "上限"):
+        cur = _num(out, col).fillna(0.0)
+        out[col] = cur.where(~done, calc[col])
+    return out
+
+# ------------------------------------------
+# 讀檔
+# ------------------------------------------
+def read_product_file(data, name):
+    """上傳的檔案內容 (bytes) -> 全部欄位為字串/原值的 DataFrame
+    CSV 先試 UTF-8，再試 Big5 (Excel 直接另存的中文 CSV)"""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        if not excel_available(): raise ValueError("伺服器未安裝 openpyxl，請改用 CSV 匯入")
+        df = pd.read_excel(io.BytesIO(data), dtype=object)
+    else:
+        for enc in ("utf-8-sig", "cp950"):
+            try:
+                df = pd.read_csv(io.BytesIO(data), dtype=object, encoding=enc)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError("無法辨識 CSV 編碼，請另存為 UTF-8")
+    df.columns = [str(c).strip() for c in df.columns]
+    missing = [c for c in REQUIRED_COLS if c not in df.columns]
+    if missing: raise ValueError(f"缺少欄位: {', '.join(missing)}")
+    return df.dropna(how="all")
+
+# ------------------------------------------
+# 檢查 / 去重 / 產品ID
+# ------------------------------------------
+def _text(series):
+    return series.fillna("").astype(str).str.strip().replace(["nan", "None"], "")
+
+def _spec_keys(df):
+    """同規格判斷用的 MultiIndex (數字統一成 float、空備註統一成 NULL)"""
+    key = pd.DataFrame({
+        "客戶名": _text(df["客戶名"]),
+        "溫度等級": _text(df["溫度等級"]),
+        "品種": _text(df["品種"]),
+        "密度": _num(df, "密度").fillna(-1.0),
+        "長": _num(df, "長").fillna(0.0), "寬": _num(df, "寬").fillna(0.0), "高": _num(df, "高").fillna(0.0),
+    })
+    for col in NOTE_COLS:
+        key[col] = _text(df[col]).replace("", "NULL") if col in df.columns else "NULL"
+    return pd.MultiIndex.from_frame(key[SPEC_COLS])
+
+def new_product_ids(df, existing_ids, now=None):
+    """{客戶名}-{品種}-{流水號}-{年月日時分秒}；與目錄或同批撞號的流水號往後跳，直到沒有重複"""
+    stamp = (now or datetime.now()).strftime("%y%m%d%H%M%S")
+    head = df["客戶名"].astype(str) + "-" + df["品種"].astype(str) + "-"
+    seq = pd.Series(np.arange(len(df)), index=df.index)
+    taken = pd.Index(existing_ids)
+    ids = head + seq.astype(str) + "-" + stamp
+    clash = ids.isin(taken)
+    while clash.any():
+        seq = seq.where(~clash, seq + len(df))
+        ids = head + seq.astype(str) + "-" + stamp
+        clash = ids.isin(taken)
+    return ids
+
+def prepare_import(raw, catalog, now=None):
+    """(可匯入的產品 DataFrame (欄位同 PRODUCT_COLUMNS), 被略過的列 + 原因)
+    列號是檔案中的列號 (標題列為第 1 列)"""
+    df = raw.reset_index(drop=True)
+    df.index = df.index + 2
+    df["客戶名"] = _text(df["客戶名"])
+    df["品種"] = _text(df["品種"])
+    df["溫度等級"] = _text(df["溫度等級"]).str.replace(r"\.0$", "", regex=True).replace("", TEMP_OPTIONS[0]) if "溫度等級" in df.columns else TEMP_OPTIONS[0]
+    for col in NOTE_COLS:
+        df[col] = _text(df[col]).replace("", "NULL") if col in df.columns else "NULL"
+    # 密度只在這裡轉一次：算重量、檢查、同規格比對、寫入都用同一欄
+    df["密度"] = _density(df)
+    df = calc_weights(df)
+
+    is_special = df["品種"].isin(SPECIAL_VARIETIES)
+    dens = df["密度"]
+    dims_ok = (_num(df, "長") > 0) & (_num(df, "寬") > 0) & (_num(df, "高") > 0)
+    keys = _spec_keys(df)
+    checks = [
+        (df["客戶名"] == "", "缺客戶名"),
+        (~df["品種"].isin(ALL_VARIETIES), "品種不在清單內"),
+        (~is_special & ~dens.isin(list(DENSITY_MAP)), "密度不在清單內"),
+        (~is_special & ~dims_ok, "長寬高需大於 0"),
+        (df["準重"] <= 0, f"無法計算重量 (特殊品種請填 {FIXED_WEIGHT_COL})"),
+        (df["下限"] > df["上限"], "下限大於上限"),
+        (pd.Series(keys.duplicated(), index=df.index), "檔案內重複"),
+        (pd.Series(keys.isin(_spec_keys(catalog)) if len(catalog) else False, index=df.index), "目錄已有相同規格"),
+    ]
+    reason = pd.Series("", index=df.index)
+    for mask, msg in reversed(checks):
+        reason[mask.fillna(True).astype(bool)] = msg   # 同一列有多個問題時只列第一個
+
+    ok = df[reason == ""].copy()
+    for col in ("長", "寬", "高"):
+        ok[col] = _num(ok, col).fillna(0)
+    ok["密度"] = dens[ok.index].astype("Int64").astype(object).where(~is_special[ok.index], "N/A")
+    ok["產品ID"] = new_product_ids(ok, catalog["產品ID"] if len(catalog) else [], now)
+    skipped = raw.reset_index(drop=True).set_axis(df.index)[reason != ""].assign(原因=reason[reason != ""])
+    return prepare_products(ok[PRODUCT_COLUMNS].reset_index(drop=True)), skipped.rename_axis("列號").reset_index()
+
+# ------------------------------------------
+# 寫入
+# ------------------------------------------
+def insert_products(db, products):
+    """新產品整批寫進 SQLite (單一交易，中途失敗全部不寫)，回傳筆數"""
+    rows = sql_rows(products, PRODUCT_COLUMNS)
+    with db.write() as conn:
+        upsert_rows(conn, "products", "產品ID", PRODUCT_COLUMNS, rows)
+    return len(rows)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from db_schema import SHIFT_STARTS
+
+# ==========================================
+# 生產統計彙總 (讀取端)
+# - production_stats / production_stats_ng 由 production_logs 的觸發器維護 (db_schema v5)：
+#   新增或撤銷紀錄時在同一個交易內加減，API 收料、網頁秤重、撤銷都不會漏
+# - 範圍：工單 (鍵=工單號碼)、產線 (鍵=產線)、班別 (鍵=產線|班別開始時間)
+# - 畫面只做主鍵查詢，不再掃整段日誌；StatsCache 再把結果留在記憶體，版本沒變就不查
+# ==========================================
+
+def shift_start(ts=None):
+    """'2026-01-21 03:15:00' -> 所屬班別的開始時間 (與 db_schema.shift_start_sql 相同規則)"""
+    ts = ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    day, clock = ts[:10], ts[11:19]
+    starts = sorted(SHIFT_STARTS)
+    for s in reversed(starts):
+        if clock >= s: return f"{day} {s}"
+    prev = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    return f"{prev} {starts[-1]}"
+
+def shift_key(line_name, ts=None):
+    return f"{line_name}|{shift_start(ts)}"
+
+def stats_payload(row, ng_reasons):
+    n_pass, n_ng, w_pass, w_ng, first, last = row or (0, 0, 0.0, 0.0, None, None)
+    total = n_pass + n_ng
+    return {
+        "pass": n_pass, "ng": n_ng,
+        "pass_weight": round(w_pass, 3), "ng_weight": round(w_ng, 3),
+        "pass_mean": round(w_pass / n_pass, 3) if n_pass else None,
+        "mean": round((w_pass + w_ng) / total, 3) if total else None,
+        "first": first, "last": last,
+        "ng_reasons": ng_reasons,
+    }
+
+def read_stats(conn, scope, key):
+    row = conn.execute("""
+        SELECT PASS數, NG數, PASS重量, NG重量, 首筆時間, 末筆時間 FROM production_stats WHERE 範圍 = ? AND 鍵 = ?
+    """, (scope, key)).fetchone()
+    reasons = dict(conn.execute("""
+        SELECT NG原因, 數量 FROM production_stats_ng WHERE 範圍 = ? AND 鍵 = ? AND 數量 > 0 ORDER BY 數量 DESC
+    """, (scope, key)).fetchall())
+    return stats_payload(row, reasons)
+
+def line_summary(conn, line_name, order_id=None, ts=None):
+    """產線累計 + 本班 (+ 指定工單)，給儀表板 / API 一次取用"""
+    out = {"line": read_stats(conn, "產線", line_name),
+           "shift_start": shift_start(ts),
+           "shift": read_stats(conn, "班別", shift_key(line_name, ts))}
+    if order_id: out["order"] = read_stats(conn, "工單", order_id)
+    return out
+
+class StatsCache:
+    """網頁端的統計快取：version (例如日誌同步水位線 + 筆數) 變了才整批清空，同一版本內每組 (範圍, 鍵) 只查一次"""
+
+    def __init__(self):
+        self.version = None
+        self._entries = {}
+
+    def get(self, db, scope, key, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+        hit = self._entries.get((scope, key))
+        if hit is None:
+            with db.read() as conn:
+                hit = self._entries[(scope, key)] = read_stats(conn, scope, key)
+        return hit
@@ -0,0 +1,106 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+# ==========================================
+# 生產紀錄報表匯出：直接從 SQLite 分塊讀取、邊讀邊送
+# 不經過 pandas，也不會把整段歷史放進記憶體；讀取塊由 log_archive.iter_log_chunks 提供 (跨冷熱分區)
+# ==========================================
+EXPORT_CHUNK_ROWS = 5000
+
+LOG_COLS = ["時間", "產線", "工單號碼", "產品ID", "實測重", "判定結果", "NG原因"]
+
+def parse_time_bound(val, is_end):
+    """'2026-01-21' 或 '2026-01-21 08:00:00' -> 與 時間 欄位同格式的字串；只給日期的結束日包含當天"""
+    if not val: return None
+    ts = datetime.fromisoformat(val)
+    if is_end and len(val) <= 10:
+        ts += timedelta(days=1)
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+def build_log_query(start=None, end=None, line=None, order_id=None, after=None, limit=None):
+    """回傳 (SQL, 參數)；日期格式錯誤時丟出 ValueError
+    欄位為 序號 + LOG_COLS，依 (時間, 序號) 排序；after=(時間, 序號) 從該列之後接著讀 (分頁用)"""
+    where, params = [], []
+    lo, hi = parse_time_bound(start, False), parse_time_bound(end, True)
+    if lo:
+        where.append("時間 >= ?"); params.append(lo)
+    if hi:
+        # 只給日期時是「隔天 00:00 之前」，給到時間則包含該秒
+        where.append("時間 < ?" if end and len(end) <= 10 else "時間 <= ?"); params.append(hi)
+    if line:
+        where.append("產線 = ?"); params.append(line)
+    if order_id:
+        where.append("工單號碼 = ?"); params.append(order_id)
+    if after is not None:
+        # 時間為 NULL 的排最前面；寫成 時間 >= ? 才走得到 idx_logs_time
+        t, seq = after
+        if t is None:
+            where.append("(時間 IS NOT NULL OR 序號 > ?)"); params.append(seq)
+        else:
+            where.append("時間 >= ? AND (時間 > ? OR 序號 > ?)"); params += [t, t, seq]
+    sql = f"SELECT 序號, {', '.join(LOG_COLS)} FROM production_logs"
+    if where: sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY 時間, 序號"
+    if limit is not None:
+        sql += " LIMIT ?"; params.append(limit)
+    return sql, params
+
+def iter_logs_csv(chunks, encoding="utf-8-sig"):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(LOG_COLS)
+    yield buf.getvalue().encode(encoding)
+    for rows in chunks:
+        buf.seek(0); buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+class _DrainSink:
+    """給 ParquetWriter 用的檔案物件：寫進來的 bytes 先暫存，由產生器取走後送出"""
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self): return self.pos
+    def flush(self): pass
+    def close(self): self.closed = True
+
+    def drain(self):
+        out = b"".join(self.parts)
+        self.parts.clear()
+        return out
+
+def iter_logs_parquet(chunks):
+    """每個讀取塊寫成一個 row group 就送出；需要 pyarrow (選用套件)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.float64() if c == "實測重" else pa.string()) for c in LOG_COLS])
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        cols = list(zip(*rows))
+        arrays = []
+        for name, values in zip(LOG_COLS, cols):
+            if name == "實測重":
+                arrays.append(pa.array([None if v is None else float(v) for v in values], pa.float64()))
+            else:
+                arrays.append(pa.array([None if v is None else str(v) for v in values], pa.string()))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
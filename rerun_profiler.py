@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# ==========================================
+# 重繪效能分析 (選用，預設關閉)
+# - FACTORY_PROFILE=1 開啟；FACTORY_PROFILE=檔名.jsonl 另外把每次重繪寫成一行 JSON
+# - 區段有兩種記法：
+#     lap(名稱)      -> 從上一個 lap (或開始) 到現在的時間，適合照順序往下跑的腳本，不用改縮排
+#     section(名稱)  -> with 區塊內的時間，用在函式內部或想單獨看的細節 (可與 lap 重疊)
+# - SQL 查詢用 query(名稱)，可另外記錄讀到幾列
+# - 每個名稱只保留最近 PROFILE_WINDOW 次重繪的樣本，統計 p50/p90/p99
+# ==========================================
+PROFILE_ENV = "FACTORY_PROFILE"
+PROFILE_WINDOW = 300
+
+def _pct(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+class _NullSpan:
+    """關閉時所有區段共用的空物件 (rows 可以照設，不會被讀取)"""
+    rows = None
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("run", "key", "rows", "t0")
+
+    def __init__(self, run, key):
+        self.run, self.key, self.rows = run, key, None
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.run._add(self.key, (time.perf_counter() - self.t0) * 1e3, self.rows)
+        return False
+
+class ProfileRun:
+    """一次腳本執行的計時；同名區段在同一次重繪內累加 (例如每條產線都呼叫一次的函式)"""
+
+    def __init__(self, profiler, page):
+        self.profiler = profiler
+        self.page = page
+        self.started = time.time()
+        self.t0 = self._last = self._touched = time.perf_counter()
+        self.sections = {}
+        self.queries = {}
+        self.finished = False
+
+    def _add(self, key, ms, rows=None):
+        kind, name = key
+        target = self.queries if kind == "sql" else self.sections
+        if kind == "sql":
+            prev_ms, prev_rows = target.get(name, (0.0, None))
+            target[name] = [prev_ms + ms, prev_rows if rows is None else (prev_rows or 0) + rows]
+        else:
+            target[name] = target.get(name, 0.0) + ms
+        self._touched = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        prev = self.sections.get(name, 0.0)
+        self.sections[name] = prev + (now - self._last) * 1e3
+        self._last = self._touched = now
+
+    def section(self, name):
+        return _Span(self, ("sec", name))
+
+    def query(self, name):
+        return _Span(self, ("sql", name))
+
+    def finish(self, complete=True):
+        """complete=False：腳本被 st.rerun()/st.stop() 中斷，總時間只算到最後一個記錄點"""
+        if self.finished: return
+        self.finished = True
+        end = time.perf_counter() if complete else self._touched
+        self.profiler._record(self, (end - self.t0) * 1e3, complete)
+
+class _NullRun:
+    page = ""
+    finished = True
+    def lap(self, name): pass
+    def section(self, name): return _NULL_SPAN
+    def query(self, name): return _NULL_SPAN
+    def finish(self, complete=True): pass
+
+NULL_RUN = _NullRun()
+
+class RerunProfiler:
+    """整個程序共用一個 (所有網頁 Session 的重繪都記在一起)"""
+
+    def __init__(self, enabled=False, jsonl_path=None, window=PROFILE_WINDOW):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}       # 名稱 -> deque[(毫秒, 列數)]
+        self.runs = 0
+
+    @classmethod
+    def from_env(cls):
+        val = os.environ.get(PROFILE_ENV, "").strip()
+        if not val or val == "0": return cls(False)
+        return cls(True, None if val == "1" else val)
+
+    def begin(self, page=""):
+        return ProfileRun(self, page) if self.enabled else NULL_RUN
+
+    def _record(self, run, total_ms, complete):
+        with self._lock:
+            self.runs += 1
+            self._push("total", total_ms)
+            for name, ms in run.sections.items():
+                self._push(name, ms)
+            for name, (ms, rows) in run.queries.items():
+                self._push(f"sql:{name}", ms, rows)
+            if self.jsonl_path:
+                rec = {"ts": round(run.started, 3), "page": run.page, "complete": complete,
+                       "total_ms": round(total_ms, 2),
+                       "sections": {k: round(v, 2) for k, v in run.sections.items()},
+                       "queries": {k: [round(v[0], 2), v[1]] for k, v in run.queries.items()}}
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print(f"⚠️ 效能紀錄寫入失敗: {e}")
+
+    def _push(self, name, ms, rows=None):
+        q = self._samples.get(name)
+        if q is None:
+            q = self._samples[name] = deque(maxlen=self.window)
+        q.append((ms, rows))
+
+    def stats(self):
+        """[{區段, 次數, p50, p90, p99, 最大, 最近, 平均列數}]，依 p90 由大到小"""
+        with self._lock:
+            snap = {name: list(q) for name, q in self._samples.items()}
+        out = []
+        for name, samples in snap.items():
+            vals = sorted(ms for ms, _ in samples)
+            rows = [r for _, r in samples if r is not None]
+            out.append({"區段": name, "次數": len(vals),
+                        "p50": round(_pct(vals, 0.5), 2), "p90": round(_pct(vals, 0.9), 2),
+                        "p99": round(_pct(vals, 0.99), 2), "最大": round(vals[-1], 2),
+                        "最近": round(samples[-1][0], 2),
+                        "平均列數": round(sum(rows) / len(rows), 1) if rows else None})
+        return sorted(out, key=lambda r: -r["p90"])
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.runs = 0
@@ -0,0 +1,274 @@
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+# ==========================================
+# 實體磅秤讀取 (事件驅動，不 sleep)
+# - 讀取執行緒卡在 serial.read() 上，有位元組進來立刻醒來，每一幀都會解析，不會只留最後一筆
+# - 解析器可抽換：依儀表格式註冊在 PARSERS，回傳 (重量 kg, 是否穩定 或 None)
+# - 滑動視窗：最近 STABLE_WINDOW_S 秒的讀數變動不超過 STABLE_TOLERANCE_KG 就視為穩定
+#   (儀表本身有送 ST/US 旗標時以儀表為準，視窗只用來確認)
+# ==========================================
+DEFAULT_PORT = "COM3"             # 例如 'COM3' 或 '/dev/ttyUSB0'
+DEFAULT_BAUD = 9600
+STABLE_WINDOW_S = 0.5             # 穩定判斷的時間窗
+STABLE_TOLERANCE_KG = 0.005       # 時間窗內最大最小值的允許差
+STABLE_MIN_SAMPLES = 3
+RECONNECT_S = 5.0
+STALE_S = 3.0                     # 超過幾秒沒有新讀數視為過期
+MAX_FRAME_BYTES = 256             # 超過這個長度還沒換行就丟掉 (鮑率設錯時避免無限累積)
+_FRAME_END = re.compile(rb"[\r\n]+")
+
+# ------------------------------------------
+# 幀解析器
+# ------------------------------------------
+PARSERS = {}
+
+def register_parser(name):
+    def deco(fn):
+        PARSERS[name] = fn
+        return fn
+    return deco
+
+_UNIT_TO_KG = {"kg": 1.0, "g": 0.001, "t": 1000.0, "lb": 0.45359237}
+
+def _to_kg(num, unit):
+    return float(num.replace(" ", "")) * _UNIT_TO_KG.get((unit or "kg").lower(), 1.0)
+
+# A&D / 多數台製儀表："ST,GS,+  12.5kg"、"US,NT,-0000.50 kg"、"OL,GS,..."
+_ST_GS = re.compile(r"^\s*(ST|US|OL)\s*,\s*(GS|NT|TR)?\s*,?\s*([-+]?\s*\d+(?:\.\d+)?)\s*([a-zA-Z]*)")
+
+@register_parser("st_gs")
+def parse_st_gs(frame):
+    m = _ST_GS.match(frame)
+    if not m or m.group(1) == "OL": return None
+    return _to_kg(m.group(3), m.group(4)), m.group(1) == "ST"
+
+# Mettler Toledo MT-SICS："S S      12.345 kg" (穩定)、"S D      12.340 kg" (不穩定)
+_SICS = re.compile(r"^\s*SI?\s+([SD])\s+([-+]?\s*\d+(?:\.\d+)?)\s*([a-zA-Z]*)")
+
+@register_parser("sics")
+def parse_sics(frame):
+    m = _SICS.match(frame)
+    if not m: return None
+    return _to_kg(m.group(2), m.group(3)), m.group(1) == "S"
+
+# 只有數字的儀表：取第一個數字，穩定與否交給滑動視窗判斷
+_NUMBER = re.compile(r"([-+]?\d*\.\d+|[-+]?\d+)\s*([a-zA-Z]*)")
+
+@register_parser("number")
+def parse_number(frame):
+    m = _NUMBER.search(frame)
+    if not m: return None
+    return _to_kg(m.group(1), m.group(2)), None
+
+@register_parser("auto")
+def parse_auto(frame):
+    # 認得格式就交給該解析器 (例如 OL 超載幀要丟掉，不能再退回去抓數字)
+    if _ST_GS.match(frame): return parse_st_gs(frame)
+    if _SICS.match(frame): return parse_sics(frame)
+    return parse_number(frame)
+
+# ------------------------------------------
+# 穩定判斷
+# ------------------------------------------
+class StableWindow:
+    def __init__(self, window_s=STABLE_WINDOW_S, tolerance=STABLE_TOLERANCE_KG, min_samples=STABLE_MIN_SAMPLES):
+        self.window_s = window_s
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.samples = deque()
+
+    def add(self, ts, weight, flag=None):
+        """加入一筆讀數，回傳目前是否穩定"""
+        self.samples.append((ts, weight))
+        while self.samples and ts - self.samples[0][0] > self.window_s:
+            self.samples.popleft()
+        if flag is False: return False
+        if len(self.samples) < self.min_samples: return bool(flag)
+        weights = [w for _, w in self.samples]
+        return max(weights) - min(weights) <= self.tolerance
+
+    def clear(self):
+        self.samples.clear()
+
+# ------------------------------------------
+# 讀取器
+# ------------------------------------------
+# 讀取執行緒每處理一幀 (或去皮) 就換一份新的唯讀快照，畫面端直接拿，不用上鎖
+# weight / stable_weight 已扣掉皮重；status: ok / stale / error / offline (沒有設定序列埠)
+ScaleSnapshot = namedtuple("ScaleSnapshot", "weight stable stable_weight stable_seq last_update error status")
+
+class ScaleReader:
+    """欄位與舊版 ScaleData 相同 (weight / offset / last_update / error)，外加穩定狀態
+    stable_seq 每次由不穩定轉為穩定就 +1，畫面端比對它即可判斷「又秤好一件」"""
+
+    def __init__(self, port=DEFAULT_PORT, baud=DEFAULT_BAUD, parser="auto", window=None):
+        self.port = port
+        self.baud = baud
+        self.parse = PARSERS[parser] if isinstance(parser, str) else parser
+        self.window = window or StableWindow()
+        self.weight = 0.0
+        self.offset = 0.0
+        self.last_update = 0
+        self.error = None
+        self.stable = False
+        self.stable_weight = None
+        self.stable_seq = 0
+        self.frames = 0
+        self.bad_frames = 0
+        self._lock = threading.Lock()
+        self._snap = None
+        self._publish()
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+        self.started_at = 0         # start() 的時間，還沒開始讀取為 0
+
+    def on_reading(self, callback):
+        """callback(weight, stable) 在讀取執行緒上呼叫，請保持輕量"""
+        self._listeners.append(callback)
+
+    def feed(self, frame, ts=None):
+        """處理一幀文字 (讀取執行緒或測試直接呼叫)"""
+        parsed = self.parse(frame)
+        if parsed is None:
+            self.bad_frames += 1
+            return None
+        weight, flag = parsed
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            stable = self.window.add(ts, weight, flag)
+            if stable and not self.stable:
+                self.stable_seq += 1
+            self.stable = stable
+            if stable: self.stable_weight = weight
+            self.weight = weight
+            self.last_update = ts
+            self.error = None
+            self.frames += 1
+            self._publish()
+        for cb in self._listeners:
+            cb(weight, stable)
+        return weight, stable
+
+    def _publish(self):
+        # 呼叫端持有 self._lock；status 先記成 ok/error/offline，過期與否在讀取時才判斷
+        status = "offline" if not self.port else ("error" if self.error else "ok")
+        self._snap = ScaleSnapshot(
+            self.weight - self.offset, self.stable,
+            None if self.stable_weight is None else self.stable_weight - self.offset,
+            self.stable_seq, self.last_update, self.error, status)
+
+    def snapshot(self, now=None):
+        """目前讀數 (不上鎖：快照本身不會再被修改，換新只是一次屬性指派)"""
+        snap = self._snap
+        if snap.status == "ok" and (snap.last_update == 0 or (now or time.time()) - snap.last_update > STALE_S):
+            snap = snap._replace(status="stale")
+        return snap
+
+    def tare(self):
+        with self._lock:
+            self.offset = self.weight
+            self._publish()
+
+    # ------------------------------------------
+    # 序列埠迴圈
+    # ------------------------------------------
+    def start(self):
+        if not self.port: return
+        if self._thread is not None and self._thread.is_alive(): return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"scale-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        import serial
+        while not self._stop.is_set():
+            try:
+                # timeout 只用來定期檢查 stop；有資料時 read() 立即返回
+                with serial.Serial(self.port, self.baud, timeout=0.5) as ser:
+                    self._pump(ser)
+            except Exception as e:
+                with self._lock:
+                    self.error = f"磅秤連線中斷: {e}"
+                    self.stable = False
+                    self._publish()
+                self.window.clear()
+                self._stop.wait(RECONNECT_S)
+
+    def _pump(self, ser):
+        buf = b""
+        while not self._stop.is_set():
+            chunk = ser.read(ser.in_waiting or 1)
+            if not chunk: continue
+            buf += chunk
+            *frames, buf = _FRAME_END.split(buf)
+            for raw in frames:
+                if raw: self.feed(raw.decode("ascii", "ignore"))
+            if len(buf) > MAX_FRAME_BYTES:
+                self.bad_frames += 1
+                buf = b""
+
+# ------------------------------------------
+# 多台磅秤：依產線對應
+# ------------------------------------------
+def parse_scale_config(text, baud=DEFAULT_BAUD, parser="auto"):
+    """'Line 1=COM3, Line 2=/dev/ttyUSB0@19200:sics' -> {產線: (序列埠, 鮑率, 解析器)}"""
+    config = {}
+    for item in filter(None, (x.strip() for x in (text or "").split(","))):
+        line, _, spec = item.partition("=")
+        spec, _, fmt = spec.strip().partition(":")
+        port, _, rate = spec.partition("@")
+        config[line.strip()] = (port.strip(), int(rate) if rate else baud, fmt.strip() or parser)
+    return config
+
+class ScaleRegistry:
+    """每條產線一台磅秤 (各自去皮)；同一個序列埠只開一個讀取器，共用它的產線也共用皮重
+    沒有設定序列埠的產線拿到 offline 的空讀取器，畫面端不用另外判斷"""
+
+    def __init__(self, lines, config=None):
+        self._by_port = {}
+        self._by_line = {}
+        config = config or {}
+        for line in list(lines) + [l for l in config if l not in lines]:
+            port, baud, parser = config.get(line, ("", DEFAULT_BAUD, "auto"))
+            if port and port in self._by_port:
+                reader = self._by_port[port]
+            else:
+                reader = ScaleReader(port, baud, parser=parser)
+                if port: self._by_port[port] = reader
+            self._by_line[line] = reader
+
+    def start(self):
+        for reader in self._by_port.values(): reader.start()
+
+    def stop(self):
+        for reader in self._by_port.values(): reader.stop()
+
+    def reader(self, line):
+        return self._by_line[line]
+
+    def snapshot(self, line, now=None):
+        return self._by_line[line].snapshot(now)
+
+    def snapshot_all(self):
+        now = time.time()
+        return {line: reader.snapshot(now) for line, reader in self._by_line.items()}
+
+    def tare(self, line):
+        self._by_line[line].tare()
+
+    def last_readings(self):
+        """{序列埠: 最後一次讀數的時間}；還沒讀到過的用開始讀取的時間，給 /metrics 算距今秒數"""
+        return {port: reader.last_update or reader.started_at
+                for port, reader in self._by_port.items() if reader.started_at}
+
+    def health(self):
+        """{產線: status}，給 /metrics 或管理頁用"""
+        return {line: snap.status for line, snap in self.snapshot_all().items()}
@@ -0,0 +1,297 @@
+import json
+import math
+import threading
+from datetime import datetime
+from collections import OrderedDict, deque
+
+# ==========================================
+# 即時 SPC (統計製程管制)：每筆秤重進來就更新，不回頭掃歷史
+# - 平均 / 變異數用 Welford 逐筆累加；移動全距 (MR) 估計組內 σ = MR̄ / 1.128 (個別值管制圖)
+# - Cp / Cpk 用組內 σ、Pp / Ppk 用整體 σ，規格界限取產品的 下限 / 上限
+# - Western Electric 四條規則：每筆以「加入前」的中心線與 σ 算 z 值，只看最近 8 筆
+# - 範圍：工單 (實測重本身) 與產線 (實測重 - 準重 的偏差，換產品也能連續看)
+# - 只有判定結果在 SPC_RESULTS 裡的紀錄列入 (預設只看 PASS：NG / 報廢品不拉動平均、σ、Cp/Cpk，也不觸發規則)
+# - 資料來源是 production_logs 的序號水位線 (API 收料、網頁秤重都會寫進去)
+# - 撤銷 (刪除) 的紀錄不會從統計中扣除
+# - 只有背景維護的 leader 在算；每批算完把有變動的範圍 (含逐筆累加的狀態) 與水位線在同一個交易寫進 spc_snapshots，
+#   各 worker 的 API 都從那裡讀；換 leader / 重啟時從快照接著算，沒有快照 (第一次) 才補讀最近 SPC_WARMUP_ROWS 筆
+# ==========================================
+SPC_WINDOW = 200            # 每個範圍保留給管制圖的最近點數
+SPC_MIN_POINTS = 10         # 累積到這麼多點才開始判定規則
+SPC_MAX_ORDERS = 500        # 記憶體內最多保留幾張工單的統計 (最久沒有資料的先丟)
+SPC_WARMUP_ROWS = 5000
+SPC_RESULTS = ("PASS",)     # 列入統計的判定結果；要看含超規品的完整製程分布時加上 "NG"
+SPC_BATCH = 5000
+SPC_POLL_S = 0.5            # 背景追新資料的間隔 (/upload 寫入後會立即喚醒)
+D2 = 1.128                  # n=2 移動全距的 d2 常數
+
+RULES = {
+    "WE1": "1 點超出 3σ",
+    "WE2": "連續 3 點中有 2 點在同側 2σ 外",
+    "WE3": "連續 5 點中有 4 點在同側 1σ 外",
+    "WE4": "連續 8 點在中心線同一側",
+}
+
+SPC_ROWS_SQL = """
+    SELECT l.序號, l.時間, l.產線, l.工單號碼, l.判定結果, l.實測重, p.下限, p.準重, p.上限
+    FROM production_logs l
+    LEFT JOIN products p ON p.產品ID = l.產品ID
+    WHERE l.序號 > ? ORDER BY l.序號 LIMIT ?
+"""
+
+def _num(val):
+    try: return float(val) if val is not None else None
+    except (TypeError, ValueError): return None
+
+def _round(val, digits=4):
+    return round(val, digits) if val is not None and math.isfinite(val) else None
+
+def _same_side(zs, count, limit):
+    return sum(z > limit for z in zs) >= count or sum(z < -limit for z in zs) >= count
+
+WATERMARK = ("水位線", "")  # spc_snapshots 中記錄已算到哪個序號的那一列
+
+class SpcState:
+    """單一範圍 (一張工單或一條產線) 的逐筆統計"""
+    __slots__ = ("n", "mean", "m2", "mr_sum", "mr_n", "last", "lo", "hi", "lsl", "target", "usl",
+                 "zs", "points", "hits", "last_time")
+    SAVED = ("n", "mean", "m2", "mr_sum", "mr_n", "last", "lo", "hi", "lsl", "target", "usl", "hits", "last_time")
+
+    def __init__(self, window=SPC_WINDOW):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.mr_sum, self.mr_n, self.last = 0.0, 0, None
+        self.lo = self.hi = None
+        self.lsl = self.target = self.usl = None
+        self.zs = deque(maxlen=8)
+        self.points = deque(maxlen=window)
+        self.hits = dict.fromkeys(RULES, 0)
+        self.last_time = None
+
+    def dump(self):
+        """接手用的完整狀態 (不含管制圖點，點在快照的 chart 裡)"""
+        return {**{k: getattr(self, k) for k in self.SAVED}, "zs": list(self.zs)}
+
+    @classmethod
+    def load(cls, saved, chart, window=SPC_WINDOW):
+        state = cls(window)
+        for k in cls.SAVED: setattr(state, k, saved[k])
+        state.zs.extend(saved["zs"])
+        state.points.extend((p["seq"], p["time"], p["value"], p["mr"], p["rules"]) for p in chart["points"])
+        return state
+
+    def sigma_within(self):
+        return self.mr_sum / self.mr_n / D2 if self.mr_n else None
+
+    def sigma_overall(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    def _rules(self):
+        zs = list(self.zs)
+        hit = []
+        if abs(zs[-1]) > 3: hit.append("WE1")
+        if len(zs) >= 3 and _same_side(zs[-3:], 2, 2): hit.append("WE2")
+        if len(zs) >= 5 and _same_side(zs[-5:], 4, 1): hit.append("WE3")
+        if len(zs) == 8 and _same_side(zs, 8, 0): hit.append("WE4")
+        return hit
+
+    def add(self, x, seq, ts):
+        # 規則用加入前的中心線 / σ 判定，這一點不會拉動自己的管制界限
+        flags = []
+        sigma = self.sigma_within()
+        if self.n >= SPC_MIN_POINTS and sigma:
+            self.zs.append((x - self.mean) / sigma)
+            flags = self._rules()
+            for r in flags: self.hits[r] += 1
+
+        mr = abs(x - self.last) if self.last is not None else None
+        if mr is not None:
+            self.mr_sum += mr
+            self.mr_n += 1
+        self.last = x
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.lo = x if self.lo is None else min(self.lo, x)
+        self.hi = x if self.hi is None else max(self.hi, x)
+        self.last_time = ts
+        self.points.append((seq, ts, x, mr, flags))
+        return flags
+
+    def summary(self):
+        sw, so = self.sigma_within(), self.sigma_overall()
+        spec = self.lsl is not None and self.usl is not None and self.usl > self.lsl
+
+        def capability(sigma):
+            if not spec or not sigma: return None, None
+            return ((self.usl - self.lsl) / (6 * sigma),
+                    min(self.usl - self.mean, self.mean - self.lsl) / (3 * sigma))
+
+        cp, cpk = capability(sw)
+        pp, ppk = capability(so)
+        recent = [{"seq": p[0], "time": p[1], "rules": p[4]} for p in self.points if p[4]][-5:]
+        return {
+            "n": self.n, "mean": _round(self.mean) if self.n else None,
+            "sigma_within": _round(sw), "sigma_overall": _round(so),
+            "mr_bar": _round(self.mr_sum / self.mr_n) if self.mr_n else None,
+            "min": self.lo, "max": self.hi,
+            "ucl": _round(self.mean + 3 * sw) if sw else None, "lcl": _round(self.mean - 3 * sw) if sw else None,
+            "lsl": _round(self.lsl), "target": _round(self.target), "usl": _round(self.usl),
+            "cp": _round(cp, 3), "cpk": _round(cpk, 3), "pp": _round(pp, 3), "ppk": _round(ppk, 3),
+            "rule_hits": dict(self.hits), "recent_violations": recent, "last_time": self.last_time,
+        }
+
+    def chart(self, limit=None):
+        """管制圖用：每點 (序號, 時間, 值, 移動全距, 違反規則) + 目前的中心線 / 管制界限 / 規格界限"""
+        pts = list(self.points)[-limit:] if limit else list(self.points)
+        sw = self.sigma_within()
+        return {
+            "center": _round(self.mean) if self.n else None,
+            "ucl": _round(self.mean + 3 * sw) if sw else None, "lcl": _round(self.mean - 3 * sw) if sw else None,
+            "mr_bar": _round(self.mr_sum / self.mr_n) if self.mr_n else None,
+            "lsl": _round(self.lsl), "target": _round(self.target), "usl": _round(self.usl),
+            "points": [{"seq": s, "time": t, "value": _round(x), "mr": _round(mr), "rules": f} for s, t, x, mr, f in pts],
+        }
+
+class SpcEngine:
+    """所有產線 / 工單的 SPC；poll() 由背景維護迴圈呼叫，結果寫進 spc_snapshots"""
+
+    def __init__(self, lines, window=SPC_WINDOW, max_orders=SPC_MAX_ORDERS):
+        self.window = window
+        self.max_orders = max_orders
+        self.lines = {line: SpcState(window) for line in lines}
+        self.orders = OrderedDict()     # 工單號碼 -> (產線, SpcState)，最近有資料的排最後
+        self.current = {}               # 產線 -> 最近一筆資料的工單號碼
+        self.last_seq = None
+        self._evicted = set()           # 被擠出記憶體、快照要刪掉的工單
+        self._lock = threading.Lock()
+
+    def poll(self, db):
+        """讀 production_logs 中水位線之後的新紀錄，回傳筆數"""
+        if self.last_seq is None:
+            self.resume(db)
+        with db.read() as conn:
+            rows = conn.execute(SPC_ROWS_SQL, (self.last_seq, SPC_BATCH)).fetchall()
+        if rows: self.publish(db, self.feed(rows))
+        return len(rows)
+
+    def resume(self, db):
+        """剛接手 (程序重啟或換 leader)：從 spc_snapshots 的狀態與水位線接著算
+        沒有水位線 (第一次啟動、或快照是舊版寫的) 時清掉快照，改從最近 SPC_WARMUP_ROWS 筆重建"""
+        with db.write() as conn:
+            snaps = conn.execute('SELECT "範圍", "鍵", "內容" FROM spc_snapshots').fetchall()
+            mark = next((json.loads(c) for s, k, c in snaps if (s, k) == WATERMARK), None)
+            if mark is None:
+                conn.execute("DELETE FROM spc_snapshots")
+                top = conn.execute("SELECT MAX(序號) FROM production_logs").fetchone()[0] or 0
+                self.last_seq = max(0, top - SPC_WARMUP_ROWS)
+                return
+        orders = []
+        with self._lock:
+            for scope, key, content in snaps:
+                snap = json.loads(content)
+                if "state" not in snap: continue
+                state = SpcState.load(snap["state"], snap["chart"], self.window)
+                if scope == "產線" and key in self.lines:
+                    self.lines[key] = state
+                    if snap["order_id"] is not None: self.current[key] = snap["order_id"]
+                elif scope == "工單":
+                    orders.append((state.points[-1][0] if state.points else 0, key, snap["line"], state))
+            # 最近有資料的排最後，之後照樣從最久沒資料的開始擠出記憶體
+            for _, order_id, line, state in sorted(orders)[-self.max_orders:]:
+                self.orders[order_id] = (line, state)
+            self.last_seq = mark["last_seq"]
+
+    def feed(self, rows):
+        """rows = [(序號, 時間, 產線, 工單號碼, 判定結果, 實測重, 下限, 準重, 上限)]；回傳有變動的 {(產線, 工單號碼)}"""
+        touched = set()
+        with self._lock:
+            for seq, ts, line, order_id, result, weight, lsl, target, usl in rows:
+                self.last_seq = seq
+                x = _num(weight)
+                # NG / 報廢品 (及沒放東西就按 NG 的紀錄) 不列入
+                if result not in SPC_RESULTS or x is None or x <= 0 or line not in self.lines: continue
+                lsl, target, usl = _num(lsl), _num(target), _num(usl)
+
+                hit = self.orders.pop(order_id, None)
+                state = hit[1] if hit else SpcState(self.window)
+                self.orders[order_id] = (line, state)
+                self._evicted.discard(order_id)
+                if len(self.orders) > self.max_orders:
+                    self._evicted.add(self.orders.popitem(last=False)[0])
+                state.lsl, state.target, state.usl = lsl, target, usl
+                state.add(x, seq, ts)
+                self.current[line] = order_id
+
+                # 產線看偏差 (實測重 - 準重)，規格界限也換成偏差，換產品時才接得起來
+                line_state = self.lines[line]
+                if target is not None:
+                    line_state.target = 0.0
+                    line_state.lsl = lsl - target if lsl is not None else None
+                    line_state.usl = usl - target if usl is not None else None
+                    line_state.add(x - target, seq, ts)
+                touched.add((line, order_id))
+        return touched
+
+    def publish(self, db, touched):
+        """把有變動的產線 / 工單與水位線寫進 spc_snapshots；被擠出記憶體的工單一併刪除"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            rows = []
+            for line in {line for line, _ in touched}:
+                st = self.lines[line]
+                rows.append(("產線", line, json.dumps({"order_id": self.current.get(line), "summary": st.summary(),
+                                                      "chart": st.chart(), "state": st.dump()}, ensure_ascii=False), now))
+            for line, order_id in touched:
+                hit = self.orders.get(order_id)
+                if order_id is None or hit is None: continue
+                rows.append(("工單", order_id, json.dumps({"line": hit[0], "summary": hit[1].summary(),
+                                                          "chart": hit[1].chart(), "state": hit[1].dump()}, ensure_ascii=False), now))
+            rows.append((*WATERMARK, json.dumps({"last_seq": self.last_seq}), now))
+            gone = [("工單", order_id) for order_id in self._evicted if order_id is not None]
+            self._evicted.clear()
+        with db.write() as conn:
+            conn.executemany("""
+                INSERT INTO spc_snapshots ("範圍", "鍵", "內容", "更新時間") VALUES (?, ?, ?, ?)
+                ON CONFLICT ("範圍", "鍵") DO UPDATE SET "內容" = excluded."內容", "更新時間" = excluded."更新時間"
+            """, rows)
+            conn.executemany('DELETE FROM spc_snapshots WHERE "範圍" = ? AND "鍵" = ?', gone)
+
+# ------------------------------------------
+# 查詢 (任何 worker；只讀 spc_snapshots)
+# ------------------------------------------
+def _snapshot(conn, scope, key):
+    row = conn.execute('SELECT "內容" FROM spc_snapshots WHERE "範圍" = ? AND "鍵" = ?', (scope, key)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _order_snapshot(conn, line, order_id):
+    line_snap = _snapshot(conn, "產線", line) or {}
+    order_id = order_id or line_snap.get("order_id")
+    snap = _snapshot(conn, "工單", order_id) if order_id else None
+    return line_snap, order_id, (snap if snap and snap["line"] == line else None)
+
+def _tail(chart, limit):
+    return {**chart, "points": chart["points"][-limit:]} if limit else chart
+
+def read_spc_summary(conn, line, order_id=None):
+    """產線偏差 + 工單 (預設為該產線最近有資料的工單) 的統計摘要"""
+    line_snap, order_id, snap = _order_snapshot(conn, line, order_id)
+    return {"line": line, "line_deviation": line_snap.get("summary") or SpcState(0).summary(),
+            "order_id": order_id, "order": snap["summary"] if snap else None, "rules": RULES}
+
+def read_spc_chart(conn, line, order_id=None, scope="order", limit=None):
+    if scope == "line":
+        line_snap = _snapshot(conn, "產線", line) or {}
+        return {"line": line, "scope": "line", **_tail(line_snap.get("chart") or SpcState(0).chart(), limit)}
+    _, order_id, snap = _order_snapshot(conn, line, order_id)
+    return {"line": line, "scope": "order", "order_id": order_id,
+            **_tail(snap["chart"] if snap else SpcState(0).chart(), limit)}
+
+def read_rule_hits(conn):
+    """[(產線, 規則, 次數)]，給監控指標用"""
+    out = []
+    for line, hits in conn.execute("""
+        SELECT "鍵", json_extract("內容", '$.summary.rule_hits') FROM spc_snapshots WHERE "範圍" = '產線' ORDER BY "鍵"
+    """):
+        out.extend((line, rule, n) for rule, n in json.loads(hits or "{}").items())
+    return out
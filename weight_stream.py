@@ -0,0 +1,82 @@
+import asyncio
+import time
+from functools import partial
+
+# ==========================================
+# 即時重量推播 (WebSocket /ws/weight/{產線})
+# - 磅秤讀取執行緒每解析一幀就通知事件迴圈，以磅秤本身的速率推送，不再等畫面重繪
+# - 每個連線只有「一格信箱」：還沒送出的讀數直接被新的蓋掉，慢的用戶端只會少看幾筆，不會越積越多
+# - 同一條產線在事件迴圈處理前連續進來的幀也只排一次 (讀取執行緒不會塞爆事件迴圈)
+# - 沒有新讀數時每 WS_HEARTBEAT_S 秒補送一次目前狀態，畫面才看得到「已過期 / 斷線」
+# ==========================================
+WS_HEARTBEAT_S = 1.0
+
+def scale_payload(snap, now=None):
+    """ScaleSnapshot -> JSON (與 GET /scale/{產線} 相同格式)"""
+    now = time.time() if now is None else now
+    return {**snap._asdict(), "age": now - snap.last_update if snap.last_update else None}
+
+class _Subscriber:
+    __slots__ = ("event", "latest")
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.latest = None
+
+class WeightBroadcaster:
+    def __init__(self, registry, lines):
+        self.registry = registry
+        self.lines = list(lines)
+        self._subs = {line: set() for line in self.lines}
+        self._scheduled = set()
+        self._loop = None
+        self.coalesced = 0          # 被新讀數蓋掉、沒送出的筆數 (給 /metrics)
+
+    def start(self):
+        """在事件迴圈內呼叫；之後讀取執行緒的每一幀都會轉到這個迴圈上發布"""
+        self._loop = asyncio.get_running_loop()
+        for line in self.lines:
+            self.registry.reader(line).on_reading(partial(self._on_reading, line))
+
+    def clients(self):
+        return {line: len(subs) for line, subs in self._subs.items()}
+
+    # ------------------------------------------
+    # 讀取執行緒 -> 事件迴圈
+    # ------------------------------------------
+    def _on_reading(self, line, weight, stable):
+        if line in self._scheduled or not self._subs[line] or self._loop is None: return
+        self._scheduled.add(line)
+        self._loop.call_soon_threadsafe(self._publish, line)
+
+    def _publish(self, line):
+        self._scheduled.discard(line)
+        subs = self._subs[line]
+        if not subs: return
+        payload = scale_payload(self.registry.snapshot(line))
+        for sub in subs:
+            if sub.latest is not None: self.coalesced += 1
+            sub.latest = payload
+            sub.event.set()
+
+    # ------------------------------------------
+    # 單一連線
+    # ------------------------------------------
+    async def stream(self, send_json, line):
+        """把該產線的讀數送給一個用戶端，直到 send_json 因斷線丟出例外"""
+        sub = _Subscriber()
+        sub.latest = scale_payload(self.registry.snapshot(line))   # 連線後先送一次目前讀數
+        sub.event.set()
+        self._subs[line].add(sub)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(sub.event.wait(), WS_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    sub.latest = scale_payload(self.registry.snapshot(line))
+                sub.event.clear()
+                payload, sub.latest = sub.latest, None
+                if payload is not None:
+                    await send_json(payload)
+        finally:
+            self._subs[line].discard(sub)